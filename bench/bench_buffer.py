@@ -0,0 +1,105 @@
+"""
+Measure how fast compiled kernels stream through a memory-mapped file of
+doubles, with and without bounds checks, in GB/s of data read and written.
+
+Needs a C compiler (``$CC``, default ``cc``) to link against stdlib/.
+Run from the repository root::
+
+    python bench/bench_buffer.py [megabytes]
+"""
+import array
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from toycomp import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = [os.path.join(ROOT, 'stdlib', name) for name in ('lib.c', 'libmain.c', 'buffer.c')]
+CC = os.environ.get('CC', 'cc')
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+extern buffer_length(b: buffer);
+extern map_input(arg) -> buffer;
+extern map_output(arg length) -> buffer;
+'''
+
+KERNELS = {
+    # Reads the input once; the result goes to a one-element output file.
+    'sum': '''
+def sum(data: buffer)
+    let n = buffer_length(data) in
+    let total = 0 in
+        (for i = 0, i < n in total = total + data[i]) : total;
+
+def mainf()
+    let out = map_output(2, 1) in
+        (out[0] = sum(map_input(1))) : 0;
+''',
+    # Reads the input and writes a file of the same size.
+    'axpy': '''
+def axpy(a x: buffer y: buffer)
+    let n = buffer_length(x) in
+        for i = 0, i < n in y[i] = a * x[i] + 1;
+
+def mainf()
+    let x = map_input(1) in
+        axpy(2, x, map_output(2, buffer_length(x))) : 0;
+''',
+}
+
+
+def build(tmp, name, source, *flags):
+    path = os.path.join(tmp, name + '.kal')
+    with open(path, 'w') as f:
+        f.write(PRELUDE + source)
+
+    obj = os.path.join(tmp, name + '.o')
+    exe = os.path.join(tmp, name)
+    driver.main([path, '-O3', '--mcpu', 'native', '--mattr', 'native',
+                 '--emit', 'obj', '-o', obj] + list(flags))
+    subprocess.check_call([CC, '-O2', obj] + STDLIB + ['-o', exe])
+    return exe
+
+
+def best_time(args, runs=3):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call(args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    count = megabytes * 2 ** 20 // 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, 'data.f64')
+        out = os.path.join(tmp, 'out.f64')
+        with open(data, 'wb') as f:
+            chunk = array.array('d', range(2 ** 16))
+            for _ in range(count // len(chunk)):
+                chunk.tofile(f)
+        size = os.path.getsize(data)
+
+        print('{:6} {:16} {:>10} {:>8}'.format('kernel', 'build', 'best (ms)', 'GB/s'))
+        for name, source in KERNELS.items():
+            traffic = size * (2 if name == 'axpy' else 1)
+            for label, flags in [('checked', []), ('--no-bounds-check', ['--no-bounds-check'])]:
+                exe = build(tmp, name, source, *flags)
+                t = best_time([exe, data, out])
+                print('{:6} {:16} {:10.1f} {:8.2f}'.format(name, label, t * 1000, traffic / t / 1e9))
+
+        expected = 2 ** 15 * (2 ** 16 - 1) * (size // 8 // 2 ** 16)
+        subprocess.check_call([build(tmp, 'check', KERNELS['sum']), data, out])
+        with open(out, 'rb') as f:
+            assert array.array('d', f.read()) == array.array('d', [expected])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure the embedding API: the cost of `toycomp.compile` on a cache miss
+and on a hit, and the overhead of calling a compiled function from Python
+through its ctypes wrapper, compared with calling a Python function.
+
+The per-call overhead is what matters when choosing what to compile: a
+call through ctypes costs several hundred nanoseconds more than a Python
+call, so a compiled function pays off when its body does more work than
+that, e.g. `fib(20)` below. For element-wise work over arrays, use
+`toycomp.vectorize` instead (see ``bench_ufunc.py``).
+
+Run from the repository root::
+
+    PYTHONPATH=. python bench/bench_embed.py
+"""
+import time
+
+import toycomp
+from toycomp import embed
+
+SOURCE = '''
+def add(a b) a + b;
+def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+'''
+
+
+def py_add(a, b):
+    return a + b
+
+
+def py_fib(n):
+    return n if n < 2 else py_fib(n - 1) + py_fib(n - 2)
+
+
+def per_call(f, *args, calls=100000):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(calls):
+            f(*args)
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def main():
+    embed.clear_cache()
+    start = time.perf_counter()
+    program = toycomp.compile(SOURCE)
+    miss = time.perf_counter() - start
+
+    runs = 10000
+    start = time.perf_counter()
+    for _ in range(runs):
+        toycomp.compile(SOURCE)
+    hit = (time.perf_counter() - start) / runs
+
+    print('compile, cache miss: {:10.3f} ms'.format(miss * 1e3))
+    print('compile, cache hit:  {:10.3f} us'.format(hit * 1e6))
+    print()
+    print('{:<10} {:>14} {:>14}'.format('call', 'native', 'Python'))
+    print('{:<10} {:>11.0f} ns {:>11.0f} ns'.format('add(1, 2)', per_call(program.add, 1.0, 2.0) * 1e9,
+                                                    per_call(py_add, 1.0, 2.0) * 1e9))
+    print('{:<10} {:>11.1f} us {:>11.1f} us'.format('fib(20)', per_call(program.fib, 20.0, calls=100) * 1e6,
+                                                    per_call(py_fib, 20.0, calls=10) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
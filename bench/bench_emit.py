@@ -0,0 +1,87 @@
+"""
+Measure peak memory and time for writing a large module as printed IR text
+(the old ``print(module)`` path), as streamed IR text and as bitcode.
+
+Each mode runs in a fresh interpreter so that the resident set size of one
+doesn't hide another. Run from the repository root::
+
+    python bench/bench_emit.py [functions]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from toycomp import emit
+from toycomp.driver import Driver
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+'''
+
+TEMPLATE = '''
+def f{n}(a b c)
+    let x = a * b + c in
+        (for i = 0, i < c, 1 in
+            x = x * a + i - b):
+        if x < a then f{prev}(x, b, c) else x;
+'''
+
+MODES = ('print', 'll', 'bc')
+
+
+def make_source(count):
+    return PRELUDE + ''.join(TEMPLATE.format(n=n, prev=max(n - 1, 0)) for n in range(count))
+
+
+def write(mode, module, path):
+    if mode == 'print':
+        with open(path, 'w') as stream:
+            print(module, file=stream)
+    else:
+        emit.emit(module, path, fmt=mode)
+
+
+def run_mode(mode, count, path):
+    module = Driver(None).compile(make_source(count))
+
+    start = time.perf_counter()
+    write(mode, module, path)
+    elapsed = time.perf_counter() - start
+
+    # Measure the Python heap separately; tracing slows the emitter down a lot.
+    tracemalloc.start()
+    write(mode, module, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(elapsed, peak, rss, os.path.getsize(path))
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        run_mode(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print('{} functions'.format(count))
+    print('{:6} {:>10} {:>18} {:>14} {:>12}'.format('mode', 'time (ms)', 'python peak (MiB)',
+                                                     'max RSS (MiB)', 'size (KiB)'))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in MODES:
+            path = os.path.join(tmp, 'out.' + mode)
+            out = subprocess.check_output([sys.executable, __file__, '--child', mode, str(count), path],
+                                          env=dict(os.environ, PYTHONPATH=os.getcwd()))
+            elapsed, peak, rss, size = map(float, out.split())
+            print('{:6} {:10.1f} {:18.1f} {:14.1f} {:12.1f}'.format(mode, elapsed * 1000, peak / 2 ** 20,
+                                                                    rss / 2 ** 10, size / 2 ** 10))
+
+
+if __name__ == '__main__':
+    main()
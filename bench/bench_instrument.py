@@ -0,0 +1,84 @@
+"""
+Measure the run-time overhead of --instrument on a call-heavy kernel.
+
+Needs a C compiler (``$CC``, default ``cc``) to link against stdlib/.
+Run from the repository root::
+
+    python bench/bench_instrument.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from toycomp import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = [os.path.join(ROOT, 'stdlib', name) for name in ('lib.c', 'libmain.c', 'instrument.c')]
+CC = os.environ.get('CC', 'cc')
+
+SOURCE = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+def unary - (v) 0 - v;
+
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+def mandelcount(xmin xmax xstep ymin ymax ystep)
+    let total = 0 in
+        (for y = ymin, y < ymax, ystep in
+            for x = xmin, x < xmax, xstep in
+                total = total + mandelconverger(x, y, 0, x, y)):
+        total;
+
+def mainf()
+    mandelcount(-2.3, 1.6, 0.005, -1.3, 1.5, 0.005):
+    0;
+'''
+
+
+def build(tmp, name, *flags):
+    source = os.path.join(tmp, 'kernel.kal')
+    with open(source, 'w') as f:
+        f.write(SOURCE)
+
+    obj = os.path.join(tmp, name + '.o')
+    exe = os.path.join(tmp, name)
+    driver.main([source, '-O2', '--emit', 'obj', '-o', obj] + list(flags))
+    subprocess.check_call([CC, '-O2', obj] + STDLIB + ['-o', exe])
+    return exe
+
+
+def time_runs(exe, runs):
+    env = dict(os.environ, TOYCOMP_INSTRUMENT_OUTPUT=os.devnull)
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([exe], env=env)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t_plain = time_runs(build(tmp, 'plain'), runs)
+        t_instrumented = time_runs(build(tmp, 'instrumented', '--instrument'), runs)
+
+    print('{:14} {:>10}'.format('build', 'best (ms)'))
+    print('{:14} {:10.2f}'.format('-O2', t_plain * 1000))
+    print('{:14} {:10.2f}  ({:+.1f}%)'.format('--instrument', t_instrumented * 1000,
+                                              (t_instrumented / t_plain - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
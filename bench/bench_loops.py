@@ -0,0 +1,109 @@
+"""
+Compare for loops lowered to counted loops against the general lowering, for
+the nested loops of ``mandelhelp`` in ``examples/mandelbrot.kal`` and for loops
+over buffers. Bounds checks are off, so that the buffer loops can vectorize.
+
+``mandelhelp`` steps its loops by a fractional amount from a runtime start,
+so its loops keep the general lowering; ``mandelgrid`` draws the same picture
+with loops over pixel coordinates, which are counted.
+
+Run from the repository root::
+
+    python bench/bench_loops.py
+"""
+import array
+import ctypes
+import os
+import timeit
+
+import llvmlite.binding as llvm
+
+from toycomp import jit, optimizer
+from toycomp.driver import Driver
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', 'mandelbrot.kal')
+
+MANDELGRID = '''
+def mandelgrid(out: buffer w h xmin ymin xstep ystep)
+    for y = 0, y < h in
+        for x = 0, x < w in
+            out[y * w + x] = mandelconverge(xmin + x * xstep, ymin + y * ystep);
+'''
+
+BUFFERS = '''
+def binary : 1 (x y) y;
+
+def scale(src: buffer dst: buffer n k)
+    for i = 0, i < n in dst[i] = src[i] * k;
+
+def total(b: buffer n)
+    let t = 0 in (for i = 0, i < n in t = t + b[i]) : t;
+'''
+
+SIZE = 200000
+GRID = array.array('d', [0] * 78 * 40)
+SRC = array.array('d', range(SIZE))
+DST = array.array('d', [0] * SIZE)
+
+CONFIGS = [
+    ('-O2 general', dict(opt_level=2, count_loops=False)),
+    ('-O2 counted', dict(opt_level=2)),
+    ('-O3 native general', dict(opt_level=3, cpu='native', features='native', count_loops=False)),
+    ('-O3 native counted', dict(opt_level=3, cpu='native', features='native')),
+]
+
+_written = 0
+
+
+@ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double)
+def _putchard(c):
+    global _written
+    _written += 1
+    return 0.0
+
+
+def kernels():
+    with open(EXAMPLE) as f:
+        mandelbrot = f.read()
+
+    grid = jit.Buffer.from_buffer(GRID)
+    src, dst = jit.Buffer.from_buffer(SRC), jit.Buffer.from_buffer(DST)
+    buffer = ctypes.POINTER(jit.Buffer)
+
+    return {
+        'mandelhelp': (mandelbrot, [ctypes.c_double] * 6,
+                       (-2.3, -2.3 + 0.05 * 78, 0.05, -1.3, -1.3 + 0.07 * 40, 0.07)),
+        'mandelgrid': (mandelbrot + MANDELGRID, [buffer] + [ctypes.c_double] * 6,
+                       (grid, 78, 40, -2.3, -1.3, 0.05, 0.07)),
+        'scale': (BUFFERS, [buffer, buffer, ctypes.c_double, ctypes.c_double], (src, dst, SIZE, 2)),
+        'total': (BUFFERS, [buffer, ctypes.c_double], (src, SIZE)),
+    }
+
+
+def build(source, name, argtypes, **kwargs):
+    driver = Driver(None, bounds_check=False, **kwargs)
+    llmod = driver.optimize(driver.compile(source))
+
+    engine = llvm.create_mcjit_compiler(llmod, driver.target_machine)
+    engine.finalize_object()
+
+    vectorized = len(optimizer.vectorized_loops(llmod))
+
+    cfunc = ctypes.CFUNCTYPE(ctypes.c_double, *argtypes)
+    return engine, cfunc(engine.get_function_address(name)), vectorized
+
+
+def main():
+    llvm.add_symbol('putchard', ctypes.cast(_putchard, ctypes.c_void_p).value)
+
+    print('{:12} {:22} {:>10} {:>11}'.format('kernel', 'config', 'time (ms)', 'vectorized'))
+
+    for name, (source, argtypes, args) in kernels().items():
+        for label, kwargs in CONFIGS:
+            engine, func, vectorized = build(source, name, argtypes, **kwargs)
+            best = min(timeit.repeat(lambda: func(*args), number=1, repeat=5))
+            print('{:12} {:22} {:10.3f} {:>11}'.format(name, label, best * 1000, vectorized))
+
+
+if __name__ == '__main__':
+    main()
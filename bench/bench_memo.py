@@ -0,0 +1,92 @@
+"""
+Measure `memo def` on recursive workloads: the time of AOT-compiled
+programs with and without the annotation, and the cache statistics of the
+memoized runs.
+
+Needs a C compiler (``$CC``, default ``cc``) to link against stdlib/.
+Run from the repository root::
+
+    python bench/bench_memo.py
+"""
+import os
+import subprocess
+import tempfile
+import time
+
+from toycomp import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = [os.path.join(ROOT, 'stdlib', name) for name in ('lib.c', 'libmain.c', 'memo.c')]
+CC = os.environ.get('CC', 'cc')
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+extern putchard(c);
+'''
+
+WORKLOADS = {
+    'fib(32)': ('''
+{memo}def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+''', 'fib(32)'),
+    # Lattice paths through a 14x14 grid: exponential without the cache,
+    # quadratic with it.
+    'paths(14, 14)': ('''
+{memo}def paths(x y)
+    if x < 1 then 1 else if y < 1 then 1 else paths(x - 1, y) + paths(x, y - 1);
+''', 'paths(14, 14)'),
+    # Many distinct arguments: more than the cache holds, so entries are
+    # evicted, but recomputing an evicted entry is cheap.
+    'collatz': ('''
+{memo}def steps(n)
+    if n < 2 then 0 else
+        let half = 0 in
+            (for k = 0, k + k < n + 0.5 in half = k) :
+            (if half + half < n then steps(n + n + n + 1) else steps(half)) + 1;
+
+def collatz(limit)
+    let total = 0 in (for n = 1, n < limit in total = total + steps(n)) : total;
+''', 'collatz(3000)'),
+}
+
+
+def build(tmp, name, source, call):
+    path = os.path.join(tmp, name + '.kal')
+    with open(path, 'w') as f:
+        f.write(PRELUDE + source + '\ndef mainf() putchard(if {} < 0 then 33 else 10) : 0;\n'.format(call))
+
+    obj = os.path.join(tmp, name + '.o')
+    exe = os.path.join(tmp, name)
+    driver.main([path, '-O2', '--emit', 'obj', '-o', obj])
+    subprocess.check_call([CC, '-O2', obj] + STDLIB + ['-o', exe])
+    return exe
+
+
+def run(exe, runs=3, **env):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([exe], env=dict(os.environ, **env), stderr=subprocess.PIPE,
+                                text=True, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best, result.stderr
+
+
+def main():
+    print('{:14} {:>12} {:>12} {:>9}'.format('workload', 'plain (ms)', 'memo (ms)', 'speedup'))
+    reports = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (label, (source, call)) in enumerate(WORKLOADS.items()):
+            t_plain, _ = run(build(tmp, 'plain{}'.format(i), source.format(memo=''), call))
+            t_memo, report = run(build(tmp, 'memo{}'.format(i), source.format(memo='memo '), call),
+                                 TOYCOMP_MEMO_STATS='1')
+            print('{:14} {:12.2f} {:12.2f} {:8.1f}x'.format(label, t_plain * 1000, t_memo * 1000,
+                                                            t_plain / t_memo))
+            reports.append(report.strip('\n'))
+
+    print()
+    print('\n'.join(reports))
+
+
+if __name__ == '__main__':
+    main()
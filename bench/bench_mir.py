@@ -0,0 +1,83 @@
+"""
+Compare generating LLVM IR through the MIR (``--mir``) against generating it
+from the AST directly, on a large generated module: the time to build the
+llvmlite IR, print it and parse it back, the size of the text, and the time
+the LLVM optimizer then takes at -O0 and -O2.
+
+The functions have the redundancy that inlined helpers and macro-like code
+leave behind: repeated subexpressions, unused ``let`` bindings and a branch
+on a constant. Run from the repository root::
+
+    python bench/bench_mir.py [functions]
+"""
+import sys
+import time
+
+import llvmlite.binding as llvm
+
+from toycomp.driver import Driver
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+def sq(x) x * x;
+'''
+
+TEMPLATE = '''
+def f{n}(a b c)
+    let d = sq(a + b) - sq(a - b) in
+    let unused = d * c + sq(c) in
+    let x = (a + b) * c + (b + a) * d in
+        (for i = 0, i < c in
+            x = x * a + (a + b) * i):
+        if 1 < 2 then
+            (if x < a then f{prev}(x, b, c) else x + (a + b))
+        else x;
+'''
+
+
+def make_source(count):
+    return PRELUDE + ''.join(TEMPLATE.format(n=n, prev=max(n - 1, 0)) for n in range(count))
+
+
+def measure(source, opt_level, mir):
+    driver = Driver(None, opt_level=opt_level, mir=mir)
+    exprs = driver.check(source)
+
+    start = time.perf_counter()
+    module = driver.generate(exprs)
+    generated = time.perf_counter()
+    text = str(module)
+    printed = time.perf_counter()
+    llmod = llvm.parse_assembly(text)
+    parsed = time.perf_counter()
+    driver.optimize(llmod)
+    optimized = time.perf_counter()
+
+    return {
+        'generate': generated - start,
+        'print': printed - generated,
+        'parse': parsed - printed,
+        'optimize': optimized - parsed,
+        'total': optimized - start,
+        'size': len(text),
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = make_source(count)
+
+    print('{} functions'.format(count))
+    print('{:4} {:5} {:>10} {:>8} {:>8} {:>10} {:>8} {:>10}'.format(
+        'opt', 'path', 'generate', 'print', 'parse', 'optimize', 'total', 'IR (KiB)'))
+
+    for opt_level in (0, 2):
+        for mir in (False, True):
+            r = min((measure(source, opt_level, mir) for _ in range(3)), key=lambda r: r['total'])
+            print('-O{:<2} {:5} {:10.3f} {:8.3f} {:8.3f} {:10.3f} {:8.3f} {:10.0f}'.format(
+                opt_level, 'mir' if mir else 'ast', r['generate'], r['print'], r['parse'],
+                r['optimize'], r['total'], r['size'] / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Measure the cost of name resolution per variable reference as the nesting
+depth of scopes grows.
+
+Each program nests `depth` `let` scopes and then references the outermost
+variable from the innermost scope; the time per reference is the difference
+between programs with one and with `refs + 1` references. Run from the
+repository root::
+
+    python bench/bench_nameres.py [refs]
+"""
+import sys
+import timeit
+
+from toycomp import parser
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
+from toycomp.nameres import NameResolver
+
+
+def program(depth, refs):
+    lets = ''.join('let v{} = {} in '.format(i, i) for i in range(depth))
+    body = ' + '.join(['v0'] * refs)
+    return 'def f(x) {}{};'.format(lets, body)
+
+
+def main():
+    refs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    sys.setrecursionlimit(100000)
+
+    print('{:>8} {:>16}'.format('depth', 'ns / reference'))
+
+    for depth in [1, 10, 100, 1000]:
+        diags = DiagnosticsEngine(DiagnosticPrinter(sys.stderr))
+
+        def best_time(refs):
+            [func] = parser.parse(program(depth, refs))
+            number = 20
+            return min(timeit.repeat(lambda: NameResolver(diags).visit(func),
+                                     number=number, repeat=7)) / number
+
+        # Subtract the cost of the scopes themselves.
+        per_ref = (best_time(refs + 1) - best_time(1)) / refs
+        print('{:>8} {:>16.1f}'.format(depth, per_ref * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Measure the start-up time of ``python -m toycomp.tiered --mode jit`` on a
+program of many functions: without the object cache, with an empty cache
+(cold) and with the program already cached (warm).
+
+Run from the repository root::
+
+    python bench/bench_objcache.py [functions] [-O level]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+'''
+
+TEMPLATE = '''
+def f{n}(a b c)
+    let x = a * b + c in
+        (for i = 0, i < c, 1 in
+            x = x * a + i - b):
+        if x < a then f{prev}(x, b, c) else x;
+'''
+
+MAIN = '''
+def mainf() f{last}(1, 2, 3) : 0;
+'''
+
+REPEAT = 5
+
+
+def make_source(count):
+    return (PRELUDE + ''.join(TEMPLATE.format(n=n, prev=max(n - 1, 0)) for n in range(count))
+            + MAIN.format(last=count - 1))
+
+
+def run(path, opt_level, cache_dir, *extra):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'toycomp.tiered', '--mode', 'jit', '-O', str(opt_level),
+                    path, *extra],
+                   env=dict(os.environ, PYTHONPATH=os.getcwd(), TOYCOMP_CACHE_DIR=cache_dir),
+                   check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('functions', nargs='?', type=int, default=500)
+    ap.add_argument('-O', dest='opt_level', type=int, default=2)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'prog.kal')
+        with open(path, 'w') as f:
+            f.write(make_source(args.functions))
+
+        no_cache, cold, warm = [], [], []
+        for i in range(REPEAT):
+            cache_dir = os.path.join(tmp, 'cache{}'.format(i))
+            no_cache.append(run(path, args.opt_level, cache_dir, '--no-cache'))
+            cold.append(run(path, args.opt_level, cache_dir))
+            warm.append(run(path, args.opt_level, cache_dir))
+
+        size = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+    print('{} functions, -O{}, cached objects: {:.1f} KiB'.format(args.functions, args.opt_level,
+                                                                  size / 2 ** 10))
+    print('{:10} {:>10}'.format('run', 'time (ms)'))
+    for label, times in [('no cache', no_cache), ('cold', cold), ('warm', warm)]:
+        print('{:10} {:10.1f}'.format(label, statistics.median(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
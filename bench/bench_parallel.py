@@ -0,0 +1,101 @@
+"""
+Measure how a `parallel for` over the rows of a Mandelbrot image scales with
+the number of threads, from 1 up to the machine's core count, against the
+same program with a sequential `for`.
+
+Needs a C compiler (``$CC``, default ``cc``) to link against stdlib/.
+Run from the repository root::
+
+    python bench/bench_parallel.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from toycomp import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = [os.path.join(ROOT, 'stdlib', name) for name in ('lib.c', 'libmain.c', 'parallel.c')]
+CC = os.environ.get('CC', 'cc')
+
+SOURCE = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+def unary - (v) 0 - v;
+
+extern putchard(char);
+
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+# Each row sums its pixels and prints one character, so that the work
+# can't be optimized away and the output stays small.
+def mandelrows(xmin xmax xstep ymin ymax ystep)
+    {for} y = ymin, y < ymax, ystep in
+        let total = 0 in
+            (for x = xmin, x < xmax, xstep in
+                total = total + mandelconverger(x, y, 0, x, y)):
+            putchard(if total < 0 then 33 else 46);
+
+def mainf()
+    mandelrows(-2.3, 1.6, 0.002, -1.3, 1.5, 0.002):
+    0;
+'''
+
+
+def build(tmp, name, loop):
+    source = os.path.join(tmp, name + '.kal')
+    with open(source, 'w') as f:
+        f.write(SOURCE.replace('{for}', loop))
+
+    obj = os.path.join(tmp, name + '.o')
+    exe = os.path.join(tmp, name)
+    driver.main([source, '-O2', '--emit', 'obj', '-o', obj])
+    subprocess.check_call([CC, '-O2', '-pthread', obj] + STDLIB + ['-o', exe])
+    return exe
+
+
+def time_runs(exe, runs, threads=None):
+    env = dict(os.environ)
+    if threads:
+        env['TOYCOMP_NUM_THREADS'] = str(threads)
+
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([exe], env=env, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    cores = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t_sequential = time_runs(build(tmp, 'sequential', 'for'), runs)
+        parallel = build(tmp, 'parallel', 'parallel for')
+
+        print('{:14} {:>10} {:>9}'.format('build', 'best (ms)', 'speedup'))
+        print('{:14} {:10.2f} {:8.2f}x'.format('sequential', t_sequential * 1000, 1))
+
+        threads = 1
+        while True:
+            t = time_runs(parallel, runs, threads)
+            print('{:14} {:10.2f} {:8.2f}x'.format('{} thread{}'.format(threads, 's' if threads > 1 else ''),
+                                                   t * 1000, t_sequential / t))
+            if threads >= cores:
+                break
+            threads = min(threads * 2, cores)
+
+
+if __name__ == '__main__':
+    main()
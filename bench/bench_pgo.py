@@ -0,0 +1,79 @@
+"""
+Build examples/mandelbrot.kal with and without profile-guided optimization
+and compare the run times of the resulting executables. The plot is rendered
+repeatedly so that process start-up doesn't dominate.
+
+Needs a C compiler (``$CC``, default ``cc``) to link against stdlib/.
+Run from the repository root::
+
+    python bench/bench_pgo.py [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from toycomp import driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, 'examples', 'mandelbrot.kal')
+STDLIB = [os.path.join(ROOT, 'stdlib', 'lib.c'), os.path.join(ROOT, 'stdlib', 'libmain.c')]
+CC = os.environ.get('CC', 'cc')
+
+
+def make_source(tmp, repeat):
+    with open(SOURCE) as f:
+        source = f.read()
+
+    source = source.replace('mandel(-2.3, -1.3, 0.05, 0.07)',
+                            'for i = 0, i < {}, 1 in mandel(-2.3, -1.3, 0.05, 0.07)'.format(repeat))
+    path = os.path.join(tmp, 'mandelbrot.kal')
+    with open(path, 'w') as f:
+        f.write(source)
+    return path
+
+
+def build(tmp, source, name, *flags):
+    obj = os.path.join(tmp, name + '.o')
+    exe = os.path.join(tmp, name)
+    driver.main([source, '-O2', '--emit', 'obj', '-o', obj] + list(flags))
+    subprocess.check_call([CC, '-O2', obj] + STDLIB + ['-o', exe])
+    return exe
+
+
+def time_runs(exe, runs, env=None):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([exe], stderr=subprocess.DEVNULL, env=env)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = make_source(tmp, repeat=100)
+        profile = os.path.join(tmp, 'mandelbrot.kalprof')
+        env = dict(os.environ, TOYCOMP_PROFILE_FILE=profile)
+
+        baseline = build(tmp, source, 'baseline')
+        instrumented = build(tmp, source, 'instrumented', '--profile-generate')
+        subprocess.check_call([instrumented], stderr=subprocess.DEVNULL, env=env)
+        optimized = build(tmp, source, 'pgo', '--profile-use', profile)
+
+        t_baseline = time_runs(baseline, runs)
+        t_instrumented = time_runs(instrumented, runs, env=dict(env, TOYCOMP_PROFILE_FILE=os.devnull))
+        t_optimized = time_runs(optimized, runs)
+
+    print('{:14} {:>10}'.format('build', 'best (ms)'))
+    print('{:14} {:10.2f}'.format('-O2', t_baseline * 1000))
+    print('{:14} {:10.2f}'.format('instrumented', t_instrumented * 1000))
+    print('{:14} {:10.2f}  ({:+.1f}% vs -O2)'.format('-O2 + PGO', t_optimized * 1000,
+                                                     (t_optimized / t_baseline - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Measure REPL latency per input as a session grows.
+
+Each round defines a new function that calls the previous one and then
+evaluates a call to it, so later inputs see more and more earlier
+definitions. Run from the repository root::
+
+    python bench/bench_repl.py [rounds]
+"""
+import sys
+import time
+
+from toycomp.repl import Session
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    session = Session(opt_level=2)
+    session.evaluate('def f0(x) x + 1;')
+
+    print('{:>8} {:>12} {:>12}'.format('inputs', 'def (ms)', 'expr (ms)'))
+
+    for n in range(1, rounds + 1):
+        start = time.perf_counter()
+        session.evaluate('def f{}(x) f{}(x) * 2 + 1;'.format(n, n - 1))
+        define = time.perf_counter() - start
+
+        start = time.perf_counter()
+        [result] = session.evaluate('f{}(1)'.format(n))
+        evaluate = time.perf_counter() - start
+
+        if n == 1 or n % (rounds // 5 or 1) == 0:
+            print('{:>8} {:>12.2f} {:>12.2f}'.format(2 * n, define * 1e3, evaluate * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare loading a serialized, checked AST against re-running the frontend
+(parse, operator rewriting, name resolution and typechecking).
+
+Run from the repository root::
+
+    python bench/bench_serialize.py [copies]
+"""
+import sys
+import timeit
+
+from toycomp import compilepass, nameres, parser, serialize, typechecker, user_op_rewriter
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+extern putchard(ch);
+'''
+
+TEMPLATE = '''
+def converger{n}(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        converger{n}(real * real - imag * imag + creal,
+                     2 * real * imag + cimag,
+                     iters + 1, creal, cimag);
+
+def help{n}(xmin xmax xstep ymin ymax ystep)
+    for y = ymin, y < ymax, ystep in
+        (for x = xmin, x < xmax, xstep in
+            let d = converger{n}(x, y, 0, x, y) in
+                putchard(d)):
+        putchard(10);
+'''
+
+
+def frontend(source):
+    engine = DiagnosticsEngine(DiagnosticPrinter(sys.stderr))
+    pm = compilepass.PassManager([
+        user_op_rewriter.UserOpRewriter(),
+        nameres.NameResolver(engine),
+        typechecker.Typechecker(engine),
+    ])
+    exprs = list(parser.parse(source, name='bench.kal'))
+    assert all([pm.visit(expr) for expr in exprs])
+    return exprs
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    source = PRELUDE + ''.join(TEMPLATE.format(n=n) for n in range(copies))
+
+    exprs = frontend(source)
+    data = serialize.dumps(exprs)
+
+    t_frontend = min(timeit.repeat(lambda: frontend(source), number=1, repeat=5))
+    t_dump = min(timeit.repeat(lambda: serialize.dumps(exprs), number=1, repeat=5))
+    t_load = min(timeit.repeat(lambda: serialize.loads(data), number=1, repeat=5))
+
+    print('source size:     {:10d} bytes'.format(len(source)))
+    print('serialized size: {:10d} bytes'.format(len(data)))
+    print('frontend:        {:10.2f} ms'.format(t_frontend * 1000))
+    print('dump:            {:10.2f} ms'.format(t_dump * 1000))
+    print('load:            {:10.2f} ms ({:.1f}x faster than frontend)'.format(t_load * 1000,
+                                                                             t_frontend / t_load))
+
+
+if __name__ == '__main__':
+    main()
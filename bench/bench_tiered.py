@@ -0,0 +1,88 @@
+"""
+Compare tiered execution with pure interpretation and pure JIT compilation.
+
+For each mode, measures the start-up latency (loading a checked program and
+running it once, which for the JIT includes compiling everything) and the
+steady-state time per run once all compilation has finished, on two
+programs: a short script and a call-heavy kernel.
+
+Run from the repository root::
+
+    python bench/bench_tiered.py
+"""
+import sys
+import time
+
+from toycomp import tiered
+from toycomp.driver import Driver
+
+SCRIPT = '''
+def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+def mainf() fib(10);
+'''
+
+KERNEL = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+def unary - (v) 0 - v;
+
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+def mandelcount(xmin xmax xstep ymin ymax ystep)
+    let total = 0 in
+        (for y = ymin, y < ymax, ystep in
+            for x = xmin, x < xmax, xstep in
+                total = total + mandelconverger(x, y, 0, x, y)):
+        total;
+
+def mainf() mandelcount(-2.3, 1.6, 0.05, -1.3, 1.5, 0.07);
+'''
+
+
+def run(nodes, mode, steady_runs):
+    start = time.perf_counter()
+    with tiered.TieredEngine(mode=mode) as engine:
+        engine.load(nodes)
+        result = engine.call('mainf')
+        startup = time.perf_counter() - start
+
+        # Let every function that is going to get hot get compiled.
+        for _ in range(steady_runs):
+            engine.call('mainf')
+            engine.wait()
+
+        steady = float('inf')
+        for _ in range(steady_runs):
+            start = time.perf_counter()
+            assert engine.call('mainf') == result
+            steady = min(steady, time.perf_counter() - start)
+
+    return startup, steady
+
+
+def main():
+    sys.setrecursionlimit(100000)
+    driver = Driver(None)
+
+    # Warm up the process (imports, first-use initialization).
+    run(driver.check(SCRIPT), 'interpret', 1)
+
+    print('{:<8} {:<10} {:>14} {:>14}'.format('program', 'mode', 'startup (ms)', 'steady (ms)'))
+
+    for name, source, steady_runs in [('script', SCRIPT, 20), ('kernel', KERNEL, 5)]:
+        nodes = driver.check(source, name=name)
+
+        for mode in ['interpret', 'jit', 'tiered']:
+            startup, steady = run(nodes, mode, steady_runs)
+            print('{:<8} {:<10} {:>14.2f} {:>14.2f}'.format(name, mode, startup * 1e3, steady * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare the object-based token stream with `pratt.TokenArray`: the memory
+held by the tokens of a large program, and the time to tokenize and parse it.
+
+Run from the repository root::
+
+    python bench/bench_tokens.py [copies]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from toycomp import parser
+from toycomp.pratt import Tokenizer
+
+TEMPLATE = '''
+def binary : 1 (x y) y;
+# Iterate z = z^2 + c until it escapes or `iters` reaches 255.
+def converger{n}(real imag iters creal cimag)
+    if 255 < iters then
+       iters
+    else if 4 < real * real + imag * imag then
+       iters
+    else
+        converger{n}(real * real - imag * imag + creal,
+                     2 * real * imag + cimag,
+                     iters + 1, creal, cimag);
+
+def help{n}(xmin xmax xstep ymin ymax ystep)
+    for y = ymin, y < ymax, ystep in
+        (for x = xmin, x < xmax, xstep in
+            let d = converger{n}(x, y, 0, x, y) in
+                putchard(d)):
+        putchard(10);
+'''
+
+
+def measure(func):
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    source = ''.join(TEMPLATE.format(n=n) for n in range(copies))
+    tokenizer = Tokenizer(parser.grammar)
+
+    objects, objects_size = measure(lambda: list(tokenizer.tokenize(source)))
+    array, array_size = measure(lambda: tokenizer.tokenize_array(source))
+    assert len(objects) == len(array)
+
+    print('{} tokens, {:.1f} MB of source text'.format(len(array), len(source) / 1e6))
+    print('{:<10} {:>16} {:>18}'.format('stream', 'token memory (MB)', 'parse time (ms)'))
+
+    for name, compact, size in [('objects', False, objects_size), ('array', True, array_size)]:
+        parse_time = min(timeit.repeat(lambda: list(parser.parse(source, compact=compact)),
+                                       number=1, repeat=5))
+        print('{:<10} {:>16.1f} {:>18.1f}'.format(name, size / 1e6, parse_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare evaluating a Kaleidoscope function over NumPy arrays with
+`toycomp.vectorize` (one foreign call per batch) against calling the
+compiled function through ctypes once per element.
+
+Run from the repository root::
+
+    PYTHONPATH=. python bench/bench_ufunc.py
+"""
+import ctypes
+import time
+
+import numpy as np
+
+import toycomp
+from toycomp import frontend, jit
+from toycomp.codegen import Codegen
+
+SOURCE = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+def mandelconverge(real imag) mandelconverger(real, imag, 0, real, imag);
+
+def axpy(a x y) a * x + y;
+'''
+
+ARGS = {
+    'axpy': lambda n: (np.full(n, 2.0), np.linspace(0, 1, n), np.ones(n)),
+    'mandelconverge': lambda n: (np.linspace(-2, 1, n), np.linspace(-1.2, 1.2, n)),
+}
+
+
+def per_element_function(name):
+    engine = jit.JIT(cpu='native', features='native', opt_level=3)
+    cg = Codegen()
+    engine.configure_module(cg.module)
+    for node in frontend.check(SOURCE):
+        cg.visit(node)
+    engine.add_module(cg.finish())
+
+    nparams = len(cg.module.globals[name].args)
+    return engine, engine.function(name, ctypes.c_double, [ctypes.c_double] * nparams)
+
+
+def best_of(runs, f):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print('{:<16} {:>9} {:>16} {:>16} {:>9}'.format('function', 'elements',
+                                                    'per element', 'vectorized', 'speedup'))
+
+    for name, make_args in ARGS.items():
+        kernel = toycomp.vectorize(SOURCE, name)
+        engine, scalar = per_element_function(name)
+
+        for n in [1000, 100000]:
+            args = make_args(n)
+            columns = [a.tolist() for a in args]
+            out = np.empty(n)
+
+            def elementwise():
+                for i, values in enumerate(zip(*columns)):
+                    out[i] = scalar(*values)
+
+            t_scalar = best_of(3, elementwise)
+            expected = out.copy()
+
+            t_vector = best_of(20, lambda: kernel(*args, out=out))
+            assert np.array_equal(out, expected)
+
+            print('{:<16} {:>9} {:>10.2f} Melt/s {:>10.2f} Melt/s {:>8.0f}x'.format(
+                name, n, n / t_scalar / 1e6, n / t_vector / 1e6, t_scalar / t_vector))
+
+
+if __name__ == '__main__':
+    main()
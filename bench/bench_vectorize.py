@@ -0,0 +1,99 @@
+"""
+Compare loop-heavy kernels built for a generic baseline against the host CPU,
+with and without the loop and SLP vectorizers.
+
+Run from the repository root::
+
+    python bench/bench_vectorize.py
+"""
+import ctypes
+import timeit
+
+import llvmlite.binding as llvm
+
+from toycomp import optimizer
+from toycomp.driver import Driver
+
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+
+def binary > 10 (lhs rhs)
+    rhs < lhs;
+
+def binary | 5 (lhs rhs)
+    if lhs then 1 else if rhs then 1 else 0;
+'''
+
+KERNELS = {
+    'sumsq': ('''
+def sumsq(n)
+    let acc = 0 in
+        (for i = 0, i < n, 1 in
+            acc = acc + i * i):
+        acc;
+''', (200000.0,)),
+
+    'horner': ('''
+def horner(n)
+    let acc = 0 in
+        (for i = 0, i < n, 1 in
+            acc = acc + ((((0.5 * i + 0.25) * i + 0.125) * i) + 1)):
+        acc;
+''', (200000.0,)),
+
+    'mandelcount': ('''
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+def mandelcount(xmin xmax xstep ymin ymax ystep)
+    let total = 0 in
+        (for y = ymin, y < ymax, ystep in
+            for x = xmin, x < xmax, xstep in
+                total = total + mandelconverger(x, y, 0, x, y)):
+        total;
+''', (-2.3, 1.6, 0.01, -1.3, 1.5, 0.01)),
+}
+
+CONFIGS = [
+    ('-O0 generic', dict(opt_level=0)),
+    ('-O3 generic', dict(opt_level=3)),
+    ('-O3 native --no-vectorize', dict(opt_level=3, cpu='native', features='native', vectorize=False)),
+    ('-O3 native', dict(opt_level=3, cpu='native', features='native')),
+]
+
+
+def build(source, name, nargs, **kwargs):
+    driver = Driver(None, **kwargs)
+    module = driver.compile(PRELUDE + source)
+    if kwargs.get('opt_level'):
+        llmod = driver.optimize(module)
+    else:
+        llmod = optimizer.parse_module(module)
+
+    engine = llvm.create_mcjit_compiler(llmod, driver.target_machine)
+    engine.finalize_object()
+
+    vectorized = len(optimizer.vectorized_loops(llmod))
+
+    cfunc = ctypes.CFUNCTYPE(ctypes.c_double, *[ctypes.c_double] * nargs)
+    return engine, cfunc(engine.get_function_address(name)), vectorized
+
+
+def main():
+    print('{:12} {:28} {:>10} {:>11}'.format('kernel', 'config', 'time (ms)', 'vectorized'))
+
+    for name, (source, args) in KERNELS.items():
+        for label, kwargs in CONFIGS:
+            engine, func, vectorized = build(source, name, len(args), **kwargs)
+            best = min(timeit.repeat(lambda: func(*args), number=1, repeat=5))
+            print('{:12} {:28} {:10.3f} {:>11}'.format(name, label, best * 1000, vectorized))
+
+
+if __name__ == '__main__':
+    main()
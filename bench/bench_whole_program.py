@@ -0,0 +1,66 @@
+"""
+Compare compiling a program that uses a few functions of a large library with
+and without ``--whole-program``: the time to generate and optimize code, and
+the size of the object file.
+
+Run from the repository root::
+
+    python bench/bench_whole_program.py [functions]
+"""
+import sys
+import time
+
+from toycomp.driver import Driver
+
+TEMPLATE = '''
+def lib{n}(a b)
+    let x = a * b in
+        (for i = 0, i < b, 1 in
+            x = x * a + i):
+        lib{prev}(x, b);
+'''
+
+PRELUDE = '''
+def binary : 1 (x y) y;
+
+def lib0(a b) a + b;
+'''
+
+MAIN = '''
+def mainf()
+    lib5(2, 3) : lib5(4, 3);
+'''
+
+
+def make_source(count):
+    return PRELUDE + ''.join(TEMPLATE.format(n=n, prev=n - 1) for n in range(1, count)) + MAIN
+
+
+def build(source, **kwargs):
+    driver = Driver(None, opt_level=2, **kwargs)
+
+    start = time.perf_counter()
+    module = driver.compile(source)
+    if kwargs.get('whole_program'):
+        module = driver.optimize_whole_program(module)
+    module = driver.optimize(module)
+    elapsed = time.perf_counter() - start
+
+    obj = driver.target_machine.emit_object(module)
+    return elapsed, len(obj), sum(1 for f in module.functions if not f.is_declaration)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    source = make_source(count)
+
+    print('{} library functions, mainf uses 6'.format(count))
+    print('{:15} {:>10} {:>12} {:>10}'.format('mode', 'time (ms)', 'object (KiB)', 'functions'))
+
+    for label, kwargs in [('separate', {}), ('whole-program', {'whole_program': True})]:
+        elapsed, size, functions = build(source, **kwargs)
+        print('{:15} {:10.1f} {:12.1f} {:10}'.format(label, elapsed * 1000, size / 2 ** 10, functions))
+
+
+if __name__ == '__main__':
+    main()
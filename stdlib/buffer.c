@@ -0,0 +1,131 @@
+/*
+ * Runtime for the `buffer` type: arrays of doubles, e.g. memory-mapped
+ * binary files. Programs declare the functions they use with `extern`:
+ *
+ *   extern buffer_length(b: buffer);
+ *   extern new_buffer(length) -> buffer;
+ *   extern map_input(arg) -> buffer;
+ *   extern map_output(arg length) -> buffer;
+ *
+ * map_input maps the file named by command line argument `arg` (1 is the
+ * first argument). The mapping is private: stores to it don't reach the
+ * file. map_output creates or truncates the file named by argument `arg`
+ * to hold `length` doubles; stores to it do reach the file. Both files
+ * hold doubles in the machine's byte order.
+ *
+ * Errors are reported to stderr and end the program.
+ */
+#define _POSIX_C_SOURCE 200112L
+
+#include <fcntl.h>
+#include <inttypes.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+struct toycomp_buffer
+{
+    double *data;
+    int64_t length;
+};
+
+/* Set by main() in libmain.c. */
+extern int toycomp_argc;
+extern char **toycomp_argv;
+
+void __toycomp_bounds_error(int64_t index, int64_t length)
+{
+    fprintf(stderr, "buffer index %" PRId64 " out of bounds for length %" PRId64 "\n",
+            index, length);
+    abort();
+}
+
+static void toycomp_buffer_fail(const char *what)
+{
+    perror(what);
+    exit(1);
+}
+
+static struct toycomp_buffer *toycomp_buffer_alloc(void)
+{
+    struct toycomp_buffer *b = malloc(sizeof *b);
+    if (!b)
+        toycomp_buffer_fail("buffer");
+    return b;
+}
+
+static const char *toycomp_buffer_arg(double arg)
+{
+    int i = (int) arg;
+    if (i < 1 || i >= toycomp_argc)
+    {
+        fprintf(stderr, "buffer: no command line argument %d\n", i);
+        exit(1);
+    }
+    return toycomp_argv[i];
+}
+
+double buffer_length(struct toycomp_buffer *b)
+{
+    return (double) b->length;
+}
+
+struct toycomp_buffer *new_buffer(double length)
+{
+    struct toycomp_buffer *b = toycomp_buffer_alloc();
+    b->length = length > 0 ? (int64_t) length : 0;
+    b->data = calloc(b->length ? b->length : 1, sizeof *b->data);
+    if (!b->data)
+        toycomp_buffer_fail("new_buffer");
+    return b;
+}
+
+static struct toycomp_buffer *toycomp_buffer_map(const char *path, int fd, size_t size,
+                                                 int prot, int flags)
+{
+    struct toycomp_buffer *b = toycomp_buffer_alloc();
+    b->length = size / sizeof *b->data;
+    b->data = NULL;
+
+    if (b->length)
+    {
+        void *p = mmap(NULL, b->length * sizeof *b->data, prot, flags, fd, 0);
+        if (p == MAP_FAILED)
+            toycomp_buffer_fail(path);
+#ifdef POSIX_MADV_SEQUENTIAL
+        /* Kernels usually stream through their data. */
+        posix_madvise(p, b->length * sizeof *b->data, POSIX_MADV_SEQUENTIAL);
+#endif
+        b->data = p;
+    }
+
+    close(fd);
+    return b;
+}
+
+struct toycomp_buffer *map_input(double arg)
+{
+    const char *path = toycomp_buffer_arg(arg);
+    struct stat st;
+
+    int fd = open(path, O_RDONLY);
+    if (fd < 0 || fstat(fd, &st) < 0)
+        toycomp_buffer_fail(path);
+
+    return toycomp_buffer_map(path, fd, st.st_size, PROT_READ | PROT_WRITE, MAP_PRIVATE);
+}
+
+struct toycomp_buffer *map_output(double arg, double length)
+{
+    const char *path = toycomp_buffer_arg(arg);
+    size_t size = (length > 0 ? (size_t) length : 0) * sizeof(double);
+
+    int fd = open(path, O_RDWR | O_CREAT | O_TRUNC, 0666);
+    if (fd < 0 || ftruncate(fd, size) < 0)
+        toycomp_buffer_fail(path);
+
+    return toycomp_buffer_map(path, fd, size, PROT_READ | PROT_WRITE, MAP_SHARED);
+}
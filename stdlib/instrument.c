@@ -0,0 +1,189 @@
+/*
+ * Runtime for programs compiled with --instrument; see toycomp/instrument.py.
+ *
+ * At exit, writes a per-function report sorted by inclusive time.
+ *
+ *   TOYCOMP_INSTRUMENT_OUTPUT   file to write the report to (default: stderr)
+ *   TOYCOMP_INSTRUMENT_FORMAT   "text" (default) or "json"
+ */
+#define _POSIX_C_SOURCE 199309L
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
+
+struct toycomp_fn_stats
+{
+    uint64_t calls;
+    uint64_t ticks;
+    uint64_t depth;
+    uint64_t start;
+    uint64_t timed;
+};
+
+struct toycomp_instrumented_module
+{
+    const char *const *names;
+    struct toycomp_fn_stats *const *stats;
+    uint64_t count;
+    struct toycomp_instrumented_module *next;
+};
+
+struct toycomp_fn_report
+{
+    const char *name;
+    uint64_t calls;
+    int timed;
+    double ns;
+};
+
+static struct toycomp_instrumented_module *toycomp_instrumented_modules;
+static uint64_t toycomp_start_ns;
+static uint64_t toycomp_start_ticks;
+
+static uint64_t toycomp_now_ns(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (uint64_t) ts.tv_sec * 1000000000u + (uint64_t) ts.tv_nsec;
+}
+
+uint64_t __toycomp_instrument_ticks(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+    return __rdtsc();
+#else
+    return toycomp_now_ns();
+#endif
+}
+
+static int toycomp_compare_reports(const void *a, const void *b)
+{
+    const struct toycomp_fn_report *ra = a, *rb = b;
+    return (ra->ns < rb->ns) - (ra->ns > rb->ns);
+}
+
+static void toycomp_write_json_string(FILE *f, const char *s)
+{
+    fputc('"', f);
+    for (; *s; ++s)
+    {
+        if (*s == '"' || *s == '\\')
+            fprintf(f, "\\%c", *s);
+        else if ((unsigned char) *s < 0x20)
+            fprintf(f, "\\u%04x", *s);
+        else
+            fputc(*s, f);
+    }
+    fputc('"', f);
+}
+
+static void toycomp_instrument_write(void)
+{
+    uint64_t elapsed_ns = toycomp_now_ns() - toycomp_start_ns;
+    uint64_t elapsed_ticks = __toycomp_instrument_ticks() - toycomp_start_ticks;
+    double ns_per_tick = elapsed_ticks ? (double) elapsed_ns / elapsed_ticks : 1.0;
+
+    size_t count = 0;
+    for (struct toycomp_instrumented_module *m = toycomp_instrumented_modules; m; m = m->next)
+        count += m->count;
+
+    struct toycomp_fn_report *reports = calloc(count, sizeof *reports);
+    if (!reports)
+        return;
+
+    size_t n = 0;
+    for (struct toycomp_instrumented_module *m = toycomp_instrumented_modules; m; m = m->next)
+    {
+        for (uint64_t i = 0; i < m->count; ++i, ++n)
+        {
+            reports[n].name = m->names[i];
+            reports[n].calls = m->stats[i]->calls;
+            reports[n].timed = m->stats[i]->timed != 0;
+            reports[n].ns = m->stats[i]->ticks * ns_per_tick;
+        }
+    }
+
+    qsort(reports, count, sizeof *reports, toycomp_compare_reports);
+
+    const char *path = getenv("TOYCOMP_INSTRUMENT_OUTPUT");
+    const char *format = getenv("TOYCOMP_INSTRUMENT_FORMAT");
+    int json = format && strcmp(format, "json") == 0;
+
+    FILE *f = path ? fopen(path, "w") : stderr;
+    if (!f)
+    {
+        perror(path);
+        free(reports);
+        return;
+    }
+
+    if (json)
+    {
+        fprintf(f, "{\"total_ns\": %llu, \"functions\": [", (unsigned long long) elapsed_ns);
+        for (size_t i = 0; i < count; ++i)
+        {
+            fprintf(f, "%s{\"name\": ", i ? ", " : "");
+            toycomp_write_json_string(f, reports[i].name);
+            fprintf(f, ", \"calls\": %llu, \"inclusive_ns\": ", (unsigned long long) reports[i].calls);
+            if (reports[i].timed)
+                fprintf(f, "%.0f}", reports[i].ns);
+            else
+                fprintf(f, "null}");
+        }
+        fprintf(f, "]}\n");
+    }
+    else
+    {
+        fprintf(f, "%-24s %12s %14s %8s %12s\n", "function", "calls", "inclusive ms", "%", "ns/call");
+        for (size_t i = 0; i < count; ++i)
+        {
+            if (!reports[i].timed)
+            {
+                fprintf(f, "%-24s %12llu %14s %8s %12s\n",
+                        reports[i].name, (unsigned long long) reports[i].calls, "-", "-", "-");
+                continue;
+            }
+
+            fprintf(f, "%-24s %12llu %14.3f %8.2f %12.1f\n",
+                    reports[i].name,
+                    (unsigned long long) reports[i].calls,
+                    reports[i].ns / 1e6,
+                    elapsed_ns ? 100.0 * reports[i].ns / elapsed_ns : 0.0,
+                    reports[i].calls ? reports[i].ns / reports[i].calls : 0.0);
+        }
+    }
+
+    if (f != stderr)
+        fclose(f);
+
+    free(reports);
+}
+
+void __toycomp_instrument_register(const char *const *names,
+                                   struct toycomp_fn_stats *const *stats,
+                                   uint64_t count)
+{
+    struct toycomp_instrumented_module *m = malloc(sizeof *m);
+    if (!m)
+        return;
+
+    if (!toycomp_instrumented_modules)
+    {
+        toycomp_start_ns = toycomp_now_ns();
+        toycomp_start_ticks = __toycomp_instrument_ticks();
+        atexit(toycomp_instrument_write);
+    }
+
+    m->names = names;
+    m->stats = stats;
+    m->count = count;
+    m->next = toycomp_instrumented_modules;
+    toycomp_instrumented_modules = m;
+}
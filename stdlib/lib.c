@@ -6,3 +6,57 @@ double putchard(double x)
     fputc((char) x, stderr);
     return 0;
 }
+
+
+/* Profile-guided optimization runtime; see toycomp/pgo.py. */
+
+#include <stdint.h>
+#include <stdlib.h>
+
+struct toycomp_profile
+{
+    const char *const *names;
+    uint64_t *const *counters;
+    uint64_t count;
+    struct toycomp_profile *next;
+};
+
+static struct toycomp_profile *toycomp_profiles;
+
+static void toycomp_profile_write(void)
+{
+    const char *path = getenv("TOYCOMP_PROFILE_FILE");
+    if (!path)
+        path = "default.kalprof";
+
+    FILE *f = fopen(path, "a");
+    if (!f)
+    {
+        perror(path);
+        return;
+    }
+
+    for (struct toycomp_profile *p = toycomp_profiles; p; p = p->next)
+        for (uint64_t i = 0; i < p->count; ++i)
+            fprintf(f, "%s %llu\n", p->names[i], (unsigned long long) *p->counters[i]);
+
+    fclose(f);
+}
+
+void __toycomp_profile_register(const char *const *names,
+                                uint64_t *const *counters,
+                                uint64_t count)
+{
+    struct toycomp_profile *p = malloc(sizeof *p);
+    if (!p)
+        return;
+
+    if (!toycomp_profiles)
+        atexit(toycomp_profile_write);
+
+    p->names = names;
+    p->counters = counters;
+    p->count = count;
+    p->next = toycomp_profiles;
+    toycomp_profiles = p;
+}
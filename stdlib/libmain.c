@@ -1,7 +1,13 @@
 
 double mainf();
 
+/* The command line, for map_input and map_output in buffer.c. */
+int toycomp_argc;
+char **toycomp_argv;
+
 int main(int argc, char **argv)
 {
+    toycomp_argc = argc;
+    toycomp_argv = argv;
     return mainf();
 }
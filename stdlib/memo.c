@@ -0,0 +1,164 @@
+/*
+ * Runtime for `memo def`; see Codegen.emit_memo_lookup in
+ * toycomp/codegen.py.
+ *
+ * Each memoized function has a `struct toycomp_memo` that the compiler
+ * emits. Its cache is a fixed-size, open-addressed hash table of argument
+ * tuples and results, allocated on first use. A lookup probes a few
+ * consecutive entries; storing a result into a full neighbourhood evicts
+ * the entry the arguments hash to. Arguments match if their bits are equal.
+ * A spin lock per table makes the cache safe to use from parallel loops.
+ *
+ *   TOYCOMP_MEMO_STATS   if set, report hits, misses and evictions per
+ *                        function to stderr at exit
+ */
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define TOYCOMP_MEMO_PROBES 4
+
+struct toycomp_memo
+{
+    const char *name;
+    uint64_t nargs;
+    uint64_t capacity; /* a power of two */
+    uint64_t *entries; /* capacity * (2 + nargs) words: tag, result, args */
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t evictions;
+    struct toycomp_memo *next;
+    uint64_t lock;
+};
+
+static struct toycomp_memo *toycomp_memos;
+static uint64_t toycomp_memos_lock;
+
+static void toycomp_memo_lock(uint64_t *lock)
+{
+    while (__atomic_exchange_n(lock, 1, __ATOMIC_ACQUIRE))
+        while (__atomic_load_n(lock, __ATOMIC_RELAXED))
+            ;
+}
+
+static void toycomp_memo_unlock(uint64_t *lock)
+{
+    __atomic_store_n(lock, 0, __ATOMIC_RELEASE);
+}
+
+static void toycomp_memo_report(void)
+{
+    for (struct toycomp_memo *m = toycomp_memos; m; m = m->next)
+    {
+        uint64_t calls = m->hits + m->misses;
+        fprintf(stderr, "%-24s %12llu hits %12llu misses %12llu evictions %6.1f%% hit rate\n",
+                m->name, (unsigned long long) m->hits, (unsigned long long) m->misses,
+                (unsigned long long) m->evictions, calls ? 100.0 * m->hits / calls : 0.0);
+    }
+}
+
+/* Called with m->lock held. */
+static int toycomp_memo_init(struct toycomp_memo *m)
+{
+    if (m->entries)
+        return 1;
+
+    m->entries = calloc(m->capacity * (2 + m->nargs), sizeof *m->entries);
+    if (!m->entries)
+        return 0;
+
+    toycomp_memo_lock(&toycomp_memos_lock);
+    if (!toycomp_memos && getenv("TOYCOMP_MEMO_STATS"))
+        atexit(toycomp_memo_report);
+    m->next = toycomp_memos;
+    toycomp_memos = m;
+    toycomp_memo_unlock(&toycomp_memos_lock);
+
+    return 1;
+}
+
+static uint64_t toycomp_memo_hash(const uint64_t *args, uint64_t nargs)
+{
+    uint64_t h = nargs;
+    for (uint64_t i = 0; i < nargs; ++i)
+        h = (h ^ args[i]) * 0x9e3779b97f4a7c15u;
+
+    /* Doubles that hold small integers have all-zero low bits, so mix the
+       high bits down (MurmurHash3's finalizer). */
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdu;
+    h ^= h >> 33;
+    h *= 0xc4ceb9fe1a85ec53u;
+    h ^= h >> 33;
+
+    /* Tag 0 marks an empty entry. */
+    return h | 1;
+}
+
+static uint64_t *toycomp_memo_entry(struct toycomp_memo *m, uint64_t index)
+{
+    return m->entries + (index & (m->capacity - 1)) * (2 + m->nargs);
+}
+
+int __toycomp_memo_lookup(struct toycomp_memo *m, const double *args, double *result)
+{
+    uint64_t key[m->nargs ? m->nargs : 1];
+    memcpy(key, args, m->nargs * sizeof *key);
+    uint64_t tag = toycomp_memo_hash(key, m->nargs);
+    int found = 0;
+
+    toycomp_memo_lock(&m->lock);
+    if (m->entries)
+    {
+        for (uint64_t i = 0; i < TOYCOMP_MEMO_PROBES; ++i)
+        {
+            uint64_t *e = toycomp_memo_entry(m, tag + i);
+            if (e[0] == tag && !memcmp(e + 2, key, m->nargs * sizeof *key))
+            {
+                memcpy(result, &e[1], sizeof *result);
+                found = 1;
+                break;
+            }
+        }
+    }
+
+    if (found)
+        m->hits++;
+    else
+        m->misses++;
+    toycomp_memo_unlock(&m->lock);
+
+    return found;
+}
+
+void __toycomp_memo_store(struct toycomp_memo *m, const double *args, double result)
+{
+    uint64_t key[m->nargs ? m->nargs : 1];
+    memcpy(key, args, m->nargs * sizeof *key);
+    uint64_t tag = toycomp_memo_hash(key, m->nargs);
+
+    toycomp_memo_lock(&m->lock);
+    if (toycomp_memo_init(m))
+    {
+        uint64_t *e = NULL;
+        for (uint64_t i = 0; i < TOYCOMP_MEMO_PROBES && !e; ++i)
+        {
+            uint64_t *candidate = toycomp_memo_entry(m, tag + i);
+            if (!candidate[0] ||
+                (candidate[0] == tag && !memcmp(candidate + 2, key, m->nargs * sizeof *key)))
+                e = candidate;
+        }
+
+        if (!e)
+        {
+            e = toycomp_memo_entry(m, tag);
+            m->evictions++;
+        }
+
+        e[0] = tag;
+        memcpy(&e[1], &result, sizeof result);
+        memcpy(e + 2, key, m->nargs * sizeof *key);
+    }
+    toycomp_memo_unlock(&m->lock);
+}
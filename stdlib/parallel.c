@@ -0,0 +1,209 @@
+/*
+ * Runtime for `parallel for`; see Codegen.emit_parallel_for in
+ * toycomp/codegen.py. Link with -pthread.
+ *
+ * A pool of worker threads is started on the first parallel loop. Each loop
+ * splits its iterations evenly between the threads, including the calling
+ * thread. A thread runs its own range a chunk at a time; once that is
+ * exhausted it steals the second half of the remaining range of another
+ * thread, until no thread has work left.
+ *
+ * A parallel loop that starts while the pool is busy, e.g. one nested in
+ * another parallel loop, runs sequentially in the thread that starts it.
+ *
+ *   TOYCOMP_NUM_THREADS   the number of threads (default: one per CPU)
+ */
+#define _POSIX_C_SOURCE 200112L
+
+#include <pthread.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <unistd.h>
+
+typedef void (*toycomp_parallel_body)(void *env, const double *values,
+                                      int64_t begin, int64_t end);
+
+struct toycomp_range
+{
+    pthread_mutex_t lock;
+    int64_t begin;
+    int64_t end;
+};
+
+static struct
+{
+    pthread_mutex_t lock;
+    pthread_cond_t start;
+    pthread_cond_t done;
+    int nthreads;
+    struct toycomp_range *ranges;
+    uint64_t generation;
+    int running;
+
+    toycomp_parallel_body body;
+    void *env;
+    const double *values;
+    int64_t grain;
+} toycomp_pool = {
+    .lock = PTHREAD_MUTEX_INITIALIZER,
+    .start = PTHREAD_COND_INITIALIZER,
+    .done = PTHREAD_COND_INITIALIZER,
+};
+
+static pthread_mutex_t toycomp_pool_busy = PTHREAD_MUTEX_INITIALIZER;
+static pthread_once_t toycomp_pool_once = PTHREAD_ONCE_INIT;
+
+static int toycomp_take(int self, int64_t *begin, int64_t *end)
+{
+    struct toycomp_range *r = &toycomp_pool.ranges[self];
+    int found = 0;
+
+    pthread_mutex_lock(&r->lock);
+    if (r->begin < r->end)
+    {
+        *begin = r->begin;
+        *end = r->end - r->begin > toycomp_pool.grain ? r->begin + toycomp_pool.grain : r->end;
+        r->begin = *end;
+        found = 1;
+    }
+    pthread_mutex_unlock(&r->lock);
+
+    return found;
+}
+
+static int toycomp_steal(int self)
+{
+    int n = toycomp_pool.nthreads;
+
+    for (int i = 1; i < n; ++i)
+    {
+        struct toycomp_range *victim = &toycomp_pool.ranges[(self + i) % n];
+        int64_t begin = 0, end = 0;
+
+        pthread_mutex_lock(&victim->lock);
+        if (victim->begin < victim->end)
+        {
+            end = victim->end;
+            begin = end - (end - victim->begin + 1) / 2;
+            victim->end = begin;
+        }
+        pthread_mutex_unlock(&victim->lock);
+
+        if (begin < end)
+        {
+            struct toycomp_range *own = &toycomp_pool.ranges[self];
+            pthread_mutex_lock(&own->lock);
+            own->begin = begin;
+            own->end = end;
+            pthread_mutex_unlock(&own->lock);
+            return 1;
+        }
+    }
+
+    return 0;
+}
+
+static void toycomp_work(int self)
+{
+    int64_t begin, end;
+
+    do
+    {
+        while (toycomp_take(self, &begin, &end))
+            toycomp_pool.body(toycomp_pool.env, toycomp_pool.values, begin, end);
+    }
+    while (toycomp_steal(self));
+}
+
+static void *toycomp_worker(void *arg)
+{
+    int self = (int) (intptr_t) arg;
+    uint64_t seen = 0;
+
+    for (;;)
+    {
+        pthread_mutex_lock(&toycomp_pool.lock);
+        while (toycomp_pool.generation == seen)
+            pthread_cond_wait(&toycomp_pool.start, &toycomp_pool.lock);
+        seen = toycomp_pool.generation;
+        pthread_mutex_unlock(&toycomp_pool.lock);
+
+        toycomp_work(self);
+
+        pthread_mutex_lock(&toycomp_pool.lock);
+        if (--toycomp_pool.running == 0)
+            pthread_cond_signal(&toycomp_pool.done);
+        pthread_mutex_unlock(&toycomp_pool.lock);
+    }
+
+    return NULL;
+}
+
+static void toycomp_pool_init(void)
+{
+    const char *env = getenv("TOYCOMP_NUM_THREADS");
+    long n = env ? atol(env) : sysconf(_SC_NPROCESSORS_ONLN);
+    if (n < 1)
+        n = 1;
+
+    toycomp_pool.ranges = calloc(n, sizeof *toycomp_pool.ranges);
+    if (!toycomp_pool.ranges)
+        n = 0;
+
+    for (long i = 0; i < n; ++i)
+        pthread_mutex_init(&toycomp_pool.ranges[i].lock, NULL);
+
+    /* Thread 0 is whichever thread starts a loop. */
+    toycomp_pool.nthreads = 1;
+    for (long i = 1; i < n; ++i)
+    {
+        pthread_t thread;
+        if (pthread_create(&thread, NULL, toycomp_worker, (void *) (intptr_t) i) != 0)
+            break;
+        pthread_detach(thread);
+        toycomp_pool.nthreads++;
+    }
+}
+
+void __toycomp_parallel_for(toycomp_parallel_body body, void *env,
+                            const double *values, int64_t count)
+{
+    if (count <= 0)
+        return;
+
+    pthread_once(&toycomp_pool_once, toycomp_pool_init);
+
+    if (toycomp_pool.nthreads <= 1 || pthread_mutex_trylock(&toycomp_pool_busy) != 0)
+    {
+        body(env, values, 0, count);
+        return;
+    }
+
+    int n = toycomp_pool.nthreads;
+    for (int i = 0; i < n; ++i)
+    {
+        toycomp_pool.ranges[i].begin = count * i / n;
+        toycomp_pool.ranges[i].end = count * (i + 1) / n;
+    }
+
+    /* Small chunks balance the load; 8 per thread keeps stealing rare. */
+    toycomp_pool.grain = count / (n * 8) > 0 ? count / (n * 8) : 1;
+    toycomp_pool.body = body;
+    toycomp_pool.env = env;
+    toycomp_pool.values = values;
+
+    pthread_mutex_lock(&toycomp_pool.lock);
+    toycomp_pool.running = n - 1;
+    toycomp_pool.generation++;
+    pthread_cond_broadcast(&toycomp_pool.start);
+    pthread_mutex_unlock(&toycomp_pool.lock);
+
+    toycomp_work(0);
+
+    pthread_mutex_lock(&toycomp_pool.lock);
+    while (toycomp_pool.running)
+        pthread_cond_wait(&toycomp_pool.done, &toycomp_pool.lock);
+    pthread_mutex_unlock(&toycomp_pool.lock);
+
+    pthread_mutex_unlock(&toycomp_pool_busy);
+}
@@ -0,0 +1,86 @@
+import array
+import ctypes
+import re
+
+import pytest
+
+import toycomp
+from toycomp import ast, jit, parser, tiered
+from toycomp.driver import Driver
+from toycomp.frontend import CompileError, check
+
+SOURCE = '''
+def binary : 1 (x y) y;
+extern buffer_length(b: buffer);
+
+def scale(src: buffer dst: buffer k)
+    let n = buffer_length(src) in
+        (parallel for i = 0, i < n in dst[i] = src[i] * k) : n;
+
+def total(b: buffer)
+    let t = 0 in (for i = 0, i < buffer_length(b) in t = t + b[i]) : t;
+'''
+
+
+def buffers():
+    src = array.array('d', [1, 2, 3.5])
+    dst = array.array('d', [0] * 3)
+    return src, dst, jit.Buffer.from_buffer(src), jit.Buffer.from_buffer(dst)
+
+
+def test_parse_index():
+    [expr] = parser.parse('b[i + 1] = b[i]\n')
+
+    assert isinstance(expr, ast.BinaryExpr)
+    assert isinstance(expr.lhs, ast.IndexExpr)
+    assert isinstance(expr.lhs.index, ast.BinaryExpr)
+    assert isinstance(expr.rhs, ast.IndexExpr)
+
+
+def test_jit():
+    program = toycomp.compile(SOURCE)
+    src, dst, src_buffer, dst_buffer = buffers()
+
+    assert program.scale(src_buffer, dst_buffer, 2) == 3
+    assert dst.tolist() == [2, 4, 7]
+    assert program.total(src_buffer) == 6.5
+
+
+def test_interpreter():
+    _, dst, src_buffer, dst_buffer = buffers()
+
+    with tiered.TieredEngine(mode='interpret') as engine:
+        engine.load(check(SOURCE + 'def at(b: buffer i) b[i];'))
+
+        assert engine.call('scale', src_buffer, dst_buffer, 2) == 3
+        assert dst.tolist() == [2, 4, 7]
+
+        with pytest.raises(tiered.ExecutionError, match='out of bounds'):
+            engine.call('at', dst_buffer, 3)
+        with pytest.raises(tiered.ExecutionError, match='index nan out of bounds'):
+            engine.call('at', dst_buffer, float('nan'))
+
+        # Native code passes a pointer to the buffer instead.
+        assert engine.call('at', ctypes.pointer(dst_buffer), 1) == 4
+
+
+def test_bounds_checks_are_optional():
+    source = 'def at(b: buffer i) b[i];'
+
+    assert 'call void @"__toycomp_bounds_error"' in str(Driver(None).compile(source))
+    assert '__toycomp_bounds_error' not in str(Driver(None, bounds_check=False).compile(source))
+
+
+@pytest.mark.parametrize('source, message', [
+    ('def f(b: buffer) b + b;', "operator '+' cannot be applied to buffers"),
+    ('def f(x) x[0];', 'only buffers can be indexed'),
+    ('def f(b: buffer) b[b];', 'index must have type double'),
+])
+def test_type_errors(source, message):
+    with pytest.raises(CompileError, match=re.escape(message)):
+        toycomp.compile(source)
+
+
+def test_from_buffer_needs_doubles():
+    with pytest.raises(TypeError):
+        jit.Buffer.from_buffer(array.array('i', [1]))
@@ -0,0 +1,67 @@
+import re
+
+from toycomp import optimizer
+from toycomp.driver import Driver
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def total(n)
+    let t = 0 in
+        (for i = 0, i < n in
+            t = t + i) :
+        t;
+
+def fill(n) parallel for i = 0, i < n in i * 2;
+
+def mainf() total(10) : fill(10);
+'''
+
+
+def compile(**kwargs):
+    return Driver(None, debug=True, **kwargs).compile(SOURCE, name='prog.kal')
+
+
+def nodes(text, kind):
+    """
+    Get the fields of each metadata node of kind `kind` in `text` as a dict.
+    """
+    return [dict(re.findall(r'(\w+): ("[^"]*"|[^,]+)', m.group(1)))
+            for m in re.finditer(r'!{}\((.*)\)$'.format(kind), text, re.MULTILINE)]
+
+
+def test_functions_and_variables_described():
+    text = str(compile())
+
+    assert nodes(text, 'DICompileUnit')
+    [file] = nodes(text, 'DIFile')
+    assert file['filename'] == '"prog.kal"'
+
+    # The outlined body of the parallel loop gets a subprogram of its own.
+    subprograms = {sp['name'] for sp in nodes(text, 'DISubprogram')}
+    assert {'"total"', '"fill"', '"fill.parallel"', '"mainf"'} <= subprograms
+
+    variables = nodes(text, 'DILocalVariable')
+    assert {'"n"', '"t"', '"i"'} <= {var['name'] for var in variables}
+    assert any(var['name'] == '"n"' and var.get('arg') == '1' for var in variables)
+
+
+def test_instructions_have_source_lines():
+    text = str(compile())
+
+    assert re.search(r'fadd double .*!dbg !\d+', text)
+    # `t = t + i` is on line 7.
+    assert any(loc['line'] == '7' and loc['column'] == '13' for loc in nodes(text, 'DILocation'))
+
+
+def test_optimized_module_verifies():
+    drv = Driver(None, debug=True, opt_level=2)
+    llmod = drv.optimize(optimizer.parse_module(compile(opt_level=2)))
+    llmod.verify()
+
+    obj = drv.target_machine.emit_object(llmod)
+    assert b'.debug_line' in obj
+
+
+def test_no_debug_info_by_default():
+    assert 'DISubprogram' not in str(Driver(None).compile(SOURCE))
@@ -0,0 +1,68 @@
+import io
+import json
+
+import pytest
+
+from toycomp import compilepass, nameres, parser, typechecker, user_op_rewriter
+from toycomp.diagnostics import (
+    DiagnosticsEngine,
+    DiagnosticJSONPrinter,
+    DiagnosticPrinter,
+    ErrorLimitReached
+)
+
+SOURCE = '''
+def f()
+    a + b + c + d
+'''
+
+
+def run_passes(engine, src):
+    pm = compilepass.PassManager([
+        user_op_rewriter.UserOpRewriter(),
+        nameres.NameResolver(engine),
+        typechecker.Typechecker(engine),
+    ])
+    return all([pm.visit(expr) for expr in parser.parse(src)])
+
+
+def test_printer_writes_on_finish():
+    stream = io.StringIO()
+    engine = DiagnosticsEngine(DiagnosticPrinter(stream))
+
+    assert not run_passes(engine, SOURCE)
+    assert stream.getvalue() == ''
+
+    engine.consumer.finish()
+    output = stream.getvalue()
+    assert output.count('undeclared symbol') == 4
+    assert output.rstrip().endswith('errors generated.')
+
+
+def test_error_limit_stops_pipeline():
+    stream = io.StringIO()
+    engine = DiagnosticsEngine(DiagnosticPrinter(stream), max_errors=2)
+
+    with pytest.raises(ErrorLimitReached):
+        run_passes(engine, SOURCE)
+
+    engine.consumer.finish()
+    output = stream.getvalue()
+    assert engine.error_count == 2
+    assert output.count('undeclared symbol') == 2
+    assert 'too many errors emitted' in output
+
+
+def test_json_output():
+    stream = io.StringIO()
+    engine = DiagnosticsEngine(DiagnosticJSONPrinter(stream))
+
+    assert not run_passes(engine, SOURCE)
+    engine.consumer.finish()
+
+    result = json.loads(stream.getvalue())
+    assert result['error_count'] == len(result['diagnostics'])
+    first = result['diagnostics'][0]
+    assert first['severity'] == 'error'
+    assert first['message'] == "undeclared symbol 'a'"
+    assert (first['line'], first['column']) == (3, 4)
@@ -0,0 +1,51 @@
+import pytest
+
+import toycomp
+from toycomp import embed, types
+from toycomp.frontend import CompileError
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+
+def sum(n)
+    let total = 0 in
+        (for i = 0, i < n, 1 in total = total + i * i) : total;
+
+extern putchard(c);
+'''
+
+
+def test_functions_are_native_callables():
+    program = toycomp.compile(SOURCE)
+
+    assert program.fib(20) == 6765
+    assert program['sum'](10) == 285
+    assert 'fib' in program and 'putchard' not in program
+    assert program.types['sum'] is types.function_type(types.double_ty, [types.double_ty])
+
+    with pytest.raises(AttributeError):
+        program.missing
+    with pytest.raises(TypeError):
+        program.fib()
+
+
+def test_cache():
+    program = toycomp.compile(SOURCE, opt_level=1)
+
+    assert toycomp.compile(SOURCE, opt_level=1) is program
+    assert toycomp.compile(SOURCE, opt_level=0) is not program
+
+    embed.clear_cache()
+    assert toycomp.compile(SOURCE, opt_level=1) is not program
+    assert program.fib(10) == 55
+
+
+def test_errors():
+    with pytest.raises(CompileError, match="undeclared symbol 'n'"):
+        toycomp.compile('def f(x) n;')
+    with pytest.raises(CompileError, match='top-level expressions'):
+        toycomp.compile('1 + 2\n')
+    with pytest.raises(CompileError):
+        toycomp.compile('def f(x')
@@ -0,0 +1,65 @@
+import io
+
+import llvmlite.binding as llvm
+import pytest
+
+from toycomp import emit, target
+from toycomp.driver import Driver
+
+SOURCE = '''
+extern putchard(ch);
+
+def twice(x) x + x;
+
+def mainf() putchard(twice(32));
+'''
+
+
+@pytest.fixture
+def module():
+    return Driver(None).compile(SOURCE)
+
+
+def test_write_ir_matches_module_text(module):
+    stream = io.StringIO()
+    emit.write_ir(module, stream)
+
+    assert stream.getvalue().rstrip('\n') == str(module).rstrip('\n')
+
+
+def test_write_ir_matches_module_text_with_metadata():
+    module = Driver(None, debug=True).compile(SOURCE)
+    assert module.namedmetadata and module.metadata
+
+    stream = io.StringIO()
+    emit.write_ir(module, stream)
+
+    assert stream.getvalue().rstrip('\n') == str(module).rstrip('\n')
+
+
+def test_emit_bitcode(module, tmp_path):
+    path = tmp_path / 'out.bc'
+    emit.emit(module, str(path), fmt='bc')
+
+    llmod = llvm.parse_bitcode(path.read_bytes())
+    assert {f.name for f in llmod.functions} == {'putchard', 'twice', 'mainf'}
+
+
+def test_emit_object(module, tmp_path):
+    path = tmp_path / 'out.o'
+    emit.emit(module, str(path), fmt='obj', target_machine=target.create_target_machine())
+
+    assert path.stat().st_size > 0
+
+
+def test_emit_object_requires_target_machine(module, tmp_path):
+    with pytest.raises(ValueError):
+        emit.emit(module, str(tmp_path / 'out.o'), fmt='obj')
+
+
+def test_driver_output_file(tmp_path, capsys):
+    path = tmp_path / 'out.ll'
+    Driver(None, opt_level=2).run(SOURCE, output=str(path))
+
+    assert capsys.readouterr().out == ''
+    assert 'define double @twice' in path.read_text()
@@ -0,0 +1,63 @@
+import llvmlite.binding as llvm
+
+from toycomp.driver import Driver
+
+SOURCE = '''
+def small(x) x + 1;
+
+def fact(n acc)
+    if n < 2 then acc else fact(n - 1, acc * n);
+
+def loop(n)
+    for i = 0, i < n, 1 in small(i);
+'''
+
+
+def compile_instrumented(triple=None, **kwargs):
+    return str(Driver(triple, instrument=True, **kwargs).compile(SOURCE))
+
+
+def test_instrument_registers_records():
+    text = compile_instrumented()
+
+    for name in ['small', 'fact', 'loop']:
+        assert '@"__instr.{}" = internal global'.format(name) in text
+        assert 'define internal double @"{}.impl"'.format(name) in text
+
+    assert '@"llvm.global_ctors"' in text
+    assert 'call void @"__toycomp_instrument_register"' in text
+
+
+def test_recursive_calls_bypass_wrapper():
+    text = compile_instrumented()
+    impl = text[text.index('define internal double @"fact.impl"'):]
+    impl = impl[:impl.index('\n}')]
+
+    assert 'call double @"fact.impl"' in impl
+    assert 'call double @"fact"' not in impl
+
+
+def test_small_functions_are_not_timed():
+    text = compile_instrumented('x86_64-unknown-linux-gnu')
+    small = text[text.index('define external double @"small"'):]
+    small = small[:small.index('\n}')]
+    loop = text[text.index('define external double @"loop"'):]
+    loop = loop[:loop.index('\n}')]
+
+    assert 'readcyclecounter' not in small
+    assert 'call i64 @"llvm.readcyclecounter"' in loop
+
+
+def test_ticks_use_runtime_off_x86():
+    text = compile_instrumented('aarch64-unknown-linux-gnu', instrument_threshold=0)
+
+    assert 'readcyclecounter' not in text
+    assert 'call i64 @"__toycomp_instrument_ticks"' in text
+
+
+def test_combines_with_profile_generate():
+    text = compile_instrumented(profile_generate=True)
+
+    assert text.count('@"llvm.global_ctors" = appending global') == 1
+    ctors = llvm.parse_assembly(text).get_global_variable('llvm.global_ctors')
+    assert str(ctors.global_value_type) == '[2 x { i32, ptr, ptr }]'
@@ -0,0 +1,82 @@
+import llvmlite.binding as llvm
+import pytest
+
+from toycomp import driver, linker
+
+OPS = '''
+def binary : 1 (x y) y;
+
+def square(x) x * x;
+'''
+
+MAIN = '''
+extern binary : 1 (x y);
+extern square(x);
+
+def mainf()
+    square(3) : square(4);
+'''
+
+
+@pytest.fixture
+def units(tmp_path):
+    ops = tmp_path / 'ops.kal'
+    ops.write_text(OPS)
+    main = tmp_path / 'main.kal'
+    main.write_text(MAIN)
+    return str(ops), str(main)
+
+
+def test_separate_compilation_and_lto(units, tmp_path):
+    ops, main = units
+    driver.main(['-c', ops, main])
+
+    ops_bc = ops[:-len('.kal')] + '.bc'
+    main_bc = main[:-len('.kal')] + '.bc'
+
+    # Each unit only defines its own functions.
+    assert linker.load_module(main_bc).get_function('square').is_declaration
+
+    output = tmp_path / 'prog.ll'
+    driver.main([ops_bc, main_bc, '-O2', '-o', str(output)])
+
+    llmod = llvm.parse_assembly(output.read_text())
+    mainf = llmod.get_function('mainf')
+    assert not mainf.is_declaration
+    # `square` and `binary:` are inlined across the module boundary.
+    assert 'call' not in str(mainf)
+    assert '1.6' in str(mainf)
+
+
+def test_link_sources_directly(units, tmp_path):
+    output = tmp_path / 'prog.bc'
+    driver.main(list(units) + ['--emit', 'bc', '-o', str(output)])
+
+    llmod = llvm.parse_bitcode(output.read_bytes())
+    assert not llmod.get_function('square').is_declaration
+    assert not llmod.get_function('mainf').is_declaration
+
+
+def test_duplicate_definition(units, tmp_path):
+    ops, _ = units
+    with pytest.raises(SystemExit) as excinfo:
+        driver.main([ops, ops, '-o', str(tmp_path / 'prog.ll')])
+
+    assert 'multiply defined' in str(excinfo.value)
+
+
+def test_compile_only_keeps_input(units, tmp_path, capsys):
+    ops, _ = units
+    driver.main(['-c', ops])
+    ops_bc = ops[:-len('.kal')] + '.bc'
+    original = open(ops_bc, 'rb').read()
+
+    with pytest.raises(SystemExit):
+        driver.main(['-c', '-O2', ops_bc])
+
+    assert 'would overwrite it' in capsys.readouterr().err
+    assert open(ops_bc, 'rb').read() == original
+
+    # Written elsewhere, a .bc input can be optimized.
+    driver.main(['-c', '-O2', ops_bc, '-o', str(tmp_path / 'ops.opt.bc')])
+    assert linker.load_module(str(tmp_path / 'ops.opt.bc')).get_function('square')
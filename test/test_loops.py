@@ -0,0 +1,95 @@
+import array
+
+import pytest
+
+import toycomp
+from toycomp import ast, jit, loops, optimizer
+from toycomp.driver import Driver
+from toycomp.frontend import check
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def count(n)
+    let c = 0 in (for i = 0, i < n in c = c + 1) : c;
+
+def last(n)
+    let v = 0 - 1 in (for i = 3, i < n, 4 in v = i) : v;
+
+def huge(n)
+    let c = 0 in (for i = 0, i < n, 4503599627370496 in c = c + 1) : c;
+
+def fill(b: buffer n) for i = 0, i < n in b[i] = i * 2;
+'''
+
+
+class _Loops(ast.ASTRewriter):
+    def __init__(self):
+        self.found = []
+
+    def visit_ForExpr(self, expr):
+        self.found.append(expr)
+        return super().visit_ForExpr(expr)
+
+
+def loops_of(source):
+    collector = _Loops()
+    for node in check(source):
+        collector.visit(node)
+    return collector.found
+
+
+def reference(start, bound, step):
+    x, c, last = start, 0, -1
+    while x < bound:
+        c, last = c + 1, x
+        x += step
+    return c, last
+
+
+@pytest.mark.parametrize('body, counted', [
+    ('for i = 0, i < n in i', True),
+    ('for i = 1, i < n * 2 + m, 3 in i', True),
+    ('let k = n in (for i = 0, i < k in m = m + i)', True),
+    ('for i = 0, i < n, 0.5 in i', False),
+    ('for i = m, i < n in i', False),
+    ('for i = 0, i < n, 0 in i', False),
+    ('for i = 0, n < i in i', False),
+    ('for i = 0, i < g(n) in i', False),
+    ('for i = 0, i < n in n = n - 1', False),
+    ('for i = 0, i < n in i = i + 1', False),
+    ('parallel for i = 0, i < n in i', False),
+])
+def test_recognize(body, counted):
+    [loop, *_] = loops_of('def g(x) x;\ndef f(n m) {};'.format(body))
+    assert (loops.counted_loop(loop) is not None) == counted
+
+
+@pytest.mark.parametrize('opt_level', [1, 3])
+def test_trip_counts(opt_level):
+    program = toycomp.compile(SOURCE, opt_level=opt_level)
+
+    for bound in [float('-inf'), -3, 0, 0.5, 1, 3, 7, 7.5, 100]:
+        assert program.count(bound) == reference(0, bound, 1)[0]
+        assert program.last(bound) == reference(3, bound, 4)[1]
+
+    # Beyond 2**53 the loop falls back to the general lowering.
+    assert program.huge(3e16) == reference(0, 3e16, 2 ** 52)[0] == 7
+
+
+def test_counted_loop_vectorizes():
+    drv = Driver(None, opt_level=3, bounds_check=False)
+    llmod = drv.optimize(drv.compile(SOURCE))
+
+    assert [loop.function for loop in optimizer.vectorized_loops(llmod)] == ['fill']
+
+    drv = Driver(None, opt_level=3, bounds_check=False, count_loops=False)
+    assert not optimizer.vectorized_loops(drv.optimize(drv.compile(SOURCE)))
+
+
+def test_buffer_indexed_by_counter():
+    program = toycomp.compile(SOURCE)
+    data = array.array('d', [0] * 9)
+
+    program.fill(jit.Buffer.from_buffer(data), 9)
+    assert data.tolist() == [i * 2 for i in range(9)]
@@ -0,0 +1,83 @@
+import pytest
+
+import toycomp
+from toycomp import jit, parser, tiered
+from toycomp.codegen import MEMO_CAPACITY
+from toycomp.driver import Driver
+from toycomp.frontend import CompileError, check
+
+SOURCE = '''
+memo def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+
+def binary : 1 (x y) y;
+
+memo def paths(x y)
+    if x < 1 then 1 else if y < 1 then 1 else
+        let sum = paths(x - 1, y) in
+            (sum = sum + paths(x, y - 1)) : sum;
+'''
+
+
+def test_parse_memo():
+    [func] = parser.parse('memo def f(x) x;')
+
+    assert func.memo and func.proto.name == 'f'
+
+
+def test_memo_jit():
+    program = toycomp.compile(SOURCE)
+
+    # Without the cache these would take exponential time.
+    assert program.fib(70) == 190392490709135
+    assert program.paths(20, 20) == 137846528820
+
+    stats = {s.name: s for s in jit.memo_stats()}
+    assert stats['fib'].misses >= 71
+    assert stats['fib'].hits >= 68
+
+
+def test_memo_jit_evicts():
+    program = toycomp.compile('''
+memo def spread(x) x;
+def binary : 1 (x y) y;
+def fill(n) (for i = 0, i < n in spread(i)) : 0;
+''')
+    program.fill(3 * MEMO_CAPACITY)
+
+    # The JIT uses the same fixed-size table as stdlib/memo.c.
+    [stats] = [s for s in jit.memo_stats() if s.name == 'spread']
+    assert stats.misses == 3 * MEMO_CAPACITY and stats.hits == 0
+    assert stats.evictions >= 2 * MEMO_CAPACITY
+
+
+def test_memo_interpreter():
+    with tiered.TieredEngine(mode='interpret') as engine:
+        engine.load(check(SOURCE))
+
+        assert engine.call('fib', 70) == 190392490709135
+        assert engine.entry('fib').calls == 71
+
+
+def test_memo_emits_cache_lookup():
+    text = str(Driver(None).compile(SOURCE))
+
+    assert '@"fib.memo" = internal global' in text
+    assert 'call i32 @"__toycomp_memo_lookup"' in text
+    assert 'call void @"__toycomp_memo_store"' in text
+
+
+@pytest.mark.parametrize('source, message', [
+    ('extern putchard(c); memo def f(x) putchard(x);', "calls 'putchard', which is not pure"),
+    ('extern putchard(c); def g(x) putchard(x); memo def f(x) g(x);', "calls 'g', which is not pure"),
+    ('memo def f(b: buffer) b[0];', 'must take and return only double values'),
+    ('memo def f(x) let g = f in g(x);', 'calls a function value'),
+])
+def test_memo_rejects_impure_functions(source, message):
+    with pytest.raises(CompileError, match=message):
+        toycomp.compile(source)
+
+
+def test_pure_functions_can_be_called():
+    program = toycomp.compile('def sq(x) x * x; memo def f(x) sq(x) + 1;')
+
+    assert program.f(3) == 10
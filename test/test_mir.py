@@ -0,0 +1,150 @@
+import ctypes
+
+import llvmlite.binding as llvm
+import pytest
+
+from toycomp import ast, mir, mirgen, miropt
+from toycomp.codegen import Codegen
+from toycomp.driver import Driver
+from toycomp.frontend import check
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def count(n)
+    let c = 0 in (for i = 0, i < n in c = c + 1) : c;
+
+def halves(n)
+    let t = 0 in (for i = 0, i < n, 0.5 in t = t + i) : t;
+
+def pick(x) if x < 0 then 0 - x else if 1 < 2 then x * 2 else x;
+
+def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+
+def twice(x y) (x + y) * (y + x) + fib(x);
+
+def stepper(n) let s = 0 in (for i = 0, i < n, (i = i + 1) in s = s + i) + s;
+
+def loops(x) (for i = 0, i < 5 in 0) + (for j = x, j < 5 in 0) + x;
+
+def looptest(x y) if (for i = 1, i < 5 in 0) then 0 else x;
+'''
+
+
+def lower(source, name, *, optimize=True):
+    for node in check(source):
+        if isinstance(node, ast.Function) and node.proto.name == name:
+            func = mirgen.MIRGen().lower(node)
+            if optimize:
+                assert miropt.default_passes().visit(func)
+            return func
+
+
+def ops(func):
+    return [instr.op for instr in func.instructions() if isinstance(instr, mir.Instr)]
+
+
+def test_variables_become_phis():
+    func = lower(SOURCE, 'halves', optimize=False)
+
+    assert [phi.name for phi in func.instructions() if isinstance(phi, mir.Phi)] == ['i', 'n', 't']
+
+    # The loop doesn't assign n, so its phi is a copy.
+    miropt.CopyPropagation().visit(func)
+    assert [phi.name for phi in func.instructions() if isinstance(phi, mir.Phi)] == ['i', 't']
+
+
+def test_constant_branch_folded():
+    func = lower('def f(x) if 1 < 2 then x * 3 else x * 4;', 'f')
+
+    assert len(func.blocks) == 1
+    assert ops(func) == ['fmul', 'ret']
+    assert func.entry.instrs[0].operands[1].value == 3.0
+
+
+def test_common_subexpressions():
+    func = lower('def f(x y) (x + y) * (y + x) + (if x < y then x + y else 0);', 'f')
+
+    assert ops(func).count('fadd') == 2
+
+
+def test_pure_calls_merged():
+    source = 'def sq(x) x * x;\ndef f(x) sq(x) + sq(x);'
+    assert ops(lower(source, 'f')).count('call') == 1
+
+
+def test_dead_code():
+    func = lower('def g(x) x;\ndef f(x) let a = x * x in let b = g(a) in x;', 'f')
+
+    # The call stays: the typechecker doesn't know that g returns.
+    assert ops(func) == ['fmul', 'call', 'ret']
+    assert ops(lower('def f(x) let a = x * x in x;', 'f')) == ['ret']
+
+
+def test_phis_after_loops():
+    # Trivial phis replaced in the same round used to make the phi of j,
+    # which has a real second input, look trivial too.
+    func = lower('def f(x) (for i = 0, i < 5 in 0) + (for j = x, j < 5 in 0);', 'f')
+
+    [j] = [phi for phi in func.instructions() if isinstance(phi, mir.Phi) and phi.name == 'j']
+    assert func.params[0] in j.operands
+
+
+def test_integer_identities():
+    func = lower(SOURCE, 'count')
+
+    assert 'sub' not in ops(func) and 'udiv' not in ops(func)
+
+
+def build(source, **kwargs):
+    driver = Driver(None, **kwargs)
+    llmod = driver.optimize(driver.compile(source))
+    engine = llvm.create_mcjit_compiler(llmod, driver.target_machine)
+    engine.finalize_object()
+    return engine, str(llmod)
+
+
+@pytest.mark.parametrize('opt_level', [0, 2])
+def test_same_results(opt_level):
+    engine, _ = build(SOURCE, opt_level=opt_level)
+    mir_engine, text = build(SOURCE, opt_level=opt_level, mir=True)
+    assert 'alloca' not in text
+
+    cases = {
+        'count': [(-1,), (0,), (7.5,), (100,)],
+        'halves': [(0,), (3,), (4.2,)],
+        'pick': [(-3,), (5,)],
+        'fib': [(15,)],
+        'twice': [(2, 3), (5, -1)],
+        'stepper': [(10,)],
+        'loops': [(1,), (9,)],
+        'looptest': [(1, 2)],
+    }
+    for name, calls in cases.items():
+        for args in calls:
+            results = []
+            for e in (engine, mir_engine):
+                cfunc = ctypes.CFUNCTYPE(ctypes.c_double, *[ctypes.c_double] * len(args))
+                results.append(cfunc(e.get_function_address(name))(*args))
+            assert results[0] == results[1], (name, args)
+
+
+@pytest.mark.parametrize('source', [
+    'def f(b: buffer) b[0];',
+    'def f(b: buffer n) parallel for i = 0, i < n in b[i] = i;',
+    'memo def f(x) x;',
+])
+def test_unsupported_fall_back(source):
+    [node] = check(source)
+    with pytest.raises(mirgen.Unsupported):
+        mirgen.MIRGen().lower(node)
+
+    cg = Codegen()
+    assert mirgen.generate(cg, node)
+    assert 'define external double @"f"' in str(cg.module)
+
+
+def test_redefinition():
+    driver = Driver(None, mir=True)
+    with pytest.raises(SystemExit):
+        driver.compile('def f(x) x;\ndef f(x) x + 1;')
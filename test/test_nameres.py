@@ -0,0 +1,57 @@
+import io
+
+from toycomp import ast, parser
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
+from toycomp.nameres import NameResolver
+
+
+def resolve(source):
+    stream = io.StringIO()
+    resolver = NameResolver(DiagnosticsEngine(DiagnosticPrinter(stream)))
+    nodes = list(parser.parse(source))
+    ok = all([resolver.visit(node) for node in nodes])
+    resolver.diags.consumer.finish()
+    return ok, nodes, stream.getvalue()
+
+
+def variables(node):
+    if isinstance(node, ast.VariableExpr):
+        yield node
+    for name, value in vars(node).items():
+        if name == 'decl':
+            continue
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, (ast.Expr, ast.Stmt)) and child is not node:
+                yield from variables(child)
+
+
+def test_locals_get_slots():
+    ok, [func], _ = resolve('def f(a b) let c = a in (let a = b in a + c) + a;')
+    assert ok
+    assert func.slot_count == 4
+
+    refs = [(v.name, v.slot) for v in variables(func.body)]
+    assert refs == [('a', 0), ('b', 1), ('a', 3), ('c', 2), ('a', 0)]
+
+
+def test_globals_have_no_slot():
+    ok, [_, func], _ = resolve('extern g(x); def f(x) g(x);')
+    assert ok
+
+    [callee, arg] = variables(func.body)
+    assert callee.slot is None and isinstance(callee.decl, ast.Prototype)
+    assert arg.slot == 0
+
+
+def test_scope_exit_restores_shadowed_names():
+    ok, [func], _ = resolve('def f(x) (for x = 1, x < 10 in x) + x;')
+    assert ok
+
+    [end, body, outer] = variables(func.body)
+    assert [end.slot, body.slot, outer.slot] == [1, 1, 0]
+
+
+def test_redeclaration_in_same_scope():
+    ok, _, output = resolve('def f(x x) x;')
+    assert not ok
+    assert "redeclaration of 'x' in same scope" in output
@@ -0,0 +1,60 @@
+import os
+
+from toycomp import objcache
+from toycomp.driver import Driver
+from toycomp.tiered import TieredEngine
+
+SOURCE = '''
+def square(x) x * x;
+
+def mainf() square(7);
+'''
+
+
+def run(cache):
+    with TieredEngine(mode='jit', cache=cache) as engine:
+        engine.load(Driver(None).check(SOURCE))
+        return engine.call('mainf')
+
+
+def test_second_run_loads_from_cache(tmp_path):
+    cache = objcache.ObjectCache(str(tmp_path))
+    assert run(cache) == 49
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert len(os.listdir(tmp_path)) == 1
+
+    assert run(cache) == 49
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_options():
+    options = dict(opt_level=2, triple='x86_64-unknown-linux-gnu', cpu='', features='')
+    key = objcache.ObjectCache.key('ir', **options)
+
+    assert objcache.ObjectCache.key('ir', **options) == key
+    assert objcache.ObjectCache.key('other ir', **options) != key
+    assert objcache.ObjectCache.key('ir', **dict(options, opt_level=3)) != key
+    assert objcache.ObjectCache.key('ir', **dict(options, cpu='skylake')) != key
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = objcache.ObjectCache(str(tmp_path), max_size=350)
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.store(key, bytes(100))
+        os.utime(tmp_path / (key + '.o'), (i, i))
+
+    # Using `a` makes `b` the least recently used.
+    assert cache.load('a') is not None
+    cache.store('d', bytes(100))
+
+    assert sorted(os.listdir(tmp_path)) == ['a.o', 'c.o', 'd.o']
+
+
+def test_unwritable_cache_is_ignored(tmp_path):
+    path = tmp_path / 'file'
+    path.write_text('')
+
+    cache = objcache.ObjectCache(str(path / 'cache'))
+    assert run(cache) == 49
+    assert run(cache) == 49
+    assert cache.hits == 0
@@ -0,0 +1,71 @@
+import llvmlite.binding as llvm
+from llvmlite import ir
+
+from toycomp import optimizer, target
+
+
+X86_64 = 'x86_64-unknown-linux-gnu'
+
+# a[i] = b[i] * 2.0 for i in [0, n)
+SCALE_LOOP = '''
+define void @scale(ptr noalias %a, ptr noalias %b, i64 %n) {
+entry:
+  %nonempty = icmp sgt i64 %n, 0
+  br i1 %nonempty, label %loop, label %exit
+loop:
+  %i = phi i64 [0, %entry], [%i.next, %loop]
+  %src = getelementptr double, ptr %b, i64 %i
+  %dst = getelementptr double, ptr %a, i64 %i
+  %val = load double, ptr %src
+  %scaled = fmul double %val, 2.0
+  store double %scaled, ptr %dst
+  %i.next = add i64 %i, 1
+  %done = icmp eq i64 %i.next, %n
+  br i1 %done, label %exit, label %loop
+exit:
+  ret void
+}
+'''
+
+
+def test_native_cpu_resolves_to_host():
+    assert target.host_cpu('native') == llvm.get_host_cpu_name()
+    assert target.host_cpu(None) == ''
+
+
+def test_native_features_combine_with_overrides():
+    features = target.host_features('native,-avx512f')
+    assert features.startswith(llvm.get_host_cpu_features().flatten())
+    assert features.endswith(',-avx512f')
+
+
+def test_configure_module_sets_data_layout():
+    tm = target.create_target_machine()
+    module = ir.Module()
+    target.configure_module(module, tm)
+
+    assert module.triple == tm.triple
+    assert module.data_layout == str(tm.target_data)
+
+
+def test_vectorized_loops_reported():
+    tm = target.create_target_machine(X86_64, cpu='x86-64', features='+sse2')
+    llmod = llvm.parse_assembly(SCALE_LOOP)
+    llmod.triple = tm.triple
+    llmod.data_layout = str(tm.target_data)
+
+    optimizer.optimize(llmod, tm, opt_level=3)
+
+    [loop] = optimizer.vectorized_loops(llmod)
+    assert loop.function == 'scale'
+    assert loop.width >= 2
+
+
+def test_no_vectorize():
+    tm = target.create_target_machine(X86_64, cpu='x86-64', features='+sse2')
+    llmod = llvm.parse_assembly(SCALE_LOOP)
+    llmod.data_layout = str(tm.target_data)
+
+    optimizer.optimize(llmod, tm, opt_level=3, vectorize=False)
+
+    assert optimizer.vectorized_loops(llmod) == []
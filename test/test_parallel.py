@@ -0,0 +1,98 @@
+import ctypes
+import re
+
+import pytest
+
+import toycomp
+from toycomp import ast, jit, parser
+from toycomp.driver import Driver
+from toycomp.frontend import CompileError
+
+SOURCE = '''
+def binary : 1 (x y) y;
+extern record(i v);
+
+def square_sum(n) let t = 0 in (for j = 0, j < n in t = t + j * j) : t;
+
+def squares(n offset)
+    parallel for i = 0, i < n, 0.5 in
+        let s = square_sum(i) in record(i, s + offset);
+
+def nested(n)
+    parallel for i = 0, i < n in
+        parallel for j = 0, j < i in record(i, j);
+'''
+
+recorded = []
+
+
+@ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double, ctypes.c_double)
+def record(i, v):
+    recorded.append((i, v))
+    return 0.0
+
+
+@pytest.fixture
+def program(monkeypatch):
+    monkeypatch.setenv('TOYCOMP_NUM_THREADS', '4')
+    jit.add_symbol('record', record)
+    recorded.clear()
+    return toycomp.compile(SOURCE)
+
+
+def test_parse_parallel_for():
+    [expr] = parser.parse('parallel for x = 0, x < 10 in x')
+
+    assert isinstance(expr, ast.ForExpr)
+    assert expr.parallel
+
+
+def test_iterations_match_sequential_loop(program):
+    program.squares(100, 0.25)
+
+    expected = [(i / 2, sum(j * j for j in range(int(i / 2 + 0.5))) + 0.25) for i in range(200)]
+    assert sorted(recorded) == expected
+
+
+def test_nested_parallel_loops(program):
+    program.nested(20)
+
+    assert sorted(recorded) == [(i, j) for i in range(20) for j in range(i)]
+
+
+def test_no_assignments_to_outer_variables(capsys):
+    with pytest.raises(CompileError, match="cannot assign to 'total'"):
+        toycomp.compile('def f(n) let total = 0 in parallel for i = 0, i < n in total = i;')
+
+    with pytest.raises(CompileError, match="cannot assign to 'i'"):
+        toycomp.compile('def f(n) parallel for i = 0, i < n in i = i + 1;')
+
+    # Variables declared inside the body are fine.
+    toycomp.compile('def f(n) parallel for i = 0, i < n in let t = 0 in '
+                    'for j = 0, j < i in t = t + j;')
+
+
+def test_body_is_outlined():
+    text = str(Driver(None).compile('def f(n) parallel for i = 0, i < n in i;'))
+
+    assert 'define internal void @"f.parallel"' in text
+    assert 'call void @"__toycomp_parallel_for"' in text
+    assert 'call void @"abort"' in text
+
+
+def function_of(text, name):
+    body = text[re.search(r'define [^\n]*@"{}"\('.format(re.escape(name)), text).start():]
+    return body[:body.index('\n}')]
+
+
+def test_counters_are_atomic():
+    # g runs on the pool's threads too, when the body calls it.
+    source = 'def g(x) x;\ndef f(n) parallel for i = 0, i < n in if i < 3 then g(i) else f(i);'
+
+    for kwargs in [dict(profile_generate=True), dict(instrument=True, instrument_threshold=0)]:
+        text = str(Driver(None, **kwargs).compile(source))
+        # Under --instrument, g is the wrapper that updates g's record.
+        for name in ['f.parallel', 'g']:
+            body = function_of(text, name)
+            assert 'atomicrmw add' in body
+            assert 'store i64' not in body
@@ -1,4 +1,9 @@
+import concurrent.futures
+
+import pytest
+
 from toycomp import parser, ast
+from toycomp.pratt import IncompleteInputError, Tokenizer
 
 
 def assert_parses(input, *output):
@@ -46,3 +51,72 @@ def test_parse_for():
                                              ast.NumberExpr(10.0)),
                               ast.NumberExpr(1.0),
                               ast.VariableExpr('x')))
+
+
+def test_parse_incomplete():
+    for source in ['def f(x', 'def f(x)', '1 +', 'if x then y']:
+        with pytest.raises(IncompleteInputError):
+            list(parser.parse(source))
+
+    with pytest.raises(SyntaxError) as excinfo:
+        list(parser.parse('def f(x) ) + 1'))
+
+    assert not isinstance(excinfo.value, IncompleteInputError)
+
+
+def test_operators_do_not_leak_between_parses():
+    [_, expr] = parser.parse('def binary | 5 (a b) a; x | y')
+    assert isinstance(expr, ast.BinaryExpr)
+
+    # `|` has no binding power outside of the parse that defined it.
+    [expr, _] = parser.parse('x | y')
+    assert isinstance(expr, ast.VariableExpr)
+    assert '|' not in parser.grammar.operators
+
+
+def test_shared_operator_table():
+    operators = dict(parser.grammar.operators)
+    list(parser.parse('def binary | 5 (a b) a;', operators=operators))
+
+    [expr] = parser.parse('x | y', operators=operators)
+    assert isinstance(expr, ast.BinaryExpr)
+
+
+def test_concurrent_parses_with_conflicting_operators():
+    # `&` binds tighter than `+` in even parses and looser in odd ones.
+    def parse(i):
+        lbp = 30 if i % 2 == 0 else 15
+        [_, expr] = parser.parse('def binary & {} (a b) a;\n'
+                                 'a & b + c'.format(lbp))
+        return i, expr
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        for i, expr in executor.map(parse, range(400)):
+            if i % 2 == 0:
+                assert expr.op == '+' and expr.lhs.op == '&'
+            else:
+                assert expr.op == '&' and expr.rhs.op == '+'
+
+
+def test_token_array_matches_token_objects():
+    source = ('def binary : 1 (x y) y;\n'
+              '# a comment\n'
+              'def f(x)\n'
+              '    if x < 1 then 2 else\n'
+              '        f(x - 1) : 3;\n')
+    tokenizer = Tokenizer(parser.grammar)
+
+    objects = list(tokenizer.tokenize(source))
+    array = tokenizer.tokenize_array(source)
+
+    assert len(array) == len(objects)
+    for i, t in enumerate(objects):
+        assert (type(array[i]), array[i].value, array[i].lineno, array[i].offset, array[i].pos) == \
+               (type(t), t.value, t.lineno, t.offset, t.pos)
+
+    assert repr(list(parser.parse(source, compact=True))) == repr(list(parser.parse(source)))
+
+    with pytest.raises(SyntaxError) as excinfo:
+        list(parser.parse('def f(x)\n  ) + 1', compact=True))
+
+    assert (excinfo.value.lineno, excinfo.value.offset) == (2, 4)
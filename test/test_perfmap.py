@@ -0,0 +1,80 @@
+import ctypes
+import struct
+
+from toycomp import frontend, jit, perfmap
+from toycomp.codegen import Codegen
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def square(x) x * x;
+
+def fill(n) parallel for i = 0, i < n in square(i);
+'''
+
+
+def compile(perf_map):
+    engine = jit.JIT(perf_map=perf_map)
+    cg = Codegen()
+    engine.configure_module(cg.module)
+    for node in frontend.check(SOURCE):
+        cg.visit(node)
+
+    jit.add_builtins()
+    engine.add_module(cg.finish())
+    return engine
+
+
+def read_map(path):
+    entries = {}
+    for line in path.read_text().splitlines():
+        start, size, name = line.split(' ', 2)
+        entries[name] = int(start, 16), int(size, 16)
+    return entries
+
+
+def test_map_lists_compiled_functions(tmp_path):
+    perf_map = perfmap.PerfMap(directory=str(tmp_path))
+    engine = compile(perf_map)
+    perf_map.close()
+
+    entries = read_map(tmp_path / 'perf-{}.map'.format(perf_map.pid))
+
+    assert {'square', 'fill', 'binary:', 'fill.parallel'} <= set(entries)
+    assert entries['square'][0] == engine.function_address('square')
+    assert all(size > 0 for _, size in entries.values())
+
+    # Functions don't overlap.
+    ranges = sorted(entries.values())
+    assert all(start + size <= next_start for (start, size), (next_start, _) in zip(ranges, ranges[1:]))
+
+
+def test_jitdump_records_code(tmp_path):
+    perf_map = perfmap.PerfMap(jitdump=True, directory=str(tmp_path))
+    engine = compile(perf_map)
+    perf_map.close()
+
+    data = (tmp_path / 'jit-{}.dump'.format(perf_map.pid)).read_bytes()
+    magic, version, header_size = struct.unpack_from('<III', data)
+    assert (magic, version, header_size) == (0x4A695444, 1, 40)
+
+    loads = {}
+    pos = header_size
+    while pos < len(data):
+        kind, size = struct.unpack_from('<II', data, pos)
+        if kind == 0:
+            _, _, vma, _, code_size, _ = struct.unpack_from('<IIQQQQ', data, pos + 16)
+            name = data[pos + 56:data.index(b'\0', pos + 56)].decode()
+            loads[name] = vma, data[pos + size - code_size:pos + size]
+        pos += size
+
+    assert pos == len(data)
+    address, code = loads['square']
+    assert address == engine.function_address('square')
+    assert code == ctypes.string_at(address, len(code))
+
+
+def test_no_map_by_default(monkeypatch):
+    monkeypatch.delenv('TOYCOMP_PERF_MAP', raising=False)
+    assert perfmap.default() is None
+    assert jit.JIT().perf_map is None
@@ -0,0 +1,63 @@
+from toycomp import pgo
+from toycomp.driver import Driver
+
+SOURCE = '''
+def f(x)
+    if x < 10 then 1 else 2;
+
+def g(n)
+    for i = 0, i < n, 1 in f(i);
+'''
+
+
+def test_profile_generate_adds_counters():
+    module = Driver(None, profile_generate=True).compile(SOURCE)
+    text = str(module)
+
+    for site in ['f:entry', 'f:if0.then', 'f:if0.else', 'g:entry', 'g:for0.body', 'g:for0.exit']:
+        assert '@"__prof.{}"'.format(site) in text
+
+    assert '@"llvm.global_ctors"' in text
+    assert 'call void @"__toycomp_profile_register"' in text
+
+
+def test_profile_data_sums_runs(tmp_path):
+    path = tmp_path / 'default.kalprof'
+    path.write_text('f:entry 3\nbinary::entry 1\nf:entry 4\n')
+
+    data = pgo.ProfileData.load(str(path))
+    assert data.counts['f:entry'] == 7
+    assert data.counts['binary::entry'] == 1
+    assert data.max_function_count == 7
+
+
+def test_profile_use_annotates(tmp_path):
+    path = tmp_path / 'default.kalprof'
+    path.write_text('\n'.join([
+        'f:entry 1000',
+        'f:if0.then 990',
+        'f:if0.else 10',
+        'g:entry 0',
+        'g:for0.body 0',
+        'g:for0.exit 0',
+    ]))
+
+    module = Driver(None, profile_use=str(path)).compile(SOURCE)
+    f = module.get_global('f')
+    g = module.get_global('g')
+
+    assert 'inlinehint' in f.attributes
+    assert 'cold' in g.attributes
+    assert '!{ !"branch_weights", i32 991, i32 11 }' in str(module)
+    assert '!{ !"function_entry_count", i64 1000 }' in str(module)
+
+
+def test_counted_loops_share_sites():
+    source = 'def h(n) for i = 0, i < n in if i < 3 then 1 else for j = 0, j < i in 0;'
+    names = []
+    for opt_level in [0, 2]:
+        module = Driver(None, opt_level=opt_level, profile_generate=True).compile(source)
+        names.append(sorted(g.name for g in module.global_values if g.name.startswith('__prof.h:')))
+
+    assert names[0] == names[1]
+    assert '__prof.h:for1.body' in names[0] and '__prof.h:for2.body' not in names[0]
@@ -0,0 +1,33 @@
+import io
+
+from toycomp.repl import Session
+
+
+def test_definitions_persist():
+    session = Session()
+
+    assert session.evaluate('def binary : 1 (x y) y;') == []
+    assert session.evaluate('def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);') == []
+    assert session.evaluate('fib(10)') == [55.0]
+    assert session.evaluate('def twice(x) fib(x) * 2; twice(10) : 1\ntwice(5)') == [1.0, 10.0]
+
+
+def test_failed_definition_can_be_reentered():
+    diagnostics = io.StringIO()
+    session = Session(diagnostics=diagnostics)
+
+    assert session.evaluate('def f(x) x + y;') is None
+    assert "undeclared symbol 'y'" in diagnostics.getvalue()
+
+    assert session.evaluate('def f(x) x + 1;') == []
+    assert session.evaluate('f(1)') == [2.0]
+
+
+def test_failed_operator_definition_keeps_precedence():
+    session = Session(diagnostics=io.StringIO())
+
+    assert session.evaluate('def binary | 5 (x y) x - y;') == []
+    assert session.evaluate('def binary | 50 (x y) z;') is None
+
+    # Still (8 - 2) | 1, not 8 - (2 | 1).
+    assert session.evaluate('8 - 2 | 1') == [5.0]
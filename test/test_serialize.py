@@ -0,0 +1,129 @@
+import io
+import sys
+
+import pytest
+
+from toycomp import (
+    ast,
+    codegen,
+    compilepass,
+    nameres,
+    parser,
+    serialize,
+    typechecker,
+    types,
+    user_op_rewriter
+)
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
+
+SOURCE = '''
+extern putchard(ch)
+def binary : 1 (x y) y;
+
+def fib(n:double) -> double
+    if n < 2 then n else fib(n - 1) + fib(n - 2);
+
+def count(n)
+    let acc = 0 in
+        (for i = 0, i < n, 1 in acc = acc + fib(i)):
+        acc;
+
+extern getint() -> int;
+def useint(x:int) -> int x;
+'''
+
+
+def check(src):
+    engine = DiagnosticsEngine(DiagnosticPrinter(sys.stderr))
+    pm = compilepass.PassManager([
+        user_op_rewriter.UserOpRewriter(),
+        nameres.NameResolver(engine),
+        typechecker.Typechecker(engine),
+    ])
+    exprs = list(parser.parse(src, name='test.kal'))
+    assert all([pm.visit(expr) for expr in exprs])
+    return exprs
+
+
+def walk(node):
+    yield node
+    for value in vars(node).values():
+        if isinstance(value, list):
+            for v in value:
+                if isinstance(v, ast.AST):
+                    yield from walk(v)
+        elif isinstance(value, (ast.AST, ast.Stmt)) and not isinstance(node, ast.VariableExpr):
+            yield from walk(value)
+
+
+def walk_all(exprs):
+    for expr in exprs:
+        yield from walk(expr)
+
+
+def range_positions(source_range):
+    if source_range is None:
+        return None
+    return source_range.begin[1:], source_range.end[1:]
+
+
+def codegen_text(exprs):
+    cg = codegen.Codegen()
+    assert all([cg.visit(expr) for expr in exprs])
+    return str(cg.module)
+
+
+def test_round_trip_preserves_structure():
+    exprs = check(SOURCE)
+    loaded = serialize.loads(serialize.dumps(exprs))
+
+    assert repr(loaded) == repr(exprs)
+
+    orig_nodes = list(walk_all(exprs))
+    new_nodes = list(walk_all(loaded))
+    assert len(orig_nodes) == len(new_nodes)
+
+    for orig, new in zip(orig_nodes, new_nodes):
+        assert type(orig) is type(new)
+        assert str(getattr(orig, 'ty', None)) == str(getattr(new, 'ty', None))
+        assert str(getattr(orig, 'decl_ty', None)) == str(getattr(new, 'decl_ty', None))
+        assert range_positions(getattr(orig, 'source_range', None)) == \
+            range_positions(getattr(new, 'source_range', None))
+
+
+def test_round_trip_preserves_decl_links():
+    loaded = serialize.loads(serialize.dumps(check(SOURCE)))
+    fib = loaded[2]
+    nodes = list(walk(fib))
+
+    calls = [n for n in nodes if isinstance(n, ast.CallExpr)]
+    assert calls[0].func.decl is fib.proto
+
+    [n_param] = fib.proto.params
+    n_refs = [n for n in nodes if isinstance(n, ast.VariableExpr) and n.name == 'n']
+    assert n_refs and all(ref.decl is n_param for ref in n_refs)
+
+    # Primitive types map back to the built-in singletons.
+    assert n_param.decl_ty is types.double_ty
+    assert loaded[-1].proto.params[0].typename.decl.ty is types.int_ty
+
+
+def test_round_trip_codegen():
+    exprs = check(SOURCE)
+    stream = io.BytesIO()
+    serialize.dump(exprs, stream)
+    stream.seek(0)
+
+    assert codegen_text(serialize.load(stream)) == codegen_text(exprs)
+
+
+def test_source_ranges_survive():
+    loaded = serialize.loads(serialize.dumps(check(SOURCE)))
+    fib = loaded[2]
+    assert fib.source_range.begin.file.name == 'test.kal'
+    assert 'def fib' in fib.source_range.to_squiggly()
+
+
+def test_bad_magic():
+    with pytest.raises(serialize.FormatError):
+        serialize.loads(b'not an AST file')
@@ -0,0 +1,67 @@
+import io
+import json
+
+from toycomp import driver, stats
+from toycomp.driver import Driver
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def total(n)
+    let t = 0 in
+        (for i = 0, i < n in
+            t = t + i) :
+        t;
+
+def mainf() total(10);
+'''
+
+
+def test_counts_nodes_and_names():
+    compile_stats = stats.CompileStats()
+    Driver(None, stats=compile_stats).compile(SOURCE)
+
+    assert compile_stats.ast_nodes['Function'] == 3
+    assert compile_stats.ast_nodes['ForExpr'] == 1
+    # The three functions, x and y, n, t and i.
+    assert compile_stats.name_resolution['declarations'] == 8
+    # Nodes are counted as parsed; resolving also sees the call that `:` becomes.
+    assert compile_stats.name_resolution['references'] == compile_stats.ast_nodes['VariableExpr'] + 1
+
+    assert [p['phase'] for p in compile_stats.phases] == ['parse', 'frontend', 'codegen']
+    assert set(compile_stats.functions) == {'binary:', 'total', 'mainf'}
+
+
+def test_json_report(tmp_path):
+    source = tmp_path / 'prog.kal'
+    source.write_text(SOURCE)
+    report = tmp_path / 'stats.json'
+
+    driver.main([str(source), '-O2', '--emit', 'obj', '-o', str(tmp_path / 'prog.o'),
+                 '--stats', 'json', '--stats-file', str(report)])
+    data = json.loads(report.read_text())
+
+    assert data['version'] == stats.FORMAT
+    assert [p['phase'] for p in data['phases']] == ['parse', 'frontend', 'codegen', 'optimize', 'emit']
+    assert all(p['python_peak_bytes'] > 0 and p['max_rss_bytes'] > 0 for p in data['phases'])
+
+    total = data['functions']['total']
+    assert total['before']['instructions'] > total['after']['instructions']
+    assert total['before']['blocks'] >= total['after']['blocks']
+
+    [output] = data['outputs']
+    assert output['object_bytes'] == (tmp_path / 'prog.o').stat().st_size
+
+
+def test_text_report():
+    compile_stats = stats.CompileStats()
+    drv = Driver(None, opt_level=2, stats=compile_stats)
+    drv.optimize(drv.compile(SOURCE))
+
+    stream = io.StringIO()
+    compile_stats.write(stream)
+    text = stream.getvalue()
+
+    assert 'optimize' in text
+    assert 'name resolution: 8 declarations' in text
+    assert ' -> ' in text
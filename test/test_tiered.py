@@ -0,0 +1,69 @@
+import pytest
+
+from toycomp import tiered
+from toycomp.driver import Driver
+
+SOURCE = '''
+def binary : 1 (x y) y;
+def unary - (v) 0 - v;
+
+def fib(n) if n < 2 then n else fib(n - 1) + fib(n - 2);
+
+def sum(n)
+    let total = 0 in
+        (for i = 0, i < n, 1 in total = total + i * i) : total;
+
+def signs(x) if x < 0 then -1 else if 0 < x then 1 else 0;
+'''
+
+
+@pytest.fixture(scope='module')
+def nodes():
+    return Driver(None).check(SOURCE)
+
+
+@pytest.mark.parametrize('mode', tiered.MODES)
+def test_modes_agree(nodes, mode):
+    with tiered.TieredEngine(mode=mode) as engine:
+        engine.load(nodes)
+
+        assert engine.call('fib', 15) == 610
+        assert engine.call('sum', 10) == 285
+        assert [engine.call('signs', x) for x in [-2, 0, 3]] == [-1, 0, 1]
+
+
+def test_hot_functions_are_compiled(nodes):
+    with tiered.TieredEngine(call_threshold=50, backedge_threshold=100) as engine:
+        engine.load(nodes)
+
+        assert engine.call('fib', 5) == 5
+        assert engine.call('signs', 1) == 1
+        engine.wait()
+        assert engine.entry('fib').state == tiered.INTERPRETED
+
+        assert engine.call('fib', 10) == 55
+        assert engine.call('sum', 200) == 2646700
+        engine.wait()
+
+        assert engine.entry('fib').state == tiered.NATIVE
+        assert engine.entry('sum').state == tiered.NATIVE
+        assert engine.entry('signs').state == tiered.INTERPRETED
+
+        assert engine.call('fib', 20) == 6765
+        assert engine.call('sum', 10) == 285
+
+
+def test_undefined_extern():
+    nodes = Driver(None).check('extern nosuchfunction(x);'
+                               'def f(x) if x < 1 then nosuchfunction(x) else f(x - 1);')
+
+    with tiered.TieredEngine(call_threshold=10) as engine:
+        engine.load(nodes)
+        assert engine.entry('nosuchfunction').state == tiered.UNDEFINED
+
+        with pytest.raises(tiered.ExecutionError):
+            engine.call('f', 20)
+
+        # f can't be compiled without its callee, so it stays interpreted.
+        engine.wait()
+        assert engine.entry('f').state == tiered.INTERPRETED
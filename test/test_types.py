@@ -0,0 +1,59 @@
+import io
+
+from toycomp import parser, serialize, types
+from toycomp.compilepass import PassManager
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
+from toycomp.nameres import NameResolver
+from toycomp.typechecker import Typechecker
+from toycomp.user_op_rewriter import UserOpRewriter
+
+
+def check(source):
+    diags = DiagnosticsEngine(DiagnosticPrinter(io.StringIO()))
+    pm = PassManager([UserOpRewriter(), NameResolver(diags), Typechecker(diags)])
+    nodes = list(parser.parse(source))
+    assert all([pm.visit(node) for node in nodes])
+    return nodes
+
+
+def test_function_types_are_interned():
+    fty = types.function_type(types.double_ty, [types.int_ty, types.double_ty])
+
+    assert types.function_type(types.double_ty, (types.int_ty, types.double_ty)) is fty
+    assert types.function_type(types.double_ty, [types.double_ty, types.int_ty]) is not fty
+    assert types.function_type(types.int_ty, [types.int_ty, types.double_ty]) is not fty
+
+    higher = types.function_type(fty, [fty])
+    assert types.function_type(types.function_type(types.double_ty, [types.int_ty, types.double_ty]),
+                               [fty]) is higher
+
+
+def test_structurally_equal_signatures():
+    f, g, h = check('extern f(a: int b) -> double;'
+                    'def g(x: int y) y;'
+                    'extern h(a b: int);')
+
+    assert f.decl_ty is g.proto.decl_ty
+    assert h.decl_ty is not f.decl_ty
+    assert str(h.decl_ty) == '(double, int) -> double'
+
+
+def test_llvm_types_are_cached():
+    fty = types.function_type(types.double_ty, [types.double_ty])
+    assert fty.llvm_ty is fty.llvm_ty
+
+
+def test_separate_contexts():
+    context = types.TypeContext()
+    double_ty = context.primitive('double', types.double_ty.llvm_ty)
+
+    assert context.primitive('double') is double_ty
+    assert double_ty is not types.double_ty
+    assert context.function(double_ty, []) is not types.function_type(types.double_ty, [])
+
+
+def test_deserialized_types_are_interned():
+    [f] = check('def f(x: int y) y;')
+    [loaded] = serialize.loads(serialize.dumps([f]))
+
+    assert loaded.proto.decl_ty is f.proto.decl_ty
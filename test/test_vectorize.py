@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+import toycomp
+from toycomp.frontend import CompileError
+
+np = pytest.importorskip('numpy')
+
+SOURCE = '''
+def binary : 1 (x y) y;
+def binary > 10 (lhs rhs) rhs < lhs;
+def binary | 5 (lhs rhs) if lhs then 1 else if rhs then 1 else 0;
+
+def mandelconverger(real imag iters creal cimag)
+    if iters > 255 | (real * real + imag * imag > 4) then
+       iters
+    else
+        mandelconverger(real * real - imag * imag + creal,
+                        2 * real * imag + cimag,
+                        iters + 1, creal, cimag);
+
+def mandelconverge(real imag) mandelconverger(real, imag, 0, real, imag);
+
+def axpy(a x y) a * x + y;
+'''
+
+
+def reference(real, imag):
+    z = c = complex(real, imag)
+    iters = 0
+    while not (iters > 255 or abs(z) ** 2 > 4):
+        z = z * z + c
+        iters += 1
+    return iters
+
+
+def test_matches_elementwise():
+    kernel = toycomp.vectorize(SOURCE, 'mandelconverge')
+    real, imag = np.meshgrid(np.linspace(-2, 1, 31), np.linspace(-1.2, 1.2, 17))
+
+    counts = kernel(real, imag)
+
+    assert counts.shape == real.shape
+    assert counts.tolist() == [[reference(r, i) for r, i in zip(rs, ims)]
+                               for rs, ims in zip(real.tolist(), imag.tolist())]
+
+
+def test_broadcasting_and_out():
+    kernel = toycomp.vectorize(SOURCE, 'axpy')
+    x = np.arange(12, dtype=np.float64).reshape(3, 4)[:, ::2]  # not contiguous
+    out = np.empty((3, 2))
+
+    assert kernel(2, x, [1, 0], out=out) is out
+    assert out.tolist() == (2 * x + [1, 0]).tolist()
+
+    with pytest.raises(ValueError):
+        kernel(2, x, 0, out=np.empty(6))
+    readonly = np.empty((3, 2))
+    readonly.flags.writeable = False
+    with pytest.raises(ValueError, match='writable'):
+        kernel(2, x, 0, out=readonly)
+    with pytest.raises(TypeError):
+        kernel(x, x)
+
+
+def test_out_overlaps_arguments():
+    kernel = toycomp.vectorize(SOURCE, 'axpy')
+    x = np.arange(100, dtype=np.float64)
+    expected = 2 * x[:-1] + 1
+
+    # As with NumPy's ufuncs, the results are as if the inputs were read
+    # before any output was written.
+    kernel(2, x[:-1], 1, out=x[1:])
+    assert x[1:].tolist() == expected.tolist()
+
+    y = np.arange(8, dtype=np.float64)
+    kernel(3, y, y, out=y)
+    assert y.tolist() == (4 * np.arange(8)).tolist()
+
+
+def test_batches_in_parallel_threads():
+    kernel = toycomp.vectorize(SOURCE, 'axpy')
+    x = np.arange(100000, dtype=np.float64)
+    results = [None] * 4
+
+    def work(i):
+        results[i] = kernel(i, x, 1)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for i, result in enumerate(results):
+        assert np.array_equal(result, i * x + 1)
+
+
+def test_errors():
+    with pytest.raises(CompileError, match="undeclared symbol 'b'"):
+        toycomp.vectorize('def f(a) b;', 'f')
+    with pytest.raises(ValueError, match='no function'):
+        toycomp.vectorize('extern sin(x);', 'sin')
@@ -0,0 +1,75 @@
+import llvmlite.binding as llvm
+import pytest
+
+from toycomp import callgraph, driver
+from toycomp.driver import Driver
+
+SOURCE = '''
+def binary : 1 (x y) y;
+
+def unused(x) x * 2;
+def helper(x) x + 1;
+def scale(x k) x * k;
+def api(x) scale(x, 3);
+
+def mainf()
+    helper(1) : scale(2, 4);
+'''
+
+OPS = '''
+def square(x) x * x;
+def cube(x) x * x * x;
+'''
+
+MAIN = '''
+extern square(x);
+
+def mainf() square(3);
+'''
+
+
+def test_reachable_follows_calls_and_operators():
+    nodes = Driver(None).check(SOURCE)
+
+    assert callgraph.reachable([nodes], ['mainf']) == {'mainf', 'helper', 'scale', 'binary:'}
+    assert callgraph.reachable([nodes], ['api']) == {'api', 'scale'}
+
+
+def test_unreachable_functions_not_compiled():
+    module = Driver(None, whole_program=True).compile(SOURCE)
+
+    assert 'unused' not in module.globals
+    assert 'api' not in module.globals
+    assert not module.globals['helper'].is_declaration
+
+
+def test_whole_program_internalizes_and_propagates():
+    drv = Driver(None, whole_program=True, exports=['api'])
+    llmod = drv.optimize_whole_program(drv.compile(SOURCE))
+
+    assert llmod.get_function('mainf').linkage == llvm.Linkage.external
+    assert llmod.get_function('api').linkage == llvm.Linkage.external
+    assert llmod.get_function('helper').linkage == llvm.Linkage.internal
+
+    # `helper` is only ever called with 1, so the argument is dropped.
+    assert '@helper()' in str(llmod.get_function('helper'))
+
+
+def test_whole_program_across_units(tmp_path):
+    ops = tmp_path / 'ops.kal'
+    ops.write_text(OPS)
+    main = tmp_path / 'main.kal'
+    main.write_text(MAIN)
+    output = tmp_path / 'prog.ll'
+
+    driver.main(['--whole-program', str(ops), str(main), '-o', str(output)])
+
+    llmod = llvm.parse_assembly(output.read_text())
+    names = {f.name for f in llmod.functions}
+    assert 'square' in names
+    assert 'cube' not in names
+
+
+def test_whole_program_rejects_compile_only():
+    with pytest.raises(SystemExit):
+        driver.main(['-c', '--whole-program', 'prog.kal'])
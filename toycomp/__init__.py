@@ -0,0 +1,2 @@
+from toycomp.embed import compile
+from toycomp.kernels import vectorize
@@ -13,6 +13,7 @@ class Decl(AST, metaclass=ABCMeta):
     name = None
     llvm_value = None
     decl_ty = None
+    slot = None  # set by the name resolver on local declarations
 
 
 @autorepr('name', 'ty')
@@ -40,6 +41,7 @@ class NumberExpr(Expr):
 @autorepr('name')
 class VariableExpr(Expr):
     decl = None
+    slot = None
 
     def __init__(self, name):
         self.name = name
@@ -60,6 +62,13 @@ class CallExpr(Expr):
         self.args = args
 
 
+@autorepr('target', 'index')
+class IndexExpr(Expr):
+    def __init__(self, target, index):
+        self.target = target
+        self.index = index
+
+
 @autorepr('test', 'true', 'false')
 class IfExpr(Expr):
     def __init__(self, test, true, false):
@@ -68,14 +77,15 @@ class IfExpr(Expr):
         self.false = false
 
 
-@autorepr('name', 'start', 'end', 'step', 'body')
+@autorepr('name', 'start', 'end', 'step', 'body', 'parallel')
 class ForExpr(Expr, Decl):
-    def __init__(self, name, start, end, step, body):
+    def __init__(self, name, start, end, step, body, parallel=False):
         self.name = name
         self.start = start
         self.end = end
         self.step = step
         self.body = body
+        self.parallel = parallel
 
 
 @autorepr('name', 'init', 'body')
@@ -105,6 +115,10 @@ class ASTVisitor(metaclass=ABCMeta):
     def visit_CallExpr(self, expr):
         pass
 
+    @abstractmethod
+    def visit_IndexExpr(self, expr):
+        pass
+
     @abstractmethod
     def visit_IfExpr(self, expr):
         pass
@@ -173,6 +187,11 @@ class ASTRewriter(ASTVisitor):
     def visit_NumberExpr(self, expr):
         return expr
 
+    def visit_IndexExpr(self, expr):
+        expr.target = self.visit(expr.target)
+        expr.index = self.visit(expr.index)
+        return expr
+
     def visit_IfExpr(self, expr):
         expr.test = self.visit(expr.test)
         expr.true = self.visit(expr.true)
@@ -193,6 +212,8 @@ class Stmt(metaclass=ABCMeta):
 
 @autorepr('name', 'params', 'result_typename', 'decl_ty')
 class Prototype(Stmt, Decl):
+    pure = False  # set by the typechecker on defined functions
+
     def __init__(self, name, params, result_typename=None):
         self.name = name
         self.args = [p.name for p in params]  # legacy use only
@@ -208,8 +229,11 @@ class FormalParamDecl(Decl):
         self.typename = typename
 
 
-@autorepr('proto', 'body')
+@autorepr('proto', 'body', 'memo')
 class Function(Stmt):
-    def __init__(self, proto, body):
+    slot_count = 0
+
+    def __init__(self, proto, body, memo=False):
         self.proto = proto
         self.body = body
+        self.memo = memo
@@ -0,0 +1,82 @@
+"""
+The call graph of a program, built from its resolved AST.
+
+Whole-program compilation only generates code for the functions that the
+program can reach from its entry points. Functions are identified by name, so
+that an `extern` declaration in one unit refers to the definition in
+another.
+"""
+from toycomp import ast
+
+# The function that libmain.c calls.
+ENTRY = 'mainf'
+
+
+class _References(ast.ASTRewriter):
+    """
+    Collects the names of the functions an expression refers to, whether it
+    calls them or uses them as values.
+    """
+    def __init__(self):
+        self.names = set()
+
+    def visit_VariableExpr(self, expr):
+        if isinstance(expr.decl, ast.Prototype):
+            self.names.add(expr.decl.name)
+        return expr
+
+
+def call_graph(units):
+    """
+    Map the name of every function defined in `units` to the names of the
+    functions it refers to.
+
+    :param list[list[toycomp.ast.AST]] units: the checked top-level nodes of
+        each translation unit
+    :rtype: dict[str, set[str]]
+    """
+    graph = {}
+
+    for nodes in units:
+        for node in nodes:
+            if isinstance(node, ast.Function):
+                refs = _References()
+                refs.visit(node.body)
+                graph[node.proto.name] = refs.names
+
+    return graph
+
+
+def reachable(units, roots):
+    """
+    Find the functions that `roots` refer to, directly or indirectly.
+
+    :param list[list[toycomp.ast.AST]] units: the checked top-level nodes of
+        each translation unit
+    :param roots: the names of the entry points
+    :rtype: set[str]
+    """
+    graph = call_graph(units)
+    seen = set()
+    pending = list(roots)
+
+    while pending:
+        name = pending.pop()
+        if name not in seen:
+            seen.add(name)
+            pending.extend(graph.get(name, ()))
+
+    return seen
+
+
+def prune(nodes, live):
+    """
+    Drop the definitions of the functions that aren't in `live`. Declarations
+    and anything else are kept.
+
+    :param list[toycomp.ast.AST] nodes: the checked top-level nodes of a unit
+    :param set[str] live: the functions to keep, see `reachable`
+    :rtype: list[toycomp.ast.AST]
+    """
+    return [node for node in nodes
+            if not isinstance(node, ast.Function) or node.proto.name in live]
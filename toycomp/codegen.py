@@ -1,6 +1,25 @@
+import collections
+
 from llvmlite import ir
 
-from . import ast, color
+from . import ast, color, irutil, loops, pgo
+
+PARALLEL_FOR = '__toycomp_parallel_for'
+BOUNDS_ERROR = '__toycomp_bounds_error'
+MEMO_LOOKUP = '__toycomp_memo_lookup'
+MEMO_STORE = '__toycomp_memo_store'
+
+# The number of entries in each memo function's cache.
+MEMO_CAPACITY = 4096
+
+_double = ir.DoubleType()
+_double_ptr = _double.as_pointer()
+# void body(i8 *env, const double *values, i64 begin, i64 end)
+_parallel_body_ty = ir.FunctionType(ir.VoidType(), [irutil.i8_ptr, _double_ptr, irutil.i64, irutil.i64])
+# struct toycomp_memo in stdlib/memo.c: name, nargs, capacity, entries, hits,
+# misses, evictions, next, lock
+memo_ty = ir.LiteralStructType([irutil.i8_ptr, irutil.i64, irutil.i64, irutil.i8_ptr, irutil.i64,
+                                irutil.i64, irutil.i64, irutil.i8_ptr, irutil.i64])
 
 
 def _llvm_ty(ty):
@@ -9,16 +28,125 @@ def _llvm_ty(ty):
     return ty.llvm_ty
 
 
-class Codegen(ast.ASTVisitor):
+class _SlotCollector(ast.ASTRewriter):
+    """
+    Collects the slots of the local variables an expression refers to.
+    """
     def __init__(self):
+        self.slots = set()
+
+    def visit_VariableExpr(self, expr):
+        if expr.slot is not None:
+            self.slots.add(expr.slot)
+        return expr
+
+
+class Codegen(ast.ASTVisitor):
+    def __init__(self, *, profile=None, instrument=None, bounds_check=True, debug_info=None,
+                 count_loops=True):
+        """
+        :param profile: hooks for profile-guided optimization, either
+            a `pgo.ProfileGenerator` or a `pgo.ProfileUser`
+        :param toycomp.instrument.FunctionInstrumenter instrument: hooks
+            that add per-function call and time counters
+        :param bool bounds_check: check buffer indices, aborting the
+            program on an out-of-bounds access
+        :param toycomp.debuginfo.DebugInfo debug_info: hooks that emit
+            debug information
+        :param bool count_loops: lower the `for` loops that
+            `loops.counted_loop` recognizes to loops over an integer counter
+        """
         self.decl_consts = {}
-        self.decl_values = {}
+        self.slots = []
         self.builder = ir.IRBuilder()
         self.module = ir.Module(name='main_module')
+        self.profile = profile
+        self.instrument = instrument
+        self.bounds_check = bounds_check
+        self.debug_info = debug_info
+        self._profile_sites = collections.Counter()
+        self._function = None
+        self._debug_scope = None
+        self._count_loops = count_loops
+        # The integer value of the variable of each counted loop whose body
+        # is being generated, for indexing buffers with.
+        self._loop_indices = {}
+        self._tbaa_tags = {}
+
+    def finish(self):
+        """
+        Complete the module after all top-level expressions have been visited.
+        """
+        if self.profile:
+            self.profile.finish(self.module)
+
+        if self.instrument:
+            self.instrument.finish(self.module)
+
+        return self.module
+
+    def visit(self, node):
+        if not self._debug_scope:
+            return super().visit(node)
+
+        # Attribute the instructions generated for `node` to its location,
+        # unless a node inside it has a more precise one.
+        saved = self.builder.debug_metadata
+        location = self.debug_info.location(self, node, self._debug_scope)
+        if location:
+            self.builder.debug_metadata = location
+
+        try:
+            return super().visit(node)
+        finally:
+            self.builder.debug_metadata = saved
+
+    def declare_variable(self, decl, alloca, ty, *, arg=None):
+        if self._debug_scope:
+            self.debug_info.declare_variable(self, decl, alloca, ty, self._debug_scope, arg=arg)
+
+    def tbaa(self, instr, kind):
+        """
+        Tell LLVM what `instr` accesses: a buffer's ``data`` pointer or
+        ``length``, or an ``element``. They can't alias each other, so the
+        descriptor of a buffer can be loaded once for a loop that stores to
+        its elements.
+        """
+        tag = self._tbaa_tags.get(kind)
+        if tag is None:
+            if not self._tbaa_tags:
+                self._tbaa_tags[None] = self.module.add_metadata(['toycomp TBAA'])
+            ty = self.module.add_metadata([kind, self._tbaa_tags[None], ir.Constant(irutil.i64, 0)])
+            tag = self._tbaa_tags[kind] = self.module.add_metadata([ty, ty, ir.Constant(irutil.i64, 0)])
+
+        instr.set_metadata('tbaa', tag)
+        return instr
+
+    def new_profile_site(self, kind):
+        index = self._profile_sites[kind]
+        self._profile_sites[kind] += 1
+        return pgo.site_name(self._function.name, kind, index)
 
     def emit_error(self, msg, *, node=None):
         print(color.color('magenta', 'Error: {}'.format(msg)))
 
+    def bind_slot(self, decl, value):
+        """
+        Bind the local variable `decl` to `value`, the alloca holding it.
+        """
+        slot = decl.slot
+        if slot >= len(self.slots):
+            # A top-level expression doesn't record its slot count.
+            self.slots.extend([None] * (slot + 1 - len(self.slots)))
+
+        self.slots[slot] = value
+
+    def slot_value(self, slot):
+        if slot is None or slot >= len(self.slots):
+            return None
+
+        return self.slots[slot]
+
     def add_alloca(self, name, ty):
         if ty is None:
             return None
@@ -26,7 +154,27 @@ class Codegen(ast.ASTVisitor):
         with self.builder.goto_entry_block():
             return self.builder.alloca(ty, name=name)
 
+    def declare_runtime(self, name, fty):
+        func = self.module.globals.get(name)
+        if func is None:
+            func = ir.Function(self.module, fty, name)
+        return func
+
     def visit_ForExpr(self, expr):
+        if expr.parallel:
+            return self.emit_parallel_for(expr)
+
+        loop = loops.counted_loop(expr) if self._count_loops else None
+        if loop:
+            return self.emit_counted_for(expr, loop)
+
+        return self.emit_for(expr)
+
+    def emit_for(self, expr):
+        """
+        Lower a sequential `for` loop the general way, evaluating its end
+        condition and step every iteration.
+        """
         start_val = self.visit(expr.start)
         alloca = self.add_alloca(expr.name, _llvm_ty(expr.decl_ty))
         ok = True
@@ -35,7 +183,8 @@ class Codegen(ast.ASTVisitor):
             self.builder.store(start_val, alloca)
         else:
             ok = False
-        self.decl_values[expr] = alloca
+        self.bind_slot(expr, alloca)
+        self.declare_variable(expr, alloca, expr.decl_ty)
 
         # generate loop
         for_block = self.builder.append_basic_block('for')
@@ -54,9 +203,15 @@ class Codegen(ast.ASTVisitor):
             end_val_bool = ir.Constant(ir.IntType(1), 0)
             ok = False
 
+        test_block = self.builder.block
         with self.builder.if_then(end_val_bool):
             self.builder.branch(exit_block)
 
+        if self.profile:
+            site = self.new_profile_site('for')
+            self.profile.branch(self, test_block.terminator, site + '.exit', site + '.body')
+            self.profile.edge(self, site + '.body')
+
         # generate loop body
         if not self.visit(expr.body):
             ok = False
@@ -76,11 +231,287 @@ class Codegen(ast.ASTVisitor):
         self.builder.function.blocks.append(exit_block)
         self.builder.position_at_end(exit_block)
 
+        if self.profile:
+            self.profile.edge(self, site + '.exit')
+
         if not ok:
             return None
 
         return ir.Constant(ir.DoubleType(), 0.0)
 
+    def emit_counted_for(self, expr, loop):
+        """
+        Lower a `for` loop that `loops.counted_loop` recognized.
+
+        The preheader evaluates the bound once and computes the trip count,
+        the header compares an integer counter to it, and the loop variable
+        is computed from the counter, so that scalar evolution knows how
+        many times the loop runs. A bound above `loops.EXACT_LIMIT`, or NaN,
+        takes a copy of the loop lowered by `emit_for` instead; loops nested
+        in that copy are lowered the general way too, so that nests don't
+        grow exponentially.
+
+        Both copies use the same profile sites, numbered as `emit_for`
+        alone would number them, so that a profile collected from a build
+        that doesn't count loops, e.g. at -O0, applies to one that does.
+        """
+        b = self.builder
+        i64 = irutil.i64
+
+        sites = self._profile_sites.copy()
+        bound_val = self.visit(loop.bound)
+        alloca = self.add_alloca(expr.name, _double)
+        if not (bound_val and alloca):
+            return None
+
+        self.bind_slot(expr, alloca)
+        self.declare_variable(expr, alloca, expr.decl_ty)
+
+        preheader_block = b.append_basic_block('for.preheader')
+        header_block = b.append_basic_block('for')
+        body_block = b.append_basic_block('for.body')
+        latch_block = ir.Block(b.function, name='for.latch')
+        general_block = ir.Block(b.function, name='for.general')
+        exit_block = ir.Block(b.function, name='for.exit')
+        # Count the exits of this loop, but not those of the general copy.
+        done_block = ir.Block(b.function, name='for.done') if self.profile else exit_block
+
+        exact = b.fcmp_ordered('<=', bound_val, ir.Constant(_double, loops.EXACT_LIMIT))
+        b.cbranch(exact, preheader_block, general_block)
+
+        # The values of the variable are integers, and an integer is less
+        # than the bound exactly when it is less than the bound's ceiling.
+        b.position_at_end(preheader_block)
+        start = ir.Constant(i64, loop.start)
+        step = ir.Constant(i64, loop.step)
+        below = b.fcmp_ordered('<', bound_val, ir.Constant(_double, loop.start))
+        bound_val = b.select(below, ir.Constant(_double, loop.start), bound_val)
+        ceil = self.module.declare_intrinsic('llvm.ceil', [_double])
+        end = b.fptosi(b.call(ceil, [bound_val]), i64)
+        trip_count = b.udiv(b.add(b.sub(end, start), ir.Constant(i64, loop.step - 1)), step,
+                            name=expr.name + '.trips')
+        b.branch(header_block)
+
+        b.position_at_end(header_block)
+        counter = b.phi(i64, name=expr.name + '.count')
+        counter.add_incoming(ir.Constant(i64, 0), preheader_block)
+        b.cbranch(b.icmp_unsigned('==', counter, trip_count), done_block, body_block)
+
+        if self.profile:
+            site = self.new_profile_site('for')
+            self.profile.branch(self, header_block.terminator, site + '.exit', site + '.body')
+
+        b.position_at_end(body_block)
+        if self.profile:
+            self.profile.edge(self, site + '.body')
+
+        index = counter
+        if loop.step != 1:
+            index = b.mul(index, step)
+        if loop.start:
+            index = b.add(index, start)
+        b.store(b.sitofp(index, _double), alloca)
+
+        self._loop_indices[expr] = index
+        try:
+            ok = self.visit(expr.body)
+        finally:
+            del self._loop_indices[expr]
+
+        b.branch(latch_block)
+        b.function.blocks.append(latch_block)
+        b.position_at_end(latch_block)
+        next_counter = b.add(counter, ir.Constant(i64, 1), name=expr.name + '.next')
+        counter.add_incoming(next_counter, latch_block)
+        b.branch(header_block)
+
+        if self.profile:
+            b.function.blocks.append(done_block)
+            b.position_at_end(done_block)
+            self.profile.edge(self, site + '.exit')
+            b.branch(exit_block)
+
+        b.function.blocks.append(general_block)
+        b.position_at_end(general_block)
+        self._profile_sites = sites
+        saved, self._count_loops = self._count_loops, False
+        try:
+            if not self.emit_for(expr):
+                ok = False
+        finally:
+            self._count_loops = saved
+        b.branch(exit_block)
+
+        b.function.blocks.append(exit_block)
+        b.position_at_end(exit_block)
+
+        if not ok:
+            return None
+
+        return ir.Constant(_double, 0.0)
+
+    def emit_parallel_for(self, expr):
+        """
+        Lower ``parallel for``.
+
+        The loop header runs sequentially, exactly like a `for` loop's, and
+        collects the successive values of the loop variable into an array.
+        The body is outlined into a function that runs the iterations in a
+        range of that array, and ``__toycomp_parallel_for`` in
+        ``stdlib/parallel.c`` spreads the ranges over its threads. The body
+        reads the variables it shares with the enclosing function from a
+        struct of their values; the typechecker makes sure it doesn't assign
+        to them.
+        """
+        b = self.builder
+        i64 = irutil.i64
+
+        start_val = self.visit(expr.start)
+        alloca = self.add_alloca(expr.name, _llvm_ty(expr.decl_ty))
+        if not (alloca and start_val):
+            return None
+
+        b.store(start_val, alloca)
+        self.bind_slot(expr, alloca)
+        self.declare_variable(expr, alloca, expr.decl_ty)
+
+        values = self.add_alloca(expr.name + '.values', _double_ptr)
+        count = self.add_alloca(expr.name + '.count', i64)
+        capacity = self.add_alloca(expr.name + '.capacity', i64)
+        b.store(ir.Constant(_double_ptr, None), values)
+        b.store(ir.Constant(i64, 0), count)
+        b.store(ir.Constant(i64, 0), capacity)
+
+        header_block = b.append_basic_block('pfor.header')
+        exit_block = ir.Block(b.function, name='pfor.run')
+
+        b.branch(header_block)
+        b.position_at_end(header_block)
+
+        end_val = self.visit(expr.end)
+        if not end_val:
+            return None
+
+        with b.if_then(b.fcmp_ordered('==', end_val, ir.Constant(_double, 0.0))):
+            b.branch(exit_block)
+
+        # Append the loop variable to the array, doubling it when it's full.
+        n = b.load(count)
+        with b.if_then(b.icmp_signed('==', n, b.load(capacity))):
+            old = b.load(capacity)
+            new = b.add(b.add(old, old), ir.Constant(i64, 16))
+            realloc = self.declare_runtime('realloc', ir.FunctionType(irutil.i8_ptr, [irutil.i8_ptr, i64]))
+            grown = b.call(realloc, [b.bitcast(b.load(values), irutil.i8_ptr), b.mul(new, ir.Constant(i64, 8))])
+            with b.if_then(b.icmp_unsigned('==', grown, ir.Constant(irutil.i8_ptr, None)), likely=False):
+                abort = self.declare_runtime('abort', ir.FunctionType(ir.VoidType(), []))
+                abort.attributes.add('noreturn')
+                abort.attributes.add('cold')
+                b.call(abort, [])
+                b.unreachable()
+            b.store(b.bitcast(grown, _double_ptr), values)
+            b.store(new, capacity)
+
+        b.store(b.load(alloca), b.gep(b.load(values), [n]))
+        b.store(b.add(n, ir.Constant(i64, 1)), count)
+
+        step_val = self.visit(expr.step)
+        if not step_val:
+            return None
+        b.store(b.fadd(b.load(alloca), step_val, expr.name), alloca)
+        b.branch(header_block)
+
+        b.function.blocks.append(exit_block)
+        b.position_at_end(exit_block)
+
+        collector = _SlotCollector()
+        collector.visit(expr.body)
+        captures = [(slot, self.slots[slot]) for slot in sorted(collector.slots)
+                    if slot != expr.slot and self.slot_value(slot)]
+
+        env_ty = ir.LiteralStructType([var.type.pointee for _, var in captures])
+        env = self.add_alloca(expr.name + '.env', env_ty)
+        for i, (_, var) in enumerate(captures):
+            b.store(b.load(var), b.gep(env, [ir.Constant(irutil.i32, 0), ir.Constant(irutil.i32, i)]))
+
+        body_func = self.outline_parallel_body(expr, captures, env_ty)
+        if not body_func:
+            return None
+
+        run = self.declare_runtime(PARALLEL_FOR, ir.FunctionType(
+            ir.VoidType(), [_parallel_body_ty.as_pointer(), irutil.i8_ptr, _double_ptr, i64]))
+        free = self.declare_runtime('free', ir.FunctionType(ir.VoidType(), [irutil.i8_ptr]))
+
+        b.call(run, [body_func, b.bitcast(env, irutil.i8_ptr), b.load(values), b.load(count)])
+        b.call(free, [b.bitcast(b.load(values), irutil.i8_ptr)])
+
+        return ir.Constant(_double, 0.0)
+
+    def outline_parallel_body(self, expr, captures, env_ty):
+        """
+        Emit the function that runs the iterations ``begin`` to ``end`` of a
+        ``parallel for``; see `emit_parallel_for`.
+        """
+        name = self.module.get_unique_name('{}.parallel'.format(self._function.name))
+        func = ir.Function(self.module, _parallel_body_ty, name)
+        func.linkage = 'internal'
+        env_arg, values_arg, begin_arg, end_arg = func.args
+        env_arg.name, values_arg.name, begin_arg.name, end_arg.name = 'env', 'values', 'begin', 'end'
+
+        saved_builder, saved_slots, saved_scope = self.builder, self.slots, self._debug_scope
+        saved_indices = self._loop_indices
+        self.builder = b = ir.IRBuilder()
+        self.slots = list(saved_slots)
+        self._loop_indices = {}
+
+        try:
+            entry = func.append_basic_block('entry')
+            prologue = func.append_basic_block('prologue')
+            b.position_at_end(entry)
+            b.branch(prologue)
+            b.position_at_end(prologue)
+
+            if self._debug_scope:
+                self._debug_scope = self.debug_info.subprogram(self, func, func.name, None, expr)
+                b.debug_metadata = self.debug_info.location(self, expr, self._debug_scope)
+
+            env = b.bitcast(env_arg, env_ty.as_pointer())
+            for i, (slot, var) in enumerate(captures):
+                value = b.load(b.gep(env, [ir.Constant(irutil.i32, 0), ir.Constant(irutil.i32, i)]))
+                local = self.add_alloca(var.name, var.type.pointee)
+                b.store(value, local)
+                self.slots[slot] = local
+
+            alloca = self.add_alloca(expr.name, _llvm_ty(expr.decl_ty))
+            self.bind_slot(expr, alloca)
+            self.declare_variable(expr, alloca, expr.decl_ty)
+
+            loop_block = b.append_basic_block('pfor.body')
+            exit_block = ir.Block(func, name='pfor.exit')
+
+            pre_block = b.block
+            b.cbranch(b.icmp_signed('<', begin_arg, end_arg), loop_block, exit_block)
+            b.position_at_end(loop_block)
+
+            k = b.phi(irutil.i64, name='k')
+            k.add_incoming(begin_arg, pre_block)
+            b.store(b.load(b.gep(values_arg, [k])), alloca)
+
+            if not self.visit(expr.body):
+                return None
+
+            next_k = b.add(k, ir.Constant(irutil.i64, 1), name='k.next')
+            k.add_incoming(next_k, b.block)
+            b.cbranch(b.icmp_signed('<', next_k, end_arg), loop_block, exit_block)
+
+            func.blocks.append(exit_block)
+            b.position_at_end(exit_block)
+            b.ret_void()
+        finally:
+            self.builder, self.slots, self._debug_scope = saved_builder, saved_slots, saved_scope
+            self._loop_indices = saved_indices
+
+        return func
+
     def visit_NumberExpr(self, expr):
         return ir.Constant(_llvm_ty(expr.ty), expr.value)
 
@@ -95,15 +526,25 @@ class Codegen(ast.ASTVisitor):
                                              ir.Constant(ir.DoubleType(), 0.0),
                                              name='ifcond')
 
+        site = self.new_profile_site('if') if self.profile else None
+        test_block = self.builder.block
+
         with self.builder.if_else(test_val) as (then, else_):
             with then:
+                if site:
+                    self.profile.edge(self, site + '.then')
                 true_val = self.visit(expr.true)
                 true_block = self.builder.block
 
             with else_:
+                if site:
+                    self.profile.edge(self, site + '.else')
                 false_val = self.visit(expr.false)
                 false_block = self.builder.block
 
+        if site:
+            self.profile.branch(self, test_block.terminator, site + '.then', site + '.else')
+
         phi = self.builder.phi(expr.ty.llvm_ty, name='iftmp')
         phi.add_incoming(true_val, true_block)
         phi.add_incoming(false_val, false_block)
@@ -111,7 +552,7 @@ class Codegen(ast.ASTVisitor):
         return phi
 
     def visit_Function(self, stmt):
-        func = self.module.get_global(stmt.proto.name)
+        func = self.module.globals.get(stmt.proto.name)
 
         if not func:
             func = self.visit(stmt.proto)
@@ -124,36 +565,122 @@ class Codegen(ast.ASTVisitor):
                             node=stmt.proto)
             return None
 
+        body_func = func
+        if self.instrument:
+            body_func = self.instrument.begin_function(self, func, stmt)
+
         # The entry basic block just holds alloca instructions. The IRBuilder
         # in the llvmlite LLVM bindings doesn't support restoring its position
         # after a jump to the end of a basic block.
-        entry = func.append_basic_block(name='entry')
-        bb = func.append_basic_block(name='prologue')
+        entry = body_func.append_basic_block(name='entry')
+        bb = body_func.append_basic_block(name='prologue')
 
         self.builder.position_at_end(entry)
         self.builder.branch(bb)
         self.builder.position_at_end(bb)
 
-        for arg, param in zip(func.args, stmt.proto.params):
+        self._function = func
+        self.slots = [None] * stmt.slot_count
+
+        if self.debug_info:
+            self._debug_scope = self.debug_info.subprogram(self, body_func, stmt.proto.name,
+                                                           stmt.proto.decl_ty, stmt)
+            self.builder.debug_metadata = self.debug_info.location(self, stmt, self._debug_scope)
+
+        try:
+            result = self.emit_function_body(stmt, func, body_func)
+        finally:
+            self._debug_scope = self.builder.debug_metadata = None
+
+        if not result:
+            body_func.basic_blocks.clear()
+            if self.instrument:
+                self.instrument.abandon_function(self, func, stmt)
+            return None
+
+        if self.instrument:
+            self.instrument.end_function(self, func, stmt)
+
+        return func
+
+    def emit_function_body(self, stmt, func, body_func):
+        if self.profile:
+            self._profile_sites.clear()
+            self.profile.function_entry(self, func)
+
+        for i, (arg, param) in enumerate(zip(body_func.args, stmt.proto.params)):
             alloca = self.add_alloca(arg.name, arg.type)
             self.builder.store(arg, alloca)
-            self.decl_values[param] = alloca
+            self.bind_slot(param, alloca)
+            self.declare_variable(param, alloca, param.decl_ty, arg=i + 1)
+
+        if stmt.memo:
+            memo = self.emit_memo_lookup(func, body_func)
 
         result = self.visit(stmt.body)
 
         if not result:
-            func.basic_blocks.clear()
             return None
 
+        if stmt.memo:
+            self.emit_memo_store(memo, result)
+
         self.builder.ret(result)
+        return result
 
-        return func
+    def emit_memo_lookup(self, func, body_func):
+        """
+        Emit the cache for the memo function `func` and return the cached
+        result if there is one for the arguments, using ``stdlib/memo.c``.
+
+        :returns: what `emit_memo_store` needs
+        """
+        b = self.builder
+        nargs = len(body_func.args)
+
+        table = ir.GlobalVariable(self.module, memo_ty, self.module.get_unique_name(func.name + '.memo'))
+        table.linkage = 'internal'
+        null = ir.Constant(irutil.i8_ptr, None)
+        table.initializer = ir.Constant(memo_ty, [
+            irutil.c_string(self.module, table.name + '.name', func.name),
+            ir.Constant(irutil.i64, nargs),
+            ir.Constant(irutil.i64, MEMO_CAPACITY),
+            null, ir.Constant(irutil.i64, 0), ir.Constant(irutil.i64, 0), ir.Constant(irutil.i64, 0),
+            null, ir.Constant(irutil.i64, 0),
+        ])
+
+        # The key is the arguments as passed, even if the body assigns to
+        # the parameters.
+        args = self.add_alloca('memo.args', ir.ArrayType(_double, nargs))
+        zero = ir.Constant(irutil.i32, 0)
+        for i, arg in enumerate(body_func.args):
+            b.store(arg, b.gep(args, [zero, ir.Constant(irutil.i32, i)], inbounds=True))
+        args = b.gep(args, [zero, zero], inbounds=True)
+
+        cached = self.add_alloca('memo.result', _double)
+        lookup = self.declare_runtime(MEMO_LOOKUP, ir.FunctionType(
+            irutil.i32, [memo_ty.as_pointer(), _double_ptr, _double_ptr]))
+
+        hit = b.call(lookup, [table, args, cached])
+        with b.if_then(b.icmp_signed('!=', hit, ir.Constant(irutil.i32, 0))):
+            b.ret(b.load(cached))
+
+        return table, args
+
+    def emit_memo_store(self, memo, result):
+        table, args = memo
+        store = self.declare_runtime(MEMO_STORE, ir.FunctionType(
+            ir.VoidType(), [memo_ty.as_pointer(), _double_ptr, _double]))
+        self.builder.call(store, [table, args, result])
 
     def visit_CallExpr(self, expr):
         callee = self.visit(expr.func)
         if not callee:
             return None
 
+        if self.instrument:
+            callee = self.instrument.callee(self, callee)
+
         arg_vals = [self.visit(a) for a in expr.args]
         if not all(arg_vals):
             return None
@@ -177,7 +704,8 @@ class Codegen(ast.ASTVisitor):
         alloca = self.add_alloca(expr.name, expr.decl_ty.llvm_ty)
         init_val = self.visit(expr.init)
         self.builder.store(init_val, alloca)
-        self.decl_values[expr] = alloca
+        self.bind_slot(expr, alloca)
+        self.declare_variable(expr, alloca, expr.decl_ty)
 
         body_val = self.visit(expr.body)
         return body_val
@@ -185,15 +713,25 @@ class Codegen(ast.ASTVisitor):
     def visit_BinaryExpr(self, expr):
         # Special-case '=': Don't emit LHS as an expression.
         if expr.op == '=':
+            if isinstance(expr.lhs, ast.IndexExpr):
+                ptr = self.element_pointer(expr.lhs)
+                rhs_val = self.visit(expr.rhs)
+                if not (ptr and rhs_val):
+                    return None
+
+                self.tbaa(self.builder.store(rhs_val, ptr), 'element')
+                return rhs_val
+
             if not isinstance(expr.lhs, ast.VariableExpr):
-                self.emit_error('target of assignment must be a variable name', node=expr)
+                self.emit_error('target of assignment must be a variable name or an element of '
+                                'a buffer', node=expr)
                 return None
 
             rhs_val = self.visit(expr.rhs)
             if not rhs_val:
                 return None
 
-            var = self.decl_values.get(expr.lhs.decl)
+            var = self.slot_value(expr.lhs.slot)
             if not var:
                 return None
 
@@ -223,12 +761,63 @@ class Codegen(ast.ASTVisitor):
             self.emit_error('invalid binary operator {!r}'.format(op), node=expr)
             return None
 
+    def element_pointer(self, expr):
+        """
+        Get a pointer to the buffer element that `expr` indexes, checking
+        the index first unless bounds checks are off.
+        """
+        buffer = self.visit(expr.target)
+        # Index with the variable of a counted loop without converting it
+        # to double and back, so that scalar evolution sees the address.
+        index = None
+        if isinstance(expr.index, ast.VariableExpr):
+            index = self._loop_indices.get(expr.index.decl)
+        if index is None:
+            index = self.visit(expr.index)
+            if index:
+                index = self.builder.fptosi(index, irutil.i64, name='index')
+
+        if not (buffer and index):
+            return None
+
+        b = self.builder
+        zero = ir.Constant(irutil.i32, 0)
+        data = self.tbaa(b.load(b.gep(buffer, [zero, zero], inbounds=True), name='data'), 'data')
+
+        if self.bounds_check:
+            length = self.tbaa(b.load(b.gep(buffer, [zero, ir.Constant(irutil.i32, 1)], inbounds=True),
+                                      name='length'), 'length')
+            # Negative indices are out of range as unsigned numbers.
+            in_bounds = b.icmp_unsigned('<', index, length)
+            with b.if_then(b.not_(in_bounds), likely=False):
+                error = self.declare_runtime(BOUNDS_ERROR,
+                                             ir.FunctionType(ir.VoidType(), [irutil.i64, irutil.i64]))
+                error.attributes.add('noreturn')
+                error.attributes.add('cold')
+                b.call(error, [index, length])
+                b.unreachable()
+
+        return b.gep(data, [index], inbounds=True)
+
+    def visit_IndexExpr(self, expr):
+        ptr = self.element_pointer(expr)
+        if not ptr:
+            return None
+
+        return self.tbaa(self.builder.load(ptr), 'element')
+
     def visit_VariableExpr(self, expr):
-        ptr = self.decl_values.get(expr.decl)
+        ptr = self.slot_value(expr.slot)
         if ptr:
             return self.builder.load(ptr, name=expr.name)
 
-        return self.decl_consts.get(expr.decl)
+        const = self.decl_consts.get(expr.decl)
+        if const is None and isinstance(expr.decl, ast.Prototype):
+            # Defined by an earlier unit that shared this unit's frontend
+            # state, e.g. a previous REPL input; declare it here.
+            const = self.module.globals.get(expr.decl.name) or self.visit(expr.decl)
+
+        return const
 
     def visit_FormalParamDecl(self, decl):
         # Not used.
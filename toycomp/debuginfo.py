@@ -0,0 +1,195 @@
+"""
+DWARF debug information, so that debuggers and profilers can map machine
+code back to lines of the ``.kal`` source.
+
+`DebugInfo` holds code generator hooks: each function gets a subprogram,
+each instruction the location of the innermost AST node it was generated
+for, and each parameter and local variable a description of its alloca.
+"""
+import os
+
+from llvmlite import ir
+
+from toycomp import types
+
+PRODUCER = 'toycomp'
+
+_i32 = ir.IntType(32)
+
+
+def _line(node):
+    # Source locations count lines from 0, DWARF from 1.
+    return node.source_range.begin.line + 1
+
+
+def _column(node):
+    return node.source_range.begin.column + 1
+
+
+class DebugInfo:
+    """
+    Code generator hooks that emit debug information.
+
+    :param str filename: the path of the source file
+    :param bool optimized: whether the code will be optimized
+    """
+    def __init__(self, filename, *, optimized=False):
+        self.filename = filename
+        self.optimized = optimized
+        self._module = None
+        self._types = {}
+        self._declare = None
+
+    def _begin_module(self, module):
+        if self._module is module:
+            return
+
+        self._module = module
+        self._types.clear()
+
+        path = os.path.abspath(self.filename)
+        self._file = module.add_debug_info('DIFile', {
+            'filename': os.path.basename(path),
+            'directory': os.path.dirname(path),
+        })
+        self._unit = module.add_debug_info('DICompileUnit', {
+            # DWARF has no code for Kaleidoscope.
+            'language': ir.DIToken('DW_LANG_C'),
+            'file': self._file,
+            'producer': PRODUCER,
+            'isOptimized': self.optimized,
+            'runtimeVersion': 0,
+            'emissionKind': ir.DIToken('FullDebug'),
+        }, is_distinct=True)
+        self._expression = module.add_debug_info('DIExpression', {})
+        self._declare = module.declare_intrinsic('llvm.dbg.declare', fnty=ir.FunctionType(
+            ir.VoidType(), [ir.MetaDataType()] * 3))
+
+        module.add_named_metadata('llvm.dbg.cu', self._unit)
+        module.add_named_metadata('llvm.module.flags', [_i32(2), 'Dwarf Version', _i32(4)])
+        module.add_named_metadata('llvm.module.flags', [_i32(2), 'Debug Info Version', _i32(3)])
+
+    def _type(self, ty):
+        di = self._types.get(ty)
+        if di is not None:
+            return di
+
+        m = self._module
+
+        if ty is types.double_ty:
+            di = m.add_debug_info('DIBasicType', {
+                'name': 'double', 'size': 64, 'encoding': ir.DIToken('DW_ATE_float'),
+            })
+        elif ty is types.int_ty:
+            di = m.add_debug_info('DIBasicType', {
+                'name': 'int', 'size': 32, 'encoding': ir.DIToken('DW_ATE_signed'),
+            })
+        elif ty is types.buffer_ty:
+            data = m.add_debug_info('DIDerivedType', {
+                'tag': ir.DIToken('DW_TAG_member'), 'name': 'data', 'file': self._file,
+                'baseType': m.add_debug_info('DIDerivedType', {
+                    'tag': ir.DIToken('DW_TAG_pointer_type'), 'size': 64,
+                    'baseType': self._type(types.double_ty),
+                }),
+                'size': 64, 'offset': 0,
+            })
+            length = m.add_debug_info('DIDerivedType', {
+                'tag': ir.DIToken('DW_TAG_member'), 'name': 'length', 'file': self._file,
+                'baseType': m.add_debug_info('DIBasicType', {
+                    'name': 'int64_t', 'size': 64, 'encoding': ir.DIToken('DW_ATE_signed'),
+                }),
+                'size': 64, 'offset': 64,
+            })
+            struct = m.add_debug_info('DICompositeType', {
+                'tag': ir.DIToken('DW_TAG_structure_type'), 'name': 'toycomp_buffer',
+                'file': self._file, 'size': 128, 'elements': m.add_metadata([data, length]),
+            })
+            di = m.add_debug_info('DIDerivedType', {
+                'tag': ir.DIToken('DW_TAG_pointer_type'), 'name': 'buffer', 'size': 64,
+                'baseType': struct,
+            })
+        elif isinstance(ty, types.FunctionType):
+            di = m.add_debug_info('DIDerivedType', {
+                'tag': ir.DIToken('DW_TAG_pointer_type'), 'size': 64,
+                'baseType': self._subroutine_type(ty),
+            })
+        else:
+            raise TypeError('no debug information for type {}'.format(ty))
+
+        self._types[ty] = di
+        return di
+
+    def _subroutine_type(self, ty):
+        # A function without a source-level type, e.g. an outlined loop body,
+        # is described as returning nothing and taking no parameters.
+        signature = [self._type(t) for t in (ty.result, *ty.params)] if ty else [None]
+        return self._module.add_debug_info('DISubroutineType', {
+            'types': self._module.add_metadata(signature),
+        })
+
+    def subprogram(self, cg, func, name, ty, node):
+        """
+        Describe `func`, which holds the code of the source function `name`
+        of type `ty`, defined by `node`. `ty` may be None for functions the
+        compiler introduces.
+
+        :returns: the scope of the locations in `func`
+        """
+        self._begin_module(cg.module)
+        line = _line(node) if node.source_range else 0
+        flags = ['DISPFlagDefinition']
+        if func.linkage in ('internal', 'private'):
+            flags.append('DISPFlagLocalToUnit')
+        if self.optimized:
+            flags.append('DISPFlagOptimized')
+
+        sp = cg.module.add_debug_info('DISubprogram', {
+            'name': name,
+            'linkageName': func.name,
+            'scope': self._file,
+            'file': self._file,
+            'line': line,
+            'type': self._subroutine_type(ty),
+            'scopeLine': line,
+            'flags': ir.DIToken('DIFlagPrototyped'),
+            'spFlags': ir.DIToken('|'.join(flags)),
+            'unit': self._unit,
+        }, is_distinct=True)
+        func.set_metadata('dbg', sp)
+
+        return sp
+
+    def location(self, cg, node, scope):
+        """
+        Get the location of `node` in `scope`, or None if it has none.
+        """
+        if not node.source_range:
+            return None
+
+        return cg.module.add_debug_info('DILocation', {
+            'line': _line(node),
+            'column': _column(node),
+            'scope': scope,
+        })
+
+    def declare_variable(self, cg, decl, alloca, ty, scope, *, arg=None):
+        """
+        Describe the variable `decl`, which lives in `alloca`.
+
+        :param int arg: the position of a parameter, counting from 1
+        """
+        if alloca is None:
+            return
+
+        fields = {
+            'name': decl.name,
+            'scope': scope,
+            'file': self._file,
+            'line': _line(decl) if decl.source_range else 0,
+            'type': self._type(ty),
+        }
+        if arg is not None:
+            fields['arg'] = arg
+
+        var = cg.module.add_debug_info('DILocalVariable', fields)
+        cg.builder.call(self._declare, [ir.MetaDataArgument(alloca), var, self._expression])
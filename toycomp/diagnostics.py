@@ -1,5 +1,6 @@
 import collections
 import enum
+import json
 
 from toycomp import color
 from toycomp.translation import *
@@ -7,6 +8,7 @@ from toycomp.translation import *
 
 class DiagnosticSeverity(enum.Enum):
     error = 0
+    fatal = 1
 
 
 class Diagnostic:
@@ -15,6 +17,19 @@ class Diagnostic:
         self.node = node
         self.message = message
 
+    @property
+    def source_range(self):
+        if self.node:
+            return self.node.source_range
+        return None
+
+
+class ErrorLimitReached(Exception):
+    """
+    Raised by `DiagnosticsEngine` to abandon compilation once the error limit
+    has been reached.
+    """
+
 
 class DiagnosticConsumer:
     def __init__(self):
@@ -28,43 +43,120 @@ class DiagnosticConsumer:
 
 
 class DiagnosticPrinter(DiagnosticConsumer):
+    """
+    Collects diagnostics and writes them to `stream` in a single batch when
+    `finish()` is called.
+    """
     def __init__(self, stream):
         super().__init__()
         self.stream = stream
+        self.diagnostics = []
 
     def handle_diagnostic(self, diag):
         super().handle_diagnostic(diag)
+        self.diagnostics.append(diag)
 
-        if diag.node and diag.node.source_range:
-            file, line, col = diag.node.source_range.begin
+    def format_diagnostic(self, diag):
+        source_range = diag.source_range
+
+        if source_range:
+            file, line, col = source_range.begin
             pos_str = '{}:{}:{}: '.format(file.name, line + 1, col)
-            squiggly = diag.node.source_range.to_squiggly()
+            squiggly = source_range.to_squiggly()
         else:
             pos_str = ''
             squiggly = ''
 
-        header = '{}{} {}'.format(pos_str, color.color('magenta', diag.severity.name + ':'), diag.message)
-        print(header, file=self.stream)
+        severity = 'fatal error' if diag.severity is DiagnosticSeverity.fatal else diag.severity.name
+        lines = ['{}{} {}'.format(pos_str, color.color('magenta', severity + ':'), diag.message)]
         if squiggly:
-            print(color.color('green', squiggly),
-                  file=self.stream)
+            lines.append(color.color('green', squiggly))
+
+        return lines
 
     def finish(self):
         super().finish()
 
-        if self.message_count[DiagnosticSeverity.error]:
-            count = self.message_count[DiagnosticSeverity.error]
-            print(ntr('{} error generated.', '{} errors generated.', count).format(count),
-                  file=self.stream)
+        lines = []
+        for diag in self.diagnostics:
+            lines.extend(self.format_diagnostic(diag))
+
+        count = self.message_count[DiagnosticSeverity.error]
+        if count:
+            lines.append(ntr('{} error generated.', '{} errors generated.', count).format(count))
+
+        if lines:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+
+        self.diagnostics.clear()
+
+
+class DiagnosticJSONPrinter(DiagnosticPrinter):
+    """
+    Writes the collected diagnostics to `stream` as one JSON document.
+    """
+    def format_diagnostic(self, diag):
+        result = {
+            'severity': diag.severity.name,
+            'message': diag.message,
+        }
+
+        source_range = diag.source_range
+        if source_range:
+            (file, line1, col1), (_, line2, col2) = source_range
+            result.update(file=file.name,
+                          line=line1 + 1,
+                          column=col1,
+                          end_line=line2 + 1,
+                          end_column=col2)
+
+        return result
+
+    def finish(self):
+        DiagnosticConsumer.finish(self)
+
+        json.dump({
+            'diagnostics': [self.format_diagnostic(d) for d in self.diagnostics],
+            'error_count': self.message_count[DiagnosticSeverity.error],
+        }, self.stream)
+        self.stream.write('\n')
+        self.stream.flush()
+
+        self.diagnostics.clear()
 
 
 class DiagnosticsEngine:
-    def __init__(self, consumer):
+    def __init__(self, consumer, *, max_errors=0):
+        """
+        :param DiagnosticConsumer consumer: the consumer that receives diagnostics
+        :param int max_errors: the number of errors after which compilation
+            stops with `ErrorLimitReached`; 0 means no limit
+        """
         self.consumer = consumer
+        self.max_errors = max_errors
+        self.error_count = 0
 
     def emit(self, diag):
         self.consumer.handle_diagnostic(diag)
 
+        if diag.severity is DiagnosticSeverity.error:
+            self.error_count += 1
+
+            if self.max_errors and self.error_count >= self.max_errors:
+                self.consumer.handle_diagnostic(
+                        Diagnostic(DiagnosticSeverity.fatal,
+                                   None,
+                                   tr('too many errors emitted, stopping now')))
+                raise ErrorLimitReached
+
+    def reset(self):
+        """
+        Start counting errors from zero, e.g. for the next input in a REPL.
+        """
+        self.error_count = 0
+        self.consumer.message_count.clear()
+
     def error(self, node, message):
         self.emit(Diagnostic(DiagnosticSeverity.error,
                              node,
@@ -1,54 +1,446 @@
 import argparse
-
+import contextlib
+import os
 import sys
+import tracemalloc
+
+from llvmlite import ir
 
-from toycomp import parser
+from toycomp import ast, callgraph, debuginfo, emit, frontend, instrument, linker, mirgen, optimizer
+from toycomp import parser, pgo, stats, target
 from toycomp.codegen import Codegen
-from toycomp.compilepass import PassManager
-from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter
-from toycomp.nameres import NameResolver
-from toycomp.typechecker import Typechecker
-from toycomp.user_op_rewriter import UserOpRewriter
+from toycomp.diagnostics import (
+    DiagnosticsEngine,
+    DiagnosticJSONPrinter,
+    DiagnosticPrinter
+)
 
 
 class Driver:
-    def __init__(self, triple):
-        self._diags = DiagnosticsEngine(DiagnosticPrinter(sys.stderr))
-        self._pm = PassManager([
-            UserOpRewriter(),
-            NameResolver(self._diags),
-            Typechecker(self._diags),
-        ])
-
-        self._cg = Codegen()
-        self._cg.module.triple = triple
-
-    def run(self, source, *, name=None):
+    def __init__(self, triple, *, cpu=None, features=None, opt_level=0,
+                 vectorize=True, vectorize_report=False, max_errors=0,
+                 diagnostics_format='text', profile_generate=False, profile_use=None,
+                 instrument=False, instrument_threshold=instrument.DEFAULT_THRESHOLD,
+                 bounds_check=True, whole_program=False, exports=(), debug=False,
+                 stats=None, count_loops=True, mir=False):
+        """
+        :param toycomp.stats.CompileStats stats: where to record resource
+            statistics, if anywhere
+        :param bool count_loops: lower loops with an integral constant start
+            and step and an invariant bound to counted loops; only when
+            optimizing, since no pass uses their trip count at -O0
+        :param bool mir: generate functions through `toycomp.mir`, whose
+            passes shrink the LLVM IR before it is built; not with profiling,
+            instrumentation or debug information, which hook into
+            `toycomp.codegen.Codegen`
+        """
+        printer = DiagnosticJSONPrinter if diagnostics_format == 'json' else DiagnosticPrinter
+        self._diags = DiagnosticsEngine(printer(sys.stderr), max_errors=max_errors)
+
+        self._opt_level = opt_level
+        self._profile_generate = profile_generate
+        self._instrument = instrument
+        self._instrument_threshold = instrument_threshold
+        self._bounds_check = bounds_check
+        self._count_loops = count_loops and opt_level > 0
+        self._mir = mir
+        self._whole_program = whole_program
+        self._exports = tuple(exports)
+        self._debug = debug
+        self.stats = stats
+        self._profile_data = pgo.ProfileData.load(profile_use) if profile_use else None
+        self._vectorize = vectorize
+        self._vectorize_report = vectorize_report
+        self._tm = target.create_target_machine(triple,
+                                                cpu=cpu,
+                                                features=features,
+                                                opt_level=opt_level)
+
+    @property
+    def target_machine(self):
+        return self._tm
+
+    def _phase(self, name, unit=None):
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.phase(name, unit=unit)
+
+    @property
+    def entry_points(self):
+        """
+        The functions that code outside the program may call: `mainf` and
+        the exports.
+        """
+        return {callgraph.ENTRY, *self._exports}
+
+    def check(self, source, *, name=None):
+        """
+        Parse, resolve and typecheck `source`, exiting on errors.
+
+        :returns: the checked top-level nodes
+        :rtype: list[toycomp.ast.AST]
+        """
+        checker = frontend.Checker(self._diags)
+
         try:
-            exprs = list(parser.parse(source, name=name))
+            with self._phase('parse', name):
+                nodes = list(parser.parse(source, name=name))
         except SyntaxError as exc:
             raise SystemExit(str(exc))
 
-        ok = all([self._pm.visit(expr) for expr in exprs])
-        if ok:
-            ok = all([self._cg.visit(expr) for expr in exprs])
+        if self.stats:
+            self.stats.count_nodes(nodes)
+
+        with self._phase('frontend', name):
+            ok = checker.check_all(nodes)
+
+        if self.stats:
+            self.stats.count_names(checker.resolver)
 
         if not ok:
             self._diags.consumer.finish()
             raise SystemExit(1)
 
-        print(self._cg.module)
+        return nodes
+
+    def compile(self, source, *, name=None):
+        """
+        Run the frontend and code generator over `source`.
+
+        Each call compiles a separate translation unit into a new module.
+        Functions defined in other units must be declared with `extern`. In
+        whole-program mode `source` is the whole program, and functions that
+        the entry points can't reach aren't compiled.
+
+        :rtype: llvmlite.ir.Module
+        """
+        exprs = self.check(source, name=name)
+
+        if self._whole_program:
+            exprs = callgraph.prune(exprs, callgraph.reachable([exprs], self.entry_points))
+
+        return self.generate(exprs, name=name)
+
+    def generate(self, exprs, *, name=None):
+        """
+        Run the code generator over checked top-level nodes.
+
+        :rtype: llvmlite.ir.Module
+        """
+        if self._profile_generate:
+            profile = pgo.ProfileGenerator()
+        elif self._profile_data:
+            profile = pgo.ProfileUser(self._profile_data)
+        else:
+            profile = None
+
+        if self._debug:
+            debug_info = debuginfo.DebugInfo(name or '<string>', optimized=bool(self._opt_level))
+        else:
+            debug_info = None
+
+        cg = Codegen(profile=profile,
+                     instrument=self._new_instrumenter(),
+                     bounds_check=self._bounds_check,
+                     debug_info=debug_info,
+                     count_loops=self._count_loops)
+        cg.module.name = name or '<string>'
+        target.configure_module(cg.module, self._tm)
+
+        if self._mir and not (profile or cg.instrument or debug_info):
+            def visit(expr):
+                if isinstance(expr, ast.Function):
+                    return mirgen.generate(cg, expr, count_loops=self._count_loops)
+                return cg.visit(expr)
+        else:
+            visit = cg.visit
+
+        with self._phase('codegen', name):
+            if not all([visit(expr) for expr in exprs]):
+                raise SystemExit(1)
+
+            module = cg.finish()
+
+        if self.stats:
+            self.stats.measure_functions(module, 'before')
+
+        return module
+
+    def _new_instrumenter(self):
+        if not self._instrument:
+            return None
+
+        return instrument.FunctionInstrumenter(threshold=self._instrument_threshold)
+
+    def load(self, path):
+        """
+        Compile a ``.kal`` source file, or load a module that was compiled
+        separately to LLVM bitcode (``.bc``) or IR (``.ll``).
+
+        :rtype: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        """
+        if path.endswith(('.bc', '.ll')):
+            return linker.load_module(path)
+
+        with open(path) as f:
+            return self.compile(f.read(), name=path)
+
+    def load_program(self, paths):
+        """
+        Load every unit of a program for `link`; see `load`.
+
+        In whole-program mode all sources are checked before any is
+        compiled, so that only the functions the entry points reach through
+        any unit are compiled. Functions that the precompiled modules use are
+        entry points too.
+
+        :rtype: list[llvmlite.ir.Module | llvmlite.binding.ModuleRef]
+        """
+        if not self._whole_program:
+            return [self.load(path) for path in paths]
+
+        units = []
+        for path in paths:
+            if path.endswith(('.bc', '.ll')):
+                units.append(linker.load_module(path))
+            else:
+                with open(path) as f:
+                    units.append(self.check(f.read(), name=path))
+
+        sources = [unit for unit in units if isinstance(unit, list)]
+        roots = self.entry_points
+        for unit in units:
+            if not isinstance(unit, list):
+                roots.update(func.name for func in unit.functions if func.is_declaration)
+
+        live = callgraph.reachable(sources, roots)
+
+        return [self.generate(callgraph.prune(unit, live), name=path) if isinstance(unit, list) else unit
+                for path, unit in zip(paths, units)]
+
+    def link(self, modules):
+        """
+        Link separately compiled modules and optimize the result as a whole,
+        so that definitions from one unit can be inlined into the others.
+
+        :rtype: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        """
+        if len(modules) == 1:
+            [module] = modules
+        else:
+            try:
+                with self._phase('link'):
+                    module = linker.link_modules([self._module_ref(m) for m in modules])
+            except linker.LinkError as exc:
+                raise SystemExit('link error: {}'.format(exc))
+
+        if self._whole_program:
+            module = self.optimize_whole_program(module)
+
+        if self._opt_level:
+            module = self.optimize(module)
+
+        return module
+
+    @staticmethod
+    def _module_ref(module):
+        if isinstance(module, ir.Module):
+            return optimizer.parse_module(module)
+        return module
+
+    def optimize_whole_program(self, module):
+        """
+        Hide every function but the entry points from code outside `module`,
+        which must hold the whole program, and optimize across functions.
+
+        :type module: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        :rtype: llvmlite.binding.ModuleRef
+        """
+        with self._phase('whole-program'):
+            llmod = self._module_ref(module)
+            optimizer.internalize(llmod, self.entry_points)
+            return optimizer.optimize_whole_program(llmod, self._tm)
+
+    def optimize(self, module, *, name=None):
+        """
+        Optimize `module` for the target machine.
+
+        :type module: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        :rtype: llvmlite.binding.ModuleRef
+        """
+        with self._phase('optimize', name):
+            llmod = optimizer.optimize(self._module_ref(module),
+                                       self._tm,
+                                       opt_level=self._opt_level,
+                                       vectorize=self._vectorize)
+
+        if self.stats:
+            self.stats.measure_functions(llmod, 'after')
+
+        if self._vectorize_report:
+            for loop in optimizer.vectorized_loops(llmod):
+                print('{}: remark: vectorized loop {!r} in function {!r} (width {})'
+                      .format(name or '<string>', loop.block, loop.function, loop.width),
+                      file=sys.stderr)
+
+        return llmod
+
+    def run(self, source, *, name=None, output='-', fmt='ll'):
+        module = self.compile(source, name=name)
+
+        if self._whole_program:
+            module = self.optimize_whole_program(module)
+
+        if self._opt_level:
+            module = self.optimize(module, name=name)
+
+        self.emit(module, output, fmt=fmt)
+
+    def emit(self, module, output, *, fmt='ll', name=None):
+        """
+        Write `module` to `output` (``-`` for stdout); see `emit.emit`.
+        """
+        with self._phase('emit', name):
+            emit.emit(module, output, fmt=fmt, target_machine=self._tm)
+
+        if self.stats:
+            if fmt == 'obj' and output != '-':
+                size = os.path.getsize(output)
+            else:
+                size = len(self._tm.emit_object(self._module_ref(module)))
+            self.stats.measure_output(output, fmt, size)
+
+
+_extensions = {
+    'll': '.ll',
+    'bc': '.bc',
+    'asm': '.s',
+    'obj': '.o',
+}
 
 
 def main(args=None):
     ap = argparse.ArgumentParser()
-    ap.add_argument('source', type=argparse.FileType('r'))
+    ap.add_argument('sources', nargs='+', metavar='source',
+                    help='.kal source files, or .bc/.ll modules compiled with -c')
+    ap.add_argument('-c', dest='compile_only', action='store_true',
+                    help='compile each source to a separate module without linking')
     ap.add_argument('--triple')
+    ap.add_argument('--mcpu', metavar='CPU',
+                    help='target CPU name, or "native" for the host CPU')
+    ap.add_argument('--mattr', metavar='FEATURES',
+                    help='comma-separated target features, e.g. "+avx2,-fma", or "native"')
+    ap.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=0,
+                    help='optimization level')
+    ap.add_argument('--no-vectorize', dest='vectorize', action='store_false',
+                    help='disable the loop and SLP vectorizers')
+    ap.add_argument('--vectorize-report', action='store_true',
+                    help='report the loops that were vectorized')
+    ap.add_argument('--emit', choices=emit.FORMATS,
+                    help='output format: LLVM IR, LLVM bitcode, assembly or an object file '
+                         '(default: bc with -c, ll otherwise)')
+    ap.add_argument('-o', dest='output', metavar='FILE',
+                    help='write output to FILE instead of stdout')
+    ap.add_argument('--profile-generate', action='store_true',
+                    help='instrument the program to write an execution profile on exit')
+    ap.add_argument('--profile-use', metavar='FILE',
+                    help='optimize using a profile written by a --profile-generate build')
+    ap.add_argument('--instrument', action='store_true',
+                    help='count calls and measure the time spent in each function, '
+                         'reported when the program exits')
+    ap.add_argument('--instrument-threshold', metavar='N', type=int,
+                    default=instrument.DEFAULT_THRESHOLD,
+                    help='only count calls to loop-free functions with fewer than N '
+                         'AST nodes, without timing them (0 times every function)')
+    ap.add_argument('-g', dest='debug', action='store_true',
+                    help='emit DWARF debug information for source lines and variables')
+    ap.add_argument('--no-bounds-check', dest='bounds_check', action='store_false',
+                    help='do not check buffer indices')
+    ap.add_argument('--no-count-loops', dest='count_loops', action='store_false',
+                    help='lower every for loop the general way, re-evaluating its end '
+                         'condition in floating point each iteration')
+    ap.add_argument('--mir', action='store_true',
+                    help='generate code through the mid-level SSA IR, which removes common '
+                         'subexpressions, dead code and constant branches before LLVM IR is built')
+    ap.add_argument('--whole-program', action='store_true',
+                    help='compile the sources as a complete program: only compile the functions '
+                         'that mainf and the exports reach, and optimize across functions')
+    ap.add_argument('--export', dest='exports', metavar='NAME', action='append', default=[],
+                    help='with --whole-program, keep function NAME callable from other code '
+                         '(may be repeated)')
+    ap.add_argument('--stats', nargs='?', const='text', choices=['text', 'json'],
+                    help='report the time and memory each phase takes and the size of the '
+                         'AST, IR and output, as text (the default) or JSON; tracing memory '
+                         'slows compilation down')
+    ap.add_argument('--stats-file', metavar='FILE',
+                    help='write the --stats report to FILE instead of stderr')
+    ap.add_argument('--max-errors', metavar='N', type=int, default=0,
+                    help='stop compiling after N errors (0 means no limit)')
+    ap.add_argument('--diagnostics-format', choices=['text', 'json'], default='text',
+                    help='format of the diagnostics written to stderr')
 
     args = ap.parse_args(args)
 
-    driver = Driver(args.triple)
-    driver.run(args.source.read(), name=args.source.name)
+    if args.compile_only and args.output and len(args.sources) > 1:
+        ap.error('cannot specify -o with -c and multiple sources')
+
+    if args.compile_only and args.whole_program:
+        ap.error('cannot specify both -c and --whole-program')
+
+    if args.profile_generate and args.profile_use:
+        ap.error('cannot specify both --profile-generate and --profile-use')
+
+    fmt = args.emit or ('bc' if args.compile_only else 'll')
+
+    if args.compile_only:
+        outputs = [args.output or os.path.splitext(path)[0] + _extensions[fmt] for path in args.sources]
+        for path, output in zip(args.sources, outputs):
+            if os.path.abspath(output) == os.path.abspath(path):
+                ap.error('output file for {} would overwrite it; specify -o'.format(path))
+
+    compile_stats = None
+    if args.stats or args.stats_file:
+        compile_stats = stats.CompileStats()
+        tracemalloc.start()
+
+    driver = Driver(args.triple,
+                    cpu=args.mcpu,
+                    features=args.mattr,
+                    opt_level=args.opt_level,
+                    vectorize=args.vectorize,
+                    vectorize_report=args.vectorize_report,
+                    max_errors=args.max_errors,
+                    diagnostics_format=args.diagnostics_format,
+                    profile_generate=args.profile_generate,
+                    profile_use=args.profile_use,
+                    instrument=args.instrument,
+                    instrument_threshold=args.instrument_threshold,
+                    bounds_check=args.bounds_check,
+                    whole_program=args.whole_program,
+                    exports=args.exports,
+                    debug=args.debug,
+                    stats=compile_stats,
+                    count_loops=args.count_loops,
+                    mir=args.mir)
+
+    if args.compile_only:
+        for path, output in zip(args.sources, outputs):
+            module = driver.load(path)
+            if args.opt_level:
+                module = driver.optimize(module, name=path)
+
+            driver.emit(module, output, fmt=fmt, name=path)
+    else:
+        module = driver.link(driver.load_program(args.sources))
+        driver.emit(module, args.output or '-', fmt=fmt)
+
+    if compile_stats:
+        tracemalloc.stop()
+        if args.stats_file:
+            with open(args.stats_file, 'w') as f:
+                compile_stats.write(f, fmt=args.stats or 'json')
+        else:
+            compile_stats.write(sys.stderr, fmt=args.stats)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,105 @@
+"""
+Using the compiler as a library.
+
+`compile` turns a program into native functions that Python can call
+directly: each function defined in the source becomes a ctypes callable
+whose signature follows the function's type. Compiled programs are cached
+by source and options, so compiling the same program again is free.
+"""
+import threading
+
+from toycomp import ast, frontend
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class Program:
+    """
+    The functions of a compiled program. Get them as attributes or by name::
+
+        program = toycomp.compile('def add(a b) a + b;')
+        program.add(1, 2)  # 3.0
+        program['add']
+
+    The native code lives as long as the program.
+    """
+    def __init__(self, engine, types):
+        self._engine = engine
+        self.types = types
+        self._functions = {name: engine.function_of_type(name, ty) for name, ty in types.items()}
+
+    def __repr__(self):
+        return '<Program with {}>'.format(', '.join(sorted(self._functions)) or 'no functions')
+
+    def __getitem__(self, name):
+        return self._functions[name]
+
+    def __getattr__(self, name):
+        try:
+            return self._functions[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, name):
+        return name in self._functions
+
+    def __iter__(self):
+        return iter(self._functions)
+
+    def __dir__(self):
+        return [*super().__dir__(), *self._functions]
+
+
+def compile(source, *, opt_level=2, cpu=None, features=None, bounds_check=True):
+    """
+    Compile `source` into native functions in this process.
+
+    The result is cached under the source and the options, and shared by
+    every caller that compiles the same program.
+
+    :param str source: the program; top-level expressions are not allowed
+    :param int opt_level: the optimization level
+    :param str cpu: the target CPU name or ``native``
+    :param str features: the target feature string or ``native``
+    :param bool bounds_check: check buffer indices; an out-of-bounds
+        access ends the process
+    :rtype: Program
+    :raises toycomp.frontend.CompileError: if `source` doesn't compile
+    """
+    key = (source, opt_level, cpu, features, bounds_check)
+
+    with _cache_lock:
+        program = _cache.get(key)
+        if program is None:
+            program = _cache[key] = _compile(source, opt_level=opt_level, cpu=cpu,
+                                             features=features, bounds_check=bounds_check)
+
+    return program
+
+
+def clear_cache():
+    """
+    Forget every compiled program. Programs that are still referenced stay
+    usable.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def _compile(source, *, opt_level, cpu, features, bounds_check):
+    nodes = frontend.check(source, name='<string>')
+
+    types = {}
+    for node in nodes:
+        if isinstance(node, ast.Function):
+            types[node.proto.name] = node.proto.decl_ty
+        elif not isinstance(node, ast.Prototype):
+            raise frontend.CompileError('top-level expressions are not supported; '
+                                        'define a function instead')
+
+    engine, cg = frontend.generate(nodes, '<string>', opt_level=opt_level, cpu=cpu,
+                                   features=features, bounds_check=bounds_check)
+    engine.add_module(cg.finish())
+
+    return Program(engine, types)
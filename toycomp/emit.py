@@ -0,0 +1,82 @@
+import contextlib
+import sys
+
+from llvmlite import ir
+
+from toycomp import optimizer
+
+FORMATS = ('ll', 'bc', 'asm', 'obj')
+BINARY_FORMATS = ('bc', 'obj')
+
+
+def write_ir(module, stream):
+    """
+    Write the textual IR of `module` to `stream` one global at a time, rather
+    than building the whole module's text in memory first.
+
+    :param llvmlite.ir.Module module: the module to write
+    """
+    stream.write('; ModuleID = "{}"\n'.format(module.name))
+    stream.write('target triple = "{}"\n'.format(module.triple))
+    stream.write('target datalayout = "{}"\n\n'.format(module.data_layout))
+
+    for ty in module.get_identified_types().values():
+        stream.write(ty.get_declaration())
+        stream.write('\n')
+
+    for value in module.globals.values():
+        stream.write(str(value))
+        stream.write('\n')
+
+    # Like llvmlite's own printer, but through the public attributes.
+    for name, node in module.namedmetadata.items():
+        stream.write('!{} = !{{ {} }}\n'.format(name, ', '.join(op.get_reference() for op in node.operands)))
+
+    for md in module.metadata:
+        stream.write(str(md))
+        stream.write('\n')
+
+
+@contextlib.contextmanager
+def _open_output(path, binary):
+    if path == '-':
+        yield sys.stdout.buffer if binary else sys.stdout
+        return
+
+    with open(path, 'wb' if binary else 'w') as stream:
+        yield stream
+
+
+def emit(module, path, *, fmt='ll', target_machine=None):
+    """
+    Write `module` to `path` (``-`` for stdout) in the given format.
+
+    :param module: the module to write
+    :type module: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+    :param str fmt: one of `FORMATS`
+    :param llvmlite.binding.TargetMachine target_machine: the machine to emit
+        assembly or object code for
+    """
+    if fmt not in FORMATS:
+        raise ValueError('unknown output format {!r}'.format(fmt))
+
+    if fmt in ('asm', 'obj') and target_machine is None:
+        raise ValueError('emitting {} requires a target machine'.format(fmt))
+
+    with _open_output(path, fmt in BINARY_FORMATS) as stream:
+        if fmt == 'll':
+            if isinstance(module, ir.Module):
+                write_ir(module, stream)
+            else:
+                stream.write(str(module))
+            return
+
+        if isinstance(module, ir.Module):
+            module = optimizer.parse_module(module)
+
+        if fmt == 'bc':
+            stream.write(module.as_bitcode())
+        elif fmt == 'asm':
+            stream.write(target_machine.emit_assembly(module))
+        else:
+            stream.write(target_machine.emit_object(module))
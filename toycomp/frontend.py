@@ -0,0 +1,100 @@
+"""
+The frontend passes that every entry point checks source code with, and
+helpers for library callers, which report errors as exceptions rather than
+by exiting like `toycomp.driver`.
+"""
+import io
+
+from toycomp import jit, parser
+from toycomp.compilepass import PassManager
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter, ErrorLimitReached
+from toycomp.nameres import NameResolver
+from toycomp.typechecker import Typechecker
+from toycomp.user_op_rewriter import UserOpRewriter
+
+
+class CompileError(Exception):
+    """
+    Raised by the library entry points when source code doesn't compile. The
+    message holds the formatted diagnostics.
+    """
+
+
+class Checker:
+    """
+    The passes that resolve and typecheck parsed top-level nodes. They keep
+    their state from node to node, so later nodes can use what earlier ones
+    define.
+
+    :param toycomp.diagnostics.DiagnosticsEngine diags: where to report
+        errors
+    :ivar toycomp.user_op_rewriter.UserOpRewriter rewriter:
+    :ivar toycomp.nameres.NameResolver resolver:
+    """
+    def __init__(self, diags):
+        self.rewriter = UserOpRewriter()
+        self.resolver = NameResolver(diags)
+        self._pm = PassManager([
+            self.rewriter,
+            self.resolver,
+            Typechecker(diags),
+        ])
+
+    def visit(self, node):
+        return self._pm.visit(node)
+
+    def check_all(self, nodes):
+        """
+        Check every node of `nodes`, stopping early if the diagnostics
+        engine reaches its error limit.
+
+        :returns: whether they all checked
+        """
+        try:
+            return all([self.visit(node) for node in nodes])
+        except ErrorLimitReached:
+            return False
+
+
+def check(source, *, name=None, max_errors=0):
+    """
+    Parse, resolve and typecheck `source`.
+
+    :returns: the checked top-level nodes
+    :rtype: list[toycomp.ast.AST]
+    :raises CompileError: if `source` has errors
+    """
+    stream = io.StringIO()
+    diags = DiagnosticsEngine(DiagnosticPrinter(stream), max_errors=max_errors)
+
+    try:
+        nodes = list(parser.parse(source, name=name))
+    except SyntaxError as exc:
+        raise CompileError(str(exc)) from None
+
+    if not Checker(diags).check_all(nodes):
+        diags.consumer.finish()
+        raise CompileError(stream.getvalue().rstrip())
+
+    return nodes
+
+
+def generate(nodes, name, *, opt_level, cpu=None, features=None, **kwargs):
+    """
+    Generate code for checked top-level nodes into a module for a new JIT.
+
+    :param str name: the name of the module
+    :param kwargs: more arguments for `toycomp.codegen.Codegen`
+    :returns: the JIT and the code generator; add ``cg.finish()`` to the JIT
+        once the module is complete
+    :rtype: (toycomp.jit.JIT, toycomp.codegen.Codegen)
+    :raises CompileError: if code generation fails
+    """
+    engine = jit.JIT(cpu=cpu, features=features, opt_level=opt_level)
+    cg = engine.new_codegen(name, **kwargs)
+
+    if not all([cg.visit(node) for node in nodes]):
+        raise CompileError('code generation failed for {!r}'.format(name))
+
+    jit.add_builtins()
+    return engine, cg
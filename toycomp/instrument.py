@@ -0,0 +1,192 @@
+"""
+Per-function call counts and inclusive time.
+
+An ``--instrument`` build gives every function a statistics record holding
+its call count, the ticks spent inside it, its current recursion depth and
+the tick count at which its outermost activation started. Only the outermost
+activation reads the clock, so recursive functions are neither counted twice
+nor slowed down by a clock read per level.
+
+Reading the clock costs more than a small function's body, so, as in XRay,
+functions below a size threshold that contain no loops only count their
+calls. Once inlined, their time shows up in their callers. On x86 the ticks come from the
+time-stamp counter (``llvm.readcyclecounter``); elsewhere from
+``__toycomp_instrument_ticks`` in ``stdlib/instrument.c``, which uses
+``clock_gettime``.
+
+The runtime converts ticks to nanoseconds and writes a report at exit; see
+``stdlib/instrument.c`` for the environment variables that control it.
+"""
+import collections
+
+from llvmlite import ir
+
+from toycomp import ast, irutil
+
+DEFAULT_THRESHOLD = 16
+
+_i64 = irutil.i64
+
+stats_ty = ir.LiteralStructType([_i64, _i64, _i64, _i64, _i64])  # calls, ticks, depth, start, timed
+
+_CALLS = 0
+_TICKS = 1
+_DEPTH = 2
+_START = 3
+_TIMED = 4
+
+
+def _measure(node):
+    """
+    Return the number of AST nodes under `node` and whether any is a loop.
+    """
+    size = 1
+    has_loop = isinstance(node, ast.ForExpr)
+
+    for name, value in vars(node).items():
+        if name == 'decl':
+            continue
+
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, (ast.AST, ast.Stmt)):
+                child_size, child_has_loop = _measure(child)
+                size += child_size
+                has_loop = has_loop or child_has_loop
+
+    return size, has_loop
+
+
+def _field(builder, record, index):
+    zero = ir.Constant(ir.IntType(32), 0)
+    return builder.gep(record, [zero, ir.Constant(ir.IntType(32), index)], inbounds=True)
+
+
+def _increment(builder, ptr, amount):
+    # Atomic, since the function may run on the threads of a parallel for.
+    return builder.add(builder.atomic_rmw('add', ptr, amount, 'monotonic'), amount)
+
+
+class FunctionInstrumenter:
+    """
+    Code generator hooks that count calls and measure inclusive time.
+
+    The body of an instrumented function ``f`` is generated into an internal
+    function ``f.impl``, and ``f`` becomes a wrapper that updates the record
+    around a call to it. Recursive calls from ``f.impl`` to itself only bump
+    the call count, so they remain tail calls that LLVM can turn into loops.
+
+    :param int threshold: the number of AST nodes in a function body below
+        which a function without loops isn't timed; 0 times every function
+    """
+    def __init__(self, *, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.records = collections.OrderedDict()
+        self._current = None
+
+    @staticmethod
+    def _ticks(builder):
+        module = builder.module
+        if module.triple.startswith(('x86_64', 'i386', 'i686')):
+            func = module.declare_intrinsic('llvm.readcyclecounter', fnty=ir.FunctionType(_i64, []))
+        else:
+            func = module.globals.get('__toycomp_instrument_ticks')
+            if func is None:
+                func = ir.Function(module, ir.FunctionType(_i64, []), '__toycomp_instrument_ticks')
+
+        return builder.call(func, [], name='ticks')
+
+    def begin_function(self, cg, func, stmt):
+        """
+        Return the function that the body of `func` should be generated into.
+        """
+        # A previous definition may have failed and left these behind.
+        impl = cg.module.globals.get(func.name + '.impl')
+        if impl is None:
+            impl = ir.Function(cg.module, func.function_type, func.name + '.impl')
+            for arg, impl_arg in zip(func.args, impl.args):
+                impl_arg.name = arg.name
+
+        record = cg.module.globals.get('__instr.' + func.name)
+        if record is None:
+            record = ir.GlobalVariable(cg.module, stats_ty, '__instr.' + func.name)
+
+        self._current = func, impl, record
+        return impl
+
+    def callee(self, cg, callee):
+        """
+        Redirect recursive calls straight to the function's body.
+        """
+        if not self._current:
+            return callee
+
+        func, impl, record = self._current
+        if callee is not func:
+            return callee
+
+        _increment(cg.builder, _field(cg.builder, record, _CALLS), ir.Constant(_i64, 1))
+        return impl
+
+    def end_function(self, cg, func, stmt):
+        """
+        Generate the wrapper around the body of `func`.
+        """
+        _, impl, record = self._current
+        self._current = None
+
+        size, has_loop = _measure(stmt.body)
+        timed = has_loop or size >= self.threshold
+
+        impl.linkage = 'internal'
+        record.linkage = 'internal'
+        self.records[func.name] = record
+        record.initializer = ir.Constant(stats_ty, [ir.Constant(_i64, 0)] * _TIMED +
+                                         [ir.Constant(_i64, int(timed))])
+
+        b = ir.IRBuilder(func.append_basic_block('entry'))
+        one = ir.Constant(_i64, 1)
+        _increment(b, _field(b, record, _CALLS), one)
+
+        if not timed:
+            b.ret(b.call(impl, func.args, tail=True))
+            return
+
+        depth = _increment(b, _field(b, record, _DEPTH), one)
+        with b.if_then(b.icmp_unsigned('==', depth, one)):
+            b.store_atomic(self._ticks(b), _field(b, record, _START), 'monotonic', 8)
+
+        result = b.call(impl, func.args)
+
+        depth = _increment(b, _field(b, record, _DEPTH), ir.Constant(_i64, -1))
+        with b.if_then(b.icmp_unsigned('==', depth, ir.Constant(_i64, 0))):
+            elapsed = b.sub(self._ticks(b), b.load_atomic(_field(b, record, _START), 'monotonic', 8))
+            _increment(b, _field(b, record, _TICKS), elapsed)
+
+        b.ret(result)
+
+    def abandon_function(self, cg, func, stmt):
+        """
+        Forget about `func` after its body failed to generate.
+
+        The body function and the record stay behind as unused declarations
+        so that a later definition of `func` can reuse them.
+        """
+        self._current = None
+
+    def finish(self, module):
+        if not self.records:
+            return
+
+        names = irutil.string_table(module, '__instr.names', list(self.records))
+        records = irutil.pointer_table(module, '__instr.records', list(self.records.values()))
+
+        register = ir.Function(module,
+                               ir.FunctionType(ir.VoidType(), [irutil.i8_ptr.as_pointer(),
+                                                               stats_ty.as_pointer().as_pointer(),
+                                                               _i64]),
+                               '__toycomp_instrument_register')
+
+        irutil.add_registration(module, '__instr.init', register,
+                                [irutil.first_element(names),
+                                 irutil.first_element(records),
+                                 ir.Constant(_i64, len(self.records))])
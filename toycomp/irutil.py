@@ -0,0 +1,95 @@
+"""
+Helpers for the module-level tables and constructors that instrumented code
+uses to register itself with the runtime in ``stdlib/``.
+"""
+from llvmlite import ir
+
+i8 = ir.IntType(8)
+i32 = ir.IntType(32)
+i64 = ir.IntType(64)
+i8_ptr = i8.as_pointer()
+
+
+def private_constant(module, name, initializer):
+    var = ir.GlobalVariable(module, initializer.type, name)
+    var.linkage = 'private'
+    var.global_constant = True
+    var.initializer = initializer
+    return var
+
+
+def c_string(module, name, s):
+    """
+    Emit a NUL-terminated copy of `s`.
+
+    :returns: an ``i8*`` constant pointing to it
+    """
+    data = bytearray(s.encode('utf-8') + b'\0')
+    var = private_constant(module, name, ir.Constant(ir.ArrayType(i8, len(data)), data))
+    return var.bitcast(i8_ptr)
+
+
+def string_table(module, name, strings):
+    """
+    Emit an array of pointers to NUL-terminated copies of `strings`.
+
+    :rtype: ir.GlobalVariable
+    """
+    pointers = [c_string(module, '{}.{}'.format(name, i), s) for i, s in enumerate(strings)]
+
+    return private_constant(module, name, ir.Constant(ir.ArrayType(i8_ptr, len(pointers)), pointers))
+
+
+def pointer_table(module, name, values):
+    """
+    Emit an array of pointers to the global variables `values`, which must all
+    have the same type.
+
+    :rtype: ir.GlobalVariable
+    """
+    return private_constant(module, name,
+                            ir.Constant(ir.ArrayType(values[0].type, len(values)), list(values)))
+
+
+def first_element(table):
+    """
+    Return a pointer to the first element of a table built by `string_table`
+    or `pointer_table`.
+    """
+    return table.bitcast(table.type.pointee.element.as_pointer())
+
+
+def add_global_ctor(module, func, priority=65535):
+    """
+    Arrange for `func` to run before ``main``. A module has a single
+    ``llvm.global_ctors`` table, so later constructors extend it.
+    """
+    entry_ty = ir.LiteralStructType([i32, func.type, i8_ptr])
+    entry = ir.Constant(entry_ty, [ir.Constant(i32, priority), func, ir.Constant(i8_ptr, None)])
+
+    ctors = module.globals.get('llvm.global_ctors')
+    if ctors is None:
+        entries = [entry]
+        ctors = ir.GlobalVariable(module, ir.ArrayType(entry_ty, 1), 'llvm.global_ctors')
+        ctors.linkage = 'appending'
+    else:
+        entries = ctors.initializer.constant + [entry]
+
+    table_ty = ir.ArrayType(entry_ty, len(entries))
+    ctors.value_type = table_ty
+    ctors.type = table_ty.as_pointer()
+    ctors.initializer = ir.Constant(table_ty, entries)
+
+
+def add_registration(module, name, register, args):
+    """
+    Add a constructor that calls the runtime function `register` with `args`.
+    """
+    ctor = ir.Function(module, ir.FunctionType(ir.VoidType(), []), name)
+    ctor.linkage = 'internal'
+    builder = ir.IRBuilder(ctor.append_basic_block('entry'))
+    builder.call(register, args)
+    builder.ret_void()
+
+    add_global_ctor(module, ctor)
+    return ctor
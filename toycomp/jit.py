@@ -0,0 +1,351 @@
+import atexit
+import collections
+import concurrent.futures
+import ctypes
+import os
+import sys
+import threading
+
+import llvmlite.binding as llvm
+
+from toycomp import memoruntime, optimizer, perfmap, target, types
+from toycomp.codegen import MEMO_LOOKUP, MEMO_STORE, Codegen
+
+
+class Buffer(ctypes.Structure):
+    """
+    A `buffer` to pass to compiled code: a view of a C-contiguous, writable
+    array of doubles, such as a NumPy float64 array or an ``array('d')``.
+    Pass the `Buffer` itself where a function takes a buffer.
+    """
+    _fields_ = [
+        ('data', ctypes.POINTER(ctypes.c_double)),
+        ('length', ctypes.c_int64),
+    ]
+
+    @classmethod
+    def from_buffer(cls, obj):
+        """
+        View `obj`, which must stay alive as long as compiled code may use
+        the buffer.
+        """
+        view = memoryview(obj)
+        if view.format != 'd' or not view.c_contiguous or view.readonly:
+            raise TypeError('a buffer needs a C-contiguous, writable array of doubles')
+
+        length = view.nbytes // ctypes.sizeof(ctypes.c_double)
+        array = (ctypes.c_double * length).from_buffer(view)
+        buffer = cls(ctypes.cast(array, ctypes.POINTER(ctypes.c_double)), length)
+        buffer._array = array
+        return buffer
+
+    def __len__(self):
+        return self.length
+
+
+ctypes_types = {
+    types.double_ty: ctypes.c_double,
+    types.int_ty: ctypes.c_int32,
+    types.buffer_ty: ctypes.POINTER(Buffer),
+}
+
+
+class JIT:
+    """
+    An in-process JIT compiler that code is added to one module at a time.
+
+    Each module is compiled once, when it's added; code in later modules
+    calls functions defined in earlier ones directly.
+
+    :param str cpu: the target CPU name or ``native``
+    :param str features: the target feature string or ``native``
+    :param int opt_level: the optimization level for the IR and machine code
+    :param toycomp.objcache.ObjectCache cache: where to keep compiled code
+        for later runs, if anywhere
+    :param toycomp.perfmap.PerfMap perf_map: where to tell ``perf`` about
+        the compiled functions; defaults to `perfmap.default`
+    """
+    def __init__(self, *, cpu=None, features=None, opt_level=2, cache=None, perf_map=None):
+        self.opt_level = opt_level
+        self.cache = cache
+        self.perf_map = perf_map or perfmap.default()
+        self.target_machine = target.create_target_machine(cpu=cpu,
+                                                           features=features,
+                                                           opt_level=opt_level,
+                                                           jit=True)
+        self._cpu = target.host_cpu(cpu)
+        self._features = target.host_features(features)
+        self._engine = llvm.create_mcjit_compiler(llvm.parse_assembly(''),
+                                                  self.target_machine)
+
+        # The object code of the module being added, see `add_module`.
+        self._cache_key = None
+        self._cached_object = None
+        self._compiled_object = None
+        if cache is not None or self.perf_map is not None:
+            self._engine.set_object_cache(self._object_compiled, self._get_object)
+
+    def configure_module(self, module):
+        target.configure_module(module, self.target_machine)
+
+    def new_codegen(self, name, **kwargs):
+        """
+        Create a code generator for a module named `name` to add to this
+        JIT. Loops are counted when optimizing, as in `toycomp.driver`.
+
+        :param kwargs: more arguments for `toycomp.codegen.Codegen`
+        :rtype: toycomp.codegen.Codegen
+        """
+        cg = Codegen(count_loops=self.opt_level > 0, **kwargs)
+        cg.module.name = name
+        self.configure_module(cg.module)
+        return cg
+
+    def add_module(self, module):
+        """
+        Optimize and compile `module`, or load its code from the cache.
+
+        :type module: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        :returns: the module, for `remove_module`
+        :rtype: llvmlite.binding.ModuleRef
+        """
+        llmod = module if isinstance(module, llvm.ModuleRef) else optimizer.parse_module(module)
+
+        if self.cache is not None:
+            self._cache_key = self.cache.key(str(llmod),
+                                             opt_level=self.opt_level,
+                                             triple=self.target_machine.triple,
+                                             cpu=self._cpu,
+                                             features=self._features)
+            self._cached_object = self.cache.load(self._cache_key)
+
+        try:
+            # MCJIT only uses the IR of a cached module to find its symbols.
+            if self.opt_level and self._cached_object is None:
+                llmod = optimizer.optimize(llmod, self.target_machine, opt_level=self.opt_level)
+
+            self._engine.add_module(llmod)
+            self._engine.finalize_object()
+            if any(func.name == MEMO_LOOKUP for func in llmod.functions):
+                _memo_engines.append(self._engine)
+
+            obj = self._cached_object or self._compiled_object
+            if self.perf_map is not None and obj:
+                self.perf_map.add_object(obj, self._engine.get_function_address)
+        finally:
+            self._cache_key = self._cached_object = self._compiled_object = None
+
+        return llmod
+
+    def _get_object(self, llmod):
+        return self._cached_object
+
+    def _object_compiled(self, llmod, data):
+        self._compiled_object = data
+        if self._cache_key is not None and self._cached_object is None:
+            self.cache.store(self._cache_key, data)
+
+    def remove_module(self, llmod):
+        """
+        Remove a module added with `add_module`, e.g. once a top-level
+        expression has been evaluated.
+        """
+        self._engine.remove_module(llmod)
+
+    def function_address(self, name):
+        address = self._engine.get_function_address(name)
+        if not address:
+            raise KeyError(name)
+
+        return address
+
+    def function_of_type(self, name, ty):
+        """
+        Get a callable for the compiled function `name` of type `ty`.
+
+        :type ty: toycomp.types.FunctionType
+        """
+        return ctypes_function(self.function_address(name), ty)
+
+    def function(self, name, restype, argtypes):
+        """
+        Get a callable for the compiled function `name`.
+
+        :param restype: the ctypes result type
+        :param list argtypes: the ctypes parameter types
+        """
+        return ctypes.CFUNCTYPE(restype, *argtypes)(self.function_address(name))
+
+
+def ctypes_function(address, ty):
+    """
+    Wrap the native function at `address`, of type `ty`, in a callable.
+
+    :type ty: toycomp.types.FunctionType
+    """
+    return ctypes.CFUNCTYPE(ctypes_types[ty.result],
+                            *[ctypes_types[p] for p in ty.params])(address)
+
+
+def load_library(path):
+    """
+    Make the symbols of a shared library available to JIT-compiled code.
+    """
+    llvm.load_library_permanently(path)
+
+
+def add_symbol(name, func):
+    """
+    Make a ctypes callback available to JIT-compiled code as `name`.
+
+    The callback must be kept alive for as long as code may call it.
+    """
+    llvm.add_symbol(name, ctypes.cast(func, ctypes.c_void_p).value)
+
+
+@ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double)
+def _putchard(x):
+    # Like stdlib/lib.c: one byte, to stderr.
+    sys.stderr.buffer.write(bytes([int(x) & 0xff]))
+    sys.stderr.flush()
+    return 0.0
+
+
+_parallel_body = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p,
+                                  ctypes.c_int64, ctypes.c_int64)
+_parallel_pool = None
+_parallel_threads = None
+_parallel_state = threading.local()
+
+
+def _run_parallel_chunk(body, env, values, begin, end):
+    _parallel_state.nested = True
+    try:
+        body(env, values, begin, end)
+    finally:
+        _parallel_state.nested = False
+
+
+@ctypes.CFUNCTYPE(None, _parallel_body, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int64)
+def _parallel_for(body, env, values, count):
+    # Like stdlib/parallel.c, but the chunks are handed to a thread pool
+    # rather than stolen. Calling `body` releases the GIL, so they run in
+    # parallel; nested loops run sequentially.
+    global _parallel_pool, _parallel_threads
+
+    # Like the C pool, size the pool when the first loop runs.
+    if _parallel_threads is None:
+        _parallel_threads = int(os.environ.get('TOYCOMP_NUM_THREADS') or os.cpu_count() or 1)
+        if _parallel_threads > 1:
+            _parallel_pool = concurrent.futures.ThreadPoolExecutor(max_workers=_parallel_threads)
+
+    if count <= 0 or _parallel_pool is None or getattr(_parallel_state, 'nested', False):
+        body(env, values, 0, count)
+        return
+
+    chunks = min(count, _parallel_threads * 8)
+    bounds = [count * i // chunks for i in range(chunks + 1)]
+    futures = [_parallel_pool.submit(_run_parallel_chunk, body, env, values, begin, end)
+               for begin, end in zip(bounds, bounds[1:])]
+    concurrent.futures.wait(futures)
+
+
+@ctypes.CFUNCTYPE(ctypes.c_double, ctypes.POINTER(Buffer))
+def _buffer_length(buffer):
+    return float(buffer.contents.length)
+
+
+@ctypes.CFUNCTYPE(None, ctypes.c_int64, ctypes.c_int64)
+def _bounds_error(index, length):
+    # Like stdlib/buffer.c. Compiled code can't unwind, so this ends the
+    # process.
+    sys.stderr.write('buffer index {} out of bounds for length {}\n'.format(index, length))
+    sys.stderr.flush()
+    os.abort()
+
+
+class _MemoTable(ctypes.Structure):
+    # struct toycomp_memo in stdlib/memo.c
+    _fields_ = [
+        ('name', ctypes.c_char_p),
+        ('nargs', ctypes.c_uint64),
+        ('capacity', ctypes.c_uint64),
+        ('entries', ctypes.c_void_p),
+        ('hits', ctypes.c_uint64),
+        ('misses', ctypes.c_uint64),
+        ('evictions', ctypes.c_uint64),
+        ('next', ctypes.c_void_p),
+        ('lock', ctypes.c_uint64),
+    ]
+
+
+MemoStats = collections.namedtuple('MemoStats', 'name hits misses evictions')
+
+_memo_runtime = None
+_memo_runtime_lock = threading.Lock()
+# Engines with memo tables in them. A table stays in the runtime's list once
+# it has been used, so its code and data can't be freed.
+_memo_engines = []
+
+
+def _memo_engine():
+    global _memo_runtime
+
+    with _memo_runtime_lock:
+        if _memo_runtime is None:
+            target_machine = target.create_target_machine(jit=True)
+            llmod = optimizer.optimize(optimizer.parse_module(memoruntime.generate()), target_machine)
+            engine = llvm.create_mcjit_compiler(llmod, target_machine)
+            engine.finalize_object()
+            if os.environ.get('TOYCOMP_MEMO_STATS'):
+                atexit.register(_memo_report)
+            _memo_runtime = engine
+
+        return _memo_runtime
+
+
+def memo_stats():
+    """
+    Get the cache statistics of the memo functions that have run in this
+    process, the most recently first used first, as ``stdlib/memo.c``
+    reports them.
+
+    :rtype: list[MemoStats]
+    """
+    stats = []
+    if _memo_runtime is None:
+        return stats
+
+    address = ctypes.c_void_p.from_address(_memo_runtime.get_global_value_address(memoruntime.MEMOS)).value
+    while address:
+        table = _MemoTable.from_address(address)
+        stats.append(MemoStats(table.name.decode(), table.hits, table.misses, table.evictions))
+        address = table.next
+
+    return stats
+
+
+def _memo_report():
+    for stats in memo_stats():
+        calls = stats.hits + stats.misses
+        print('{:<24} {:>12} hits {:>12} misses {:>12} evictions {:6.1f}% hit rate'
+              .format(stats.name, stats.hits, stats.misses, stats.evictions,
+                      100 * stats.hits / calls if calls else 0),
+              file=sys.stderr)
+
+
+def add_builtins():
+    """
+    Provide what ``stdlib/`` provides to compiled programs, for running code
+    in this process: the functions of ``lib.c`` and ``buffer_length`` from
+    ``buffer.c`` that programs call through `extern`, and the runtime for
+    ``parallel for``, bounds checks and memo functions.
+    """
+    add_symbol('putchard', _putchard)
+    add_symbol('buffer_length', _buffer_length)
+    add_symbol('__toycomp_parallel_for', _parallel_for)
+    add_symbol('__toycomp_bounds_error', _bounds_error)
+
+    engine = _memo_engine()
+    for name in (MEMO_LOOKUP, MEMO_STORE):
+        llvm.add_symbol(name, engine.get_function_address(name))
@@ -0,0 +1,149 @@
+"""
+Element-wise NumPy kernels from Kaleidoscope functions.
+
+`vectorize` compiles a function together with a loop that applies it to
+every element of a batch of contiguous float64 arrays, so that evaluating it
+over millions of points takes one foreign call rather than millions. The
+call releases the GIL, so other Python threads can run (or run other
+batches) meanwhile.
+
+NumPy is only needed to call the kernels, and is imported on first use.
+"""
+import ctypes
+
+from llvmlite import ir
+
+from toycomp import frontend
+
+_double = ir.DoubleType()
+_double_ptr = _double.as_pointer()
+_i64 = ir.IntType(64)
+
+
+def _build_loop(module, func, name):
+    """
+    Add ``void name(i64 n, double *out, double *arg0, ...)``, which computes
+    ``out[i] = func(arg0[i], ...)`` for every i < n.
+    """
+    nparams = len(func.function_type.args)
+    loop_fn = ir.Function(module,
+                          ir.FunctionType(ir.VoidType(), [_i64, _double_ptr] + [_double_ptr] * nparams),
+                          name)
+    n, out, *inputs = loop_fn.args
+    n.name = 'n'
+    out.name = 'out'
+    for i, arg in enumerate(inputs):
+        arg.name = 'arg{}'.format(i)
+        # Kernel.__call__ copies inputs that overlap out, so LLVM may
+        # vectorize freely.
+        arg.add_attribute('noalias')
+    out.add_attribute('noalias')
+
+    entry = loop_fn.append_basic_block('entry')
+    loop = loop_fn.append_basic_block('loop')
+    exit = loop_fn.append_basic_block('exit')
+
+    b = ir.IRBuilder(entry)
+    zero = ir.Constant(_i64, 0)
+    b.cbranch(b.icmp_signed('>', n, zero), loop, exit)
+
+    b.position_at_end(loop)
+    i = b.phi(_i64, name='i')
+    i.add_incoming(zero, entry)
+
+    args = [b.load(b.gep(arg, [i], inbounds=True)) for arg in inputs]
+    b.store(b.call(func, args), b.gep(out, [i], inbounds=True))
+
+    next_i = b.add(i, ir.Constant(_i64, 1), name='i.next')
+    i.add_incoming(next_i, loop)
+    b.cbranch(b.icmp_signed('<', next_i, n), loop, exit)
+
+    b.position_at_end(exit)
+    b.ret_void()
+
+    return loop_fn
+
+
+class Kernel:
+    """
+    A compiled element-wise kernel; see `vectorize`.
+    """
+    def __init__(self, name, nparams, engine, address):
+        self.name = name
+        self.nparams = nparams
+        self._engine = engine  # keeps the code alive
+        self._cfunc = ctypes.CFUNCTYPE(None, ctypes.c_int64,
+                                       *[ctypes.c_void_p] * (nparams + 1))(address)
+
+    def __repr__(self):
+        return '<Kernel {!r} ({} parameters)>'.format(self.name, self.nparams)
+
+    def __call__(self, *args, out=None):
+        """
+        Apply the function to each element of the arguments, which are
+        broadcast against each other.
+
+        :param args: one array-like (or scalar) per parameter
+        :param numpy.ndarray out: a writable, C-contiguous float64 array of
+            the broadcast shape to write the results to; it may be one of
+            the arguments or overlap them
+        :rtype: numpy.ndarray
+        """
+        import numpy as np
+
+        if len(args) != self.nparams:
+            raise TypeError('{}() takes {} arguments, got {}'.format(self.name, self.nparams, len(args)))
+
+        arrays = [np.ascontiguousarray(a, dtype=np.float64)
+                  for a in np.broadcast_arrays(*[np.asarray(a, dtype=np.float64) for a in args])]
+        shape = arrays[0].shape if arrays else ()
+
+        if out is None:
+            out = np.empty(shape, dtype=np.float64)
+        elif (out.shape != shape or out.dtype != np.float64 or not out.flags.c_contiguous
+              or not out.flags.writeable):
+            raise ValueError('out must be a writable, C-contiguous float64 array of shape {}'.format(shape))
+        else:
+            # The loop's pointers are noalias.
+            arrays = [a.copy() if np.shares_memory(a, out) else a for a in arrays]
+
+        self._cfunc(out.size, out.ctypes.data, *[a.ctypes.data for a in arrays])
+        return out
+
+
+def vectorize(source, name, *, opt_level=3, cpu='native', features='native'):
+    """
+    Compile the function `name` from Kaleidoscope `source` into an
+    element-wise kernel over NumPy arrays.
+
+    ::
+
+        mandel = toycomp.vectorize(source, 'mandelconverge')
+        counts = mandel(real_grid, imag_grid)
+
+    :param str source: the program defining `name` and everything it calls
+    :param str name: a function whose parameters and result are all double
+    :param int opt_level: the optimization level
+    :param str cpu: the target CPU; defaults to the host's
+    :param str features: the target features; default to the host's
+    :rtype: Kernel
+    :raises toycomp.frontend.CompileError: if `source` doesn't compile
+    """
+    nodes = frontend.check(source, name='<vectorize>')
+
+    engine, cg = frontend.generate(nodes, name, opt_level=opt_level, cpu=cpu, features=features)
+
+    func = cg.module.globals.get(name)
+    if not isinstance(func, ir.Function) or not func.blocks:
+        raise ValueError('no function {!r} is defined in the source'.format(name))
+
+    fty = func.function_type
+    if fty.return_type != _double or any(t != _double for t in fty.args):
+        raise TypeError('{!r} must take and return only double values'.format(name))
+
+    loop_name = name + '.vectorized'
+    _build_loop(cg.module, func, loop_name)
+
+    engine.add_module(cg.finish())
+
+    return Kernel(name, len(fty.args), engine, engine.function_address(loop_name))
@@ -0,0 +1,49 @@
+import llvmlite.binding as llvm
+
+
+class LinkError(Exception):
+    pass
+
+
+def load_module(path):
+    """
+    Load a separately compiled module from an LLVM bitcode (``.bc``) or IR
+    (``.ll``) file.
+
+    :rtype: llvmlite.binding.ModuleRef
+    """
+    if path.endswith('.bc'):
+        with open(path, 'rb') as f:
+            llmod = llvm.parse_bitcode(f.read())
+    else:
+        with open(path) as f:
+            llmod = llvm.parse_assembly(f.read())
+
+    llmod.verify()
+    return llmod
+
+
+def link_modules(modules):
+    """
+    Link `modules` into a single module.
+
+    The first module becomes the result; the others are consumed by the link
+    and can't be used afterwards. `extern` declarations in one module resolve
+    to definitions in the others.
+
+    :param list[llvmlite.binding.ModuleRef] modules: the modules to link
+    :rtype: llvmlite.binding.ModuleRef
+    """
+    if not modules:
+        raise ValueError('nothing to link')
+
+    result, *rest = modules
+
+    for module in rest:
+        try:
+            result.link_in(module)
+        except RuntimeError as exc:
+            raise LinkError(str(exc)) from None
+
+    result.verify()
+    return result
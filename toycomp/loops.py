@@ -0,0 +1,96 @@
+"""
+Recognize the `for` loops that run a number of times known on entry.
+
+A `for` loop evaluates its end condition every iteration and adds the step
+to its variable in floating point, which gives LLVM's scalar evolution
+nothing to compute a trip count from, so it can neither unroll nor
+vectorize the loop. The common loop::
+
+    for i = 0, i < n, 2 in ...
+
+is an exception: its start and step are integral constants and nothing in
+the body changes `n`. As long as `n` is at most 2**53, every value of `i` is
+an exact integer, and the loop runs ``ceil((n - 0) / 2)`` times, or not at
+all. Codegen lowers such a loop to a loop over an integer counter, see
+`toycomp.codegen.Codegen.emit_counted_for`, keeping the general lowering for
+larger or NaN bounds.
+"""
+from collections import namedtuple
+
+from toycomp import ast, types
+
+CountedLoop = namedtuple('CountedLoop', ['start', 'step', 'bound'])
+
+# Integers up to this are exact in double precision.
+EXACT_LIMIT = 2 ** 53
+
+# The largest start and step accepted, so that start + step stays exact.
+MAX_CONSTANT = 2 ** 52
+
+
+class _Assignments(ast.ASTRewriter):
+    """
+    Collects the declarations of the variables an expression assigns to.
+    """
+    def __init__(self):
+        self.decls = set()
+
+    def visit_BinaryExpr(self, expr):
+        if expr.op == '=' and isinstance(expr.lhs, ast.VariableExpr):
+            self.decls.add(expr.lhs.decl)
+        return super().visit_BinaryExpr(expr)
+
+
+def _integral(expr, low, high):
+    return isinstance(expr, ast.NumberExpr) and float(expr.value).is_integer() and \
+        low <= expr.value <= high
+
+
+def _invariant(expr, variant):
+    """
+    Whether `expr` has no side effects and gives the same value each time the
+    loop evaluates it, given the declarations of the variables that change in
+    the loop. Calls and buffer elements are assumed to change.
+    """
+    if isinstance(expr, ast.NumberExpr):
+        return True
+
+    if isinstance(expr, ast.VariableExpr):
+        return expr.slot is not None and expr.decl not in variant
+
+    if isinstance(expr, ast.BinaryExpr):
+        return expr.op != '=' and _invariant(expr.lhs, variant) and _invariant(expr.rhs, variant)
+
+    return False
+
+
+def counted_loop(expr):
+    """
+    Recognize a sequential loop of the form ``for i = a, i < b, c in ...``
+    where `a` and `c` are integral constants, `c` is positive and `b` is
+    loop-invariant.
+
+    :type expr: toycomp.ast.ForExpr
+    :returns: the start, the step and the bound expression, or None if the
+        loop has another form
+    :rtype: CountedLoop | None
+    """
+    if expr.parallel or expr.decl_ty is not types.double_ty:
+        return None
+
+    end = expr.end
+    if not (isinstance(end, ast.BinaryExpr) and end.op == '<' and
+            isinstance(end.lhs, ast.VariableExpr) and end.lhs.decl is expr and
+            end.rhs.ty is types.double_ty):
+        return None
+
+    if not (_integral(expr.start, -MAX_CONSTANT, MAX_CONSTANT) and
+            _integral(expr.step, 1, MAX_CONSTANT)):
+        return None
+
+    assignments = _Assignments()
+    assignments.visit(expr.body)
+    if expr in assignments.decls or not _invariant(end.rhs, assignments.decls | {expr}):
+        return None
+
+    return CountedLoop(int(expr.start.value), int(expr.step.value), end.rhs)
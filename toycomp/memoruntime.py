@@ -0,0 +1,351 @@
+"""
+The runtime for `memo def` in ``stdlib/memo.c``, as LLVM IR.
+
+Code compiled into this process can't link against ``memo.c``, so
+`toycomp.jit` compiles this module once and gives its functions to the JIT.
+It must behave like ``memo.c``: the same table layout, hash, probing,
+eviction and statistics, with a spin lock per table. Tables that have been
+used are linked into a list whose head is the global `MEMOS`.
+"""
+from llvmlite import ir
+
+from toycomp import irutil
+from toycomp.codegen import MEMO_LOOKUP, MEMO_STORE, memo_ty
+
+MEMOS = 'toycomp_memos'
+
+PROBES = 4
+
+_i64 = irutil.i64
+_i64_ptr = _i64.as_pointer()
+_double = ir.DoubleType()
+_memo_ptr = memo_ty.as_pointer()
+
+_NARGS = 1
+_CAPACITY = 2
+_ENTRIES = 3
+_HITS = 4
+_MISSES = 5
+_EVICTIONS = 6
+_NEXT = 7
+_LOCK = 8
+
+
+def _const(value):
+    # Wrap unsigned 64-bit constants to the signed values LLVM parses.
+    return ir.Constant(_i64, value - (1 << 64) if value >= 1 << 63 else value)
+
+
+def _field(builder, table, index):
+    zero = ir.Constant(irutil.i32, 0)
+    return builder.gep(table, [zero, ir.Constant(irutil.i32, index)], inbounds=True)
+
+
+def _function(module, name, result, params, *, internal=True):
+    func = ir.Function(module, ir.FunctionType(result, params), name)
+    if internal:
+        func.linkage = 'internal'
+    return func, ir.IRBuilder(func.append_basic_block('entry'))
+
+
+def _emit_lock(module):
+    func, b = _function(module, 'toycomp_memo_lock', ir.VoidType(), [_i64_ptr])
+    [lock] = func.args
+    spin = func.append_basic_block('spin')
+    wait = func.append_basic_block('wait')
+    done = func.append_basic_block('done')
+    b.branch(spin)
+
+    b.position_at_end(spin)
+    held = b.atomic_rmw('xchg', lock, _const(1), 'acquire')
+    b.cbranch(b.icmp_unsigned('!=', held, _const(0)), wait, done)
+
+    b.position_at_end(wait)
+    held = b.load_atomic(lock, 'monotonic', 8)
+    b.cbranch(b.icmp_unsigned('!=', held, _const(0)), wait, spin)
+
+    b.position_at_end(done)
+    b.ret_void()
+    return func
+
+
+def _emit_unlock(module):
+    func, b = _function(module, 'toycomp_memo_unlock', ir.VoidType(), [_i64_ptr])
+    b.store_atomic(_const(0), func.args[0], 'release', 8)
+    b.ret_void()
+    return func
+
+
+def _emit_hash(module):
+    func, b = _function(module, 'toycomp_memo_hash', _i64, [_i64_ptr, _i64])
+    args, nargs = func.args
+    entry = b.block
+    loop = func.append_basic_block('loop')
+    body = func.append_basic_block('body')
+    done = func.append_basic_block('done')
+    b.branch(loop)
+
+    b.position_at_end(loop)
+    i = b.phi(_i64, 'i')
+    h = b.phi(_i64, 'h')
+    i.add_incoming(_const(0), entry)
+    h.add_incoming(nargs, entry)
+    b.cbranch(b.icmp_unsigned('<', i, nargs), body, done)
+
+    b.position_at_end(body)
+    mixed = b.mul(b.xor(h, b.load(b.gep(args, [i]))), _const(0x9e3779b97f4a7c15))
+    i.add_incoming(b.add(i, _const(1)), body)
+    h.add_incoming(mixed, body)
+    b.branch(loop)
+
+    # Doubles that hold small integers have all-zero low bits, so mix the
+    # high bits down (MurmurHash3's finalizer).
+    b.position_at_end(done)
+    result = h
+    for multiplier in (0xff51afd7ed558ccd, 0xc4ceb9fe1a85ec53, None):
+        result = b.xor(result, b.lshr(result, _const(33)))
+        if multiplier:
+            result = b.mul(result, _const(multiplier))
+
+    # Tag 0 marks an empty entry.
+    b.ret(b.or_(result, _const(1)))
+    return func
+
+
+def _emit_entry(module):
+    func, b = _function(module, 'toycomp_memo_entry', _i64_ptr, [_memo_ptr, _i64])
+    table, index = func.args
+    mask = b.sub(b.load(_field(b, table, _CAPACITY)), _const(1))
+    width = b.add(b.load(_field(b, table, _NARGS)), _const(2))
+    entries = b.bitcast(b.load(_field(b, table, _ENTRIES)), _i64_ptr)
+    b.ret(b.gep(entries, [b.mul(b.and_(index, mask), width)]))
+    return func
+
+
+def _emit_equal(module):
+    func, b = _function(module, 'toycomp_memo_equal', ir.IntType(1), [_i64_ptr, _i64_ptr, _i64])
+    left, right, nargs = func.args
+    entry = b.block
+    loop = func.append_basic_block('loop')
+    body = func.append_basic_block('body')
+    differ = func.append_basic_block('differ')
+    same = func.append_basic_block('same')
+    b.branch(loop)
+
+    b.position_at_end(loop)
+    i = b.phi(_i64, 'i')
+    i.add_incoming(_const(0), entry)
+    b.cbranch(b.icmp_unsigned('<', i, nargs), body, same)
+
+    b.position_at_end(body)
+    equal = b.icmp_unsigned('==', b.load(b.gep(left, [i])), b.load(b.gep(right, [i])))
+    i.add_incoming(b.add(i, _const(1)), body)
+    b.cbranch(equal, loop, differ)
+
+    b.position_at_end(differ)
+    b.ret(ir.Constant(ir.IntType(1), 0))
+    b.position_at_end(same)
+    b.ret(ir.Constant(ir.IntType(1), 1))
+    return func
+
+
+def _emit_copy(module):
+    func, b = _function(module, 'toycomp_memo_copy', ir.VoidType(), [_i64_ptr, _i64_ptr, _i64])
+    dest, source, nargs = func.args
+    entry = b.block
+    loop = func.append_basic_block('loop')
+    body = func.append_basic_block('body')
+    done = func.append_basic_block('done')
+    b.branch(loop)
+
+    b.position_at_end(loop)
+    i = b.phi(_i64, 'i')
+    i.add_incoming(_const(0), entry)
+    b.cbranch(b.icmp_unsigned('<', i, nargs), body, done)
+
+    b.position_at_end(body)
+    b.store(b.load(b.gep(source, [i])), b.gep(dest, [i]))
+    i.add_incoming(b.add(i, _const(1)), body)
+    b.branch(loop)
+
+    b.position_at_end(done)
+    b.ret_void()
+    return func
+
+
+def _emit_init(module, lock, unlock):
+    # Called with the table's lock held.
+    calloc = ir.Function(module, ir.FunctionType(irutil.i8_ptr, [_i64, _i64]), 'calloc')
+    memos = ir.GlobalVariable(module, irutil.i8_ptr, MEMOS)
+    memos.initializer = ir.Constant(irutil.i8_ptr, None)
+    memos_lock = ir.GlobalVariable(module, _i64, MEMOS + '_lock')
+    memos_lock.linkage = 'internal'
+    memos_lock.initializer = _const(0)
+
+    func, b = _function(module, 'toycomp_memo_init', ir.IntType(1), [_memo_ptr])
+    [table] = func.args
+    allocate = func.append_basic_block('allocate')
+    register = func.append_basic_block('register')
+    ready = func.append_basic_block('ready')
+    failed = func.append_basic_block('failed')
+
+    null = ir.Constant(irutil.i8_ptr, None)
+    b.cbranch(b.icmp_unsigned('!=', b.load(_field(b, table, _ENTRIES)), null), ready, allocate)
+
+    b.position_at_end(allocate)
+    words = b.mul(b.load(_field(b, table, _CAPACITY)),
+                  b.add(b.load(_field(b, table, _NARGS)), _const(2)))
+    entries = b.call(calloc, [words, _const(8)])
+    b.cbranch(b.icmp_unsigned('!=', entries, null), register, failed)
+
+    b.position_at_end(register)
+    b.store(entries, _field(b, table, _ENTRIES))
+    b.call(lock, [memos_lock])
+    b.store(b.load(memos), _field(b, table, _NEXT))
+    b.store(b.bitcast(table, irutil.i8_ptr), memos)
+    b.call(unlock, [memos_lock])
+    b.branch(ready)
+
+    b.position_at_end(ready)
+    b.ret(ir.Constant(ir.IntType(1), 1))
+    b.position_at_end(failed)
+    b.ret(ir.Constant(ir.IntType(1), 0))
+    return func
+
+
+def _increment(builder, table, index):
+    counter = _field(builder, table, index)
+    builder.store(builder.add(builder.load(counter), _const(1)), counter)
+
+
+def _emit_lookup(module, lock, unlock, hash_, entry, equal):
+    func, b = _function(module, MEMO_LOOKUP, irutil.i32, [_memo_ptr, _double.as_pointer(),
+                                                          _double.as_pointer()], internal=False)
+    table, args, result = func.args
+    probe = func.append_basic_block('probe')
+    compare = func.append_basic_block('compare')
+    check = func.append_basic_block('check')
+    next_ = func.append_basic_block('next')
+    hit = func.append_basic_block('hit')
+    miss = func.append_basic_block('miss')
+    done = func.append_basic_block('done')
+
+    nargs = b.load(_field(b, table, _NARGS))
+    key = b.bitcast(args, _i64_ptr)
+    tag = b.call(hash_, [key, nargs])
+    b.call(lock, [_field(b, table, _LOCK)])
+    start = b.block
+    null = ir.Constant(irutil.i8_ptr, None)
+    b.cbranch(b.icmp_unsigned('!=', b.load(_field(b, table, _ENTRIES)), null), probe, miss)
+
+    b.position_at_end(probe)
+    i = b.phi(_i64, 'i')
+    i.add_incoming(_const(0), start)
+    b.cbranch(b.icmp_unsigned('<', i, _const(PROBES)), compare, miss)
+
+    b.position_at_end(compare)
+    e = b.call(entry, [table, b.add(tag, i)])
+    b.cbranch(b.icmp_unsigned('==', b.load(e), tag), check, next_)
+
+    b.position_at_end(check)
+    b.cbranch(b.call(equal, [b.gep(e, [_const(2)]), key, nargs]), hit, next_)
+
+    b.position_at_end(next_)
+    i.add_incoming(b.add(i, _const(1)), next_)
+    b.branch(probe)
+
+    b.position_at_end(hit)
+    b.store(b.load(b.bitcast(b.gep(e, [_const(1)]), _double.as_pointer())), result)
+    _increment(b, table, _HITS)
+    b.branch(done)
+
+    b.position_at_end(miss)
+    _increment(b, table, _MISSES)
+    b.branch(done)
+
+    b.position_at_end(done)
+    found = b.phi(irutil.i32, 'found')
+    found.add_incoming(ir.Constant(irutil.i32, 1), hit)
+    found.add_incoming(ir.Constant(irutil.i32, 0), miss)
+    b.call(unlock, [_field(b, table, _LOCK)])
+    b.ret(found)
+    return func
+
+
+def _emit_store(module, lock, unlock, hash_, entry, equal, copy, init):
+    func, b = _function(module, MEMO_STORE, ir.VoidType(), [_memo_ptr, _double.as_pointer(), _double],
+                        internal=False)
+    table, args, result = func.args
+    probe = func.append_basic_block('probe')
+    compare = func.append_basic_block('compare')
+    check = func.append_basic_block('check')
+    next_ = func.append_basic_block('next')
+    evict = func.append_basic_block('evict')
+    write = func.append_basic_block('write')
+    done = func.append_basic_block('done')
+
+    nargs = b.load(_field(b, table, _NARGS))
+    key = b.bitcast(args, _i64_ptr)
+    tag = b.call(hash_, [key, nargs])
+    b.call(lock, [_field(b, table, _LOCK)])
+    start = b.block
+    b.cbranch(b.call(init, [table]), probe, done)
+
+    # Take the first empty entry or the one that already holds the key.
+    b.position_at_end(probe)
+    i = b.phi(_i64, 'i')
+    i.add_incoming(_const(0), start)
+    b.cbranch(b.icmp_unsigned('<', i, _const(PROBES)), compare, evict)
+
+    b.position_at_end(compare)
+    candidate = b.call(entry, [table, b.add(tag, i)])
+    candidate_tag = b.load(candidate)
+    b.cbranch(b.icmp_unsigned('==', candidate_tag, _const(0)), write, check)
+
+    b.position_at_end(check)
+    matches = b.and_(b.icmp_unsigned('==', candidate_tag, tag),
+                     b.call(equal, [b.gep(candidate, [_const(2)]), key, nargs]))
+    b.cbranch(matches, write, next_)
+
+    b.position_at_end(next_)
+    i.add_incoming(b.add(i, _const(1)), next_)
+    b.branch(probe)
+
+    b.position_at_end(evict)
+    evicted = b.call(entry, [table, tag])
+    _increment(b, table, _EVICTIONS)
+    b.branch(write)
+
+    b.position_at_end(write)
+    e = b.phi(_i64_ptr, 'e')
+    e.add_incoming(candidate, compare)
+    e.add_incoming(candidate, check)
+    e.add_incoming(evicted, evict)
+    b.store(tag, e)
+    b.store(result, b.bitcast(b.gep(e, [_const(1)]), _double.as_pointer()))
+    b.call(copy, [b.gep(e, [_const(2)]), key, nargs])
+    b.branch(done)
+
+    b.position_at_end(done)
+    b.call(unlock, [_field(b, table, _LOCK)])
+    b.ret_void()
+    return func
+
+
+def generate():
+    """
+    Generate the module that defines `MEMO_LOOKUP`, `MEMO_STORE` and
+    `MEMOS`.
+
+    :rtype: llvmlite.ir.Module
+    """
+    module = ir.Module('toycomp.memoruntime')
+    lock = _emit_lock(module)
+    unlock = _emit_unlock(module)
+    hash_ = _emit_hash(module)
+    entry = _emit_entry(module)
+    equal = _emit_equal(module)
+    init = _emit_init(module, lock, unlock)
+    _emit_lookup(module, lock, unlock, hash_, entry, equal)
+    _emit_store(module, lock, unlock, hash_, entry, equal, _emit_copy(module), init)
+    return module
@@ -0,0 +1,335 @@
+"""
+A mid-level intermediate representation in SSA form, between the typed AST
+and LLVM IR.
+
+`toycomp.mirgen` lowers a function's AST to a `Function`, the passes in
+`toycomp.miropt` simplify it cheaply in Python, and `toycomp.mirgen.emit`
+builds the LLVM IR for what is left. Local variables become SSA values
+directly, so the LLVM IR has no allocas, loads or stores for LLVM to
+promote, and code that the passes fold or delete is never built as llvmlite
+objects, printed or parsed.
+
+A function is a list of `Block`\\ s. Each block holds its phis, its other
+instructions and a terminator. Values are typed with llvmlite types, which
+are plain Python objects. Instructions are identified by an opcode string;
+comparisons carry their predicate in it, e.g. ``fcmp.ult``.
+"""
+import itertools
+
+from llvmlite import ir
+
+double = ir.DoubleType()
+i1 = ir.IntType(1)
+i64 = ir.IntType(64)
+
+# Opcodes without side effects, which CSE may merge and DCE may delete.
+PURE_OPS = frozenset([
+    'fadd', 'fsub', 'fmul', 'add', 'sub', 'mul', 'udiv',
+    'fcmp.oeq', 'fcmp.one', 'fcmp.olt', 'fcmp.ole', 'fcmp.ult', 'icmp.eq',
+    'uitofp', 'sitofp', 'fptosi', 'select', 'ceil',
+])
+
+COMMUTATIVE_OPS = frozenset(['fadd', 'fmul', 'add', 'mul', 'fcmp.oeq', 'fcmp.one', 'icmp.eq'])
+
+TERMINATORS = frozenset(['br', 'cbr', 'ret'])
+
+_ids = itertools.count()
+
+
+class Value:
+    """
+    Something an instruction can use.
+
+    :ivar ty: the llvmlite type of the value
+    """
+    def __init__(self, ty):
+        self.ty = ty
+        self.id = next(_ids)
+
+
+class Const(Value):
+    def __init__(self, ty, value):
+        super().__init__(ty)
+        self.value = value
+
+    def __str__(self):
+        return '{} {!r}'.format(self.ty, self.value)
+
+
+class Global(Value):
+    """
+    A function of the module, referred to by name.
+    """
+    def __init__(self, name, fnty):
+        super().__init__(fnty.as_pointer())
+        self.name = name
+        self.fnty = fnty
+
+    def __str__(self):
+        return '@{}'.format(self.name)
+
+
+class Param(Value):
+    def __init__(self, ty, name, index):
+        super().__init__(ty)
+        self.name = name
+        self.index = index
+
+    def __str__(self):
+        return '%{}'.format(self.name)
+
+
+class Instr(Value):
+    """
+    An instruction in `block`. Terminators have no value and jump to their
+    `targets`; calls may be marked `pure` by the frontend.
+    """
+    def __init__(self, op, operands, ty=None, *, name='', targets=(), pure=False):
+        super().__init__(ty)
+        self.op = op
+        self.operands = list(operands)
+        self.name = name
+        self.targets = list(targets)
+        self.pure = pure
+        self.block = None
+
+    @property
+    def has_side_effects(self):
+        if self.op == 'call':
+            return not self.pure
+        return self.op not in PURE_OPS
+
+    def __str__(self):
+        return '%{}.{}'.format(self.name or 'v', self.id)
+
+    def format(self):
+        text = ', '.join(_operand(v) for v in self.operands)
+        if self.targets:
+            text += (', ' if text else '') + ', '.join(t.name for t in self.targets)
+        if self.ty is None:
+            return '{} {}'.format(self.op, text)
+        return '{} = {} {}'.format(self, self.op, text)
+
+
+class Phi(Value):
+    """
+    Selects the value from `incoming` that belongs to the block control came
+    from.
+    """
+    def __init__(self, ty, *, name=''):
+        super().__init__(ty)
+        self.name = name
+        self.incoming = []
+        self.block = None
+
+    @property
+    def operands(self):
+        return [value for value, _ in self.incoming]
+
+    def add_incoming(self, value, block):
+        self.incoming.append((value, block))
+
+    def __str__(self):
+        return '%{}.{}'.format(self.name or 'phi', self.id)
+
+    def format(self):
+        return '{} = phi {}'.format(self, ', '.join(
+            '[{}, {}]'.format(_operand(v), b.name) for v, b in self.incoming))
+
+
+def _operand(value):
+    return str(value) if value is not None else '<undef>'
+
+
+class Block:
+    def __init__(self, name):
+        self.name = name
+        self.phis = []
+        self.instrs = []
+        self.preds = []
+
+    @property
+    def terminator(self):
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+    @property
+    def succs(self):
+        term = self.terminator
+        return term.targets if term else []
+
+    def __repr__(self):
+        return '<Block {}>'.format(self.name)
+
+
+class Function:
+    """
+    :param str name: the name of the function in the module
+    :param llvmlite.ir.FunctionType fnty: its type
+    :param list[str] param_names: the names of its parameters
+    """
+    def __init__(self, name, fnty, param_names):
+        self.name = name
+        self.fnty = fnty
+        self.params = [Param(ty, n, i) for i, (ty, n) in enumerate(zip(fnty.args, param_names))]
+        self.blocks = []
+        self._names = set()
+
+    def append_block(self, name):
+        unique = name
+        for i in itertools.count(1):
+            if unique not in self._names:
+                break
+            unique = '{}.{}'.format(name, i)
+
+        self._names.add(unique)
+        block = Block(unique)
+        self.blocks.append(block)
+        return block
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def instructions(self):
+        """
+        Iterate over the phis and instructions of every block.
+        """
+        for block in self.blocks:
+            yield from block.phis
+            yield from block.instrs
+
+    def reverse_postorder(self):
+        """
+        Get the reachable blocks in reverse postorder, in which every block
+        comes after its dominators.
+
+        :rtype: list[Block]
+        """
+        order = []
+        visited = {self.entry}
+        stack = [(self.entry, iter(self.entry.succs))]
+
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+
+        order.reverse()
+        return order
+
+    def replace_uses(self, replacements):
+        """
+        Replace every use of a key of `replacements` by its value, following
+        chains of replacements.
+
+        :param dict replacements: maps values to the values replacing them
+        """
+        if not replacements:
+            return
+
+        def resolve(value):
+            while value in replacements:
+                value = replacements[value]
+            return value
+
+        for block in self.blocks:
+            for phi in block.phis:
+                phi.incoming = [(resolve(v), b) for v, b in phi.incoming]
+            for instr in block.instrs:
+                instr.operands = [resolve(v) for v in instr.operands]
+
+    def remove_unreachable(self):
+        """
+        Delete the blocks that can't be reached from the entry, and recompute
+        the predecessors of the others, dropping phi operands that no longer
+        come from one.
+
+        :returns: whether blocks were deleted
+        """
+        reachable = set()
+        stack = [self.entry]
+        while stack:
+            block = stack.pop()
+            if block not in reachable:
+                reachable.add(block)
+                stack.extend(block.succs)
+
+        changed = len(reachable) != len(self.blocks)
+        self.blocks = [block for block in self.blocks if block in reachable]
+
+        for block in self.blocks:
+            block.preds = []
+        for block in self.blocks:
+            for succ in block.succs:
+                if block not in succ.preds:
+                    succ.preds.append(block)
+
+        for block in self.blocks:
+            for phi in block.phis:
+                phi.incoming = [(v, b) for v, b in phi.incoming if b in block.preds]
+
+        return changed
+
+    def __str__(self):
+        lines = ['define {} @{}({}) {{'.format(
+            self.fnty.return_type, self.name,
+            ', '.join('{} {}'.format(p.ty, p) for p in self.params))]
+
+        for block in self.blocks:
+            lines.append('{}:'.format(block.name))
+            for instr in block.phis + block.instrs:
+                lines.append('  ' + instr.format())
+
+        lines.append('}')
+        return '\n'.join(lines)
+
+
+class Builder:
+    """
+    Appends instructions to the end of a block, like `llvmlite.ir.IRBuilder`.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.block = None
+
+    def position_at_end(self, block):
+        self.block = block
+
+    def emit(self, op, operands, ty, *, name='', pure=False):
+        instr = Instr(op, operands, ty, name=name, pure=pure)
+        instr.block = self.block
+        self.block.instrs.append(instr)
+        return instr
+
+    def phi(self, ty, *, name='', block=None):
+        phi = Phi(ty, name=name)
+        phi.block = block or self.block
+        phi.block.phis.append(phi)
+        return phi
+
+    def _terminate(self, op, operands, targets):
+        instr = Instr(op, operands, targets=targets)
+        instr.block = self.block
+        self.block.instrs.append(instr)
+        for target in targets:
+            if self.block not in target.preds:
+                target.preds.append(self.block)
+        return instr
+
+    def branch(self, target):
+        return self._terminate('br', [], [target])
+
+    def cbranch(self, cond, true, false):
+        return self._terminate('cbr', [cond], [true, false])
+
+    def ret(self, value):
+        return self._terminate('ret', [value], [])
+
@@ -0,0 +1,432 @@
+"""
+Lower functions from the typed AST to `toycomp.mir`, and emit LLVM IR for
+the result.
+
+Local variables are put into SSA form while lowering, with the algorithm of
+Braun et al., "Simple and Efficient Construction of Static Single Assignment
+Form" (CC 2013): a variable read looks up its definition in the current
+block and, failing that, in the predecessors, placing a phi where they
+meet. Blocks whose predecessors aren't all known yet, loop headers, get
+their phis completed when they are sealed. The phis this creates needlessly
+are left to `toycomp.miropt.CopyPropagation`.
+"""
+from llvmlite import ir
+
+from toycomp import ast, loops, mir, miropt
+
+
+class Unsupported(Exception):
+    """
+    Raised for a function that uses something the MIR doesn't model:
+    buffers, ``parallel for`` or memoization. Such functions go through
+    `toycomp.codegen.Codegen` instead.
+    """
+
+
+class _Counter:
+    """
+    The hidden variable that counts the iterations of a counted loop.
+    """
+    def __init__(self, name):
+        self.name = name
+
+
+class MIRGen(ast.ASTVisitor):
+    """
+    Lowers one function at a time; see `lower`.
+
+    :param bool count_loops: lower the `for` loops that
+        `toycomp.loops.counted_loop` recognizes to loops over an integer
+        counter, like `toycomp.codegen.Codegen` does
+    """
+    def __init__(self, *, count_loops=True):
+        self.count_loops = count_loops
+        self.func = None
+        self.builder = None
+
+    def lower(self, stmt):
+        """
+        :type stmt: toycomp.ast.Function
+        :rtype: toycomp.mir.Function
+        :raises Unsupported: if the function uses something the MIR doesn't
+            model
+        """
+        if stmt.memo:
+            raise Unsupported('memo function')
+
+        proto = stmt.proto
+        self.func = mir.Function(proto.name, proto.decl_ty.llvm_ty, [p.name for p in proto.params])
+        self.builder = mir.Builder(self.func)
+        self._defs = {}
+        self._types = {}
+        self._sealed = set()
+        self._incomplete = {}
+
+        self.builder.position_at_end(self.new_block('entry'))
+        for param, value in zip(proto.params, self.func.params):
+            self.write(param, value)
+
+        self.builder.ret(self.visit(stmt.body))
+        return self.func
+
+    def new_block(self, name, *, sealed=True):
+        """
+        Add a block. Seal it right away unless it has predecessors that
+        haven't been generated yet.
+        """
+        block = self.func.append_block(name)
+        if sealed:
+            self._sealed.add(block)
+        return block
+
+    def seal(self, block):
+        """
+        Complete the phis of `block` now that all its predecessors exist.
+        """
+        for var, phi in self._incomplete.pop(block, []):
+            self._add_phi_operands(var, phi)
+        self._sealed.add(block)
+
+    def write(self, var, value, block=None):
+        self._types.setdefault(var, value.ty)
+        self._defs.setdefault(var, {})[block or self.builder.block] = value
+
+    def read(self, var, block=None):
+        """
+        Get the value of the variable `var` at the end of `block`.
+        """
+        block = block or self.builder.block
+        defs = self._defs[var]
+
+        # Follow single predecessors without recursing.
+        chain = []
+        while block not in defs and block in self._sealed and len(block.preds) == 1:
+            chain.append(block)
+            block = block.preds[0]
+
+        value = defs.get(block)
+        if value is None:
+            phi = self.builder.phi(self._types[var], name=var.name, block=block)
+            self.write(var, phi, block)
+            if block in self._sealed:
+                self._add_phi_operands(var, phi)
+            else:
+                self._incomplete.setdefault(block, []).append((var, phi))
+            value = phi
+
+        for block in chain:
+            self.write(var, value, block)
+        return value
+
+    def _add_phi_operands(self, var, phi):
+        for pred in phi.block.preds:
+            phi.add_incoming(self.read(var, pred), pred)
+
+    def emit(self, op, operands, ty, **kwargs):
+        return self.builder.emit(op, operands, ty, **kwargs)
+
+    def visit_NumberExpr(self, expr):
+        return mir.Const(expr.ty.llvm_ty, float(expr.value))
+
+    def visit_VariableExpr(self, expr):
+        if expr.slot is not None:
+            return self.read(expr.decl)
+
+        decl = expr.decl
+        return mir.Global(decl.name, decl.decl_ty.llvm_ty)
+
+    def visit_BinaryExpr(self, expr):
+        if expr.op == '=':
+            if not isinstance(expr.lhs, ast.VariableExpr):
+                raise Unsupported('assignment to a buffer element')
+
+            value = self.visit(expr.rhs)
+            self.write(expr.lhs.decl, value)
+            return value
+
+        lhs = self.visit(expr.lhs)
+        rhs = self.visit(expr.rhs)
+        ty = expr.ty.llvm_ty
+
+        if expr.op == '+':
+            return self.emit('fadd', [lhs, rhs], ty, name='addtmp')
+        elif expr.op == '-':
+            return self.emit('fsub', [lhs, rhs], ty, name='subtmp')
+        elif expr.op == '*':
+            return self.emit('fmul', [lhs, rhs], ty, name='multmp')
+        elif expr.op == '<':
+            cmp = self.emit('fcmp.ult', [lhs, rhs], mir.i1, name='cmptmp')
+            return self.emit('uitofp', [cmp], mir.double, name='booltmp')
+
+        raise Unsupported('operator {!r}'.format(expr.op))
+
+    def visit_CallExpr(self, expr):
+        callee = self.visit(expr.func)
+        args = [self.visit(arg) for arg in expr.args]
+
+        decl = expr.func.decl if isinstance(expr.func, ast.VariableExpr) else None
+        pure = isinstance(decl, ast.Prototype) and decl.pure
+
+        return self.emit('call', [callee] + args, expr.ty.llvm_ty, name='calltmp', pure=pure)
+
+    def visit_IndexExpr(self, expr):
+        raise Unsupported('buffer element')
+
+    def visit_IfExpr(self, expr):
+        b = self.builder
+
+        test = self.visit(expr.test)
+        cond = self.emit('fcmp.one', [test, mir.Const(mir.double, 0.0)], mir.i1, name='ifcond')
+
+        then_block = self.new_block('then')
+        else_block = self.new_block('else')
+        merge_block = self.new_block('endif', sealed=False)
+        b.cbranch(cond, then_block, else_block)
+
+        b.position_at_end(then_block)
+        true_val = self.visit(expr.true)
+        true_block = b.block
+        b.branch(merge_block)
+
+        b.position_at_end(else_block)
+        false_val = self.visit(expr.false)
+        false_block = b.block
+        b.branch(merge_block)
+
+        self.seal(merge_block)
+        b.position_at_end(merge_block)
+
+        phi = b.phi(expr.ty.llvm_ty, name='iftmp')
+        phi.add_incoming(true_val, true_block)
+        phi.add_incoming(false_val, false_block)
+        return phi
+
+    def visit_LetExpr(self, expr):
+        self.write(expr, self.visit(expr.init))
+        return self.visit(expr.body)
+
+    def visit_ForExpr(self, expr):
+        if expr.parallel:
+            raise Unsupported('parallel for')
+
+        loop = loops.counted_loop(expr) if self.count_loops else None
+        if loop:
+            self.lower_counted_for(expr, loop)
+        else:
+            self.lower_for(expr)
+
+        return mir.Const(mir.double, 0.0)
+
+    def lower_for(self, expr):
+        """
+        Lower a `for` loop the general way, like
+        `toycomp.codegen.Codegen.emit_for`.
+        """
+        b = self.builder
+
+        self.write(expr, self.visit(expr.start))
+
+        header_block = self.new_block('for', sealed=False)
+        b.branch(header_block)
+        b.position_at_end(header_block)
+
+        end = self.visit(expr.end)
+        done = self.emit('fcmp.oeq', [end, mir.Const(mir.double, 0.0)], mir.i1)
+
+        body_block = self.new_block('for.body')
+        exit_block = self.new_block('for.exit')
+        b.cbranch(done, exit_block, body_block)
+
+        b.position_at_end(body_block)
+        self.visit(expr.body)
+        # Like Codegen, read the variable before the step, which may assign it.
+        value = self.read(expr)
+        step = self.visit(expr.step)
+        self.write(expr, self.emit('fadd', [value, step], mir.double, name=expr.name))
+        b.branch(header_block)
+        self.seal(header_block)
+
+        b.position_at_end(exit_block)
+
+    def lower_counted_for(self, expr, loop):
+        """
+        Lower a `for` loop to a loop over an integer counter, like
+        `toycomp.codegen.Codegen.emit_counted_for`.
+        """
+        b = self.builder
+        i64 = mir.i64
+
+        bound = self.visit(loop.bound)
+        exact = self.emit('fcmp.ole', [bound, mir.Const(mir.double, float(loops.EXACT_LIMIT))], mir.i1)
+
+        preheader_block = self.new_block('for.preheader')
+        general_block = self.new_block('for.general')
+        exit_block = self.new_block('for.exit', sealed=False)
+        b.cbranch(exact, preheader_block, general_block)
+
+        b.position_at_end(preheader_block)
+        start = mir.Const(i64, loop.start)
+        step = mir.Const(i64, loop.step)
+        below = self.emit('fcmp.olt', [bound, mir.Const(mir.double, float(loop.start))], mir.i1)
+        bound = self.emit('select', [below, mir.Const(mir.double, float(loop.start)), bound], mir.double)
+        end = self.emit('fptosi', [self.emit('ceil', [bound], mir.double)], i64)
+        trip_count = self.emit('udiv', [self.emit('add', [self.emit('sub', [end, start], i64),
+                                                          mir.Const(i64, loop.step - 1)], i64),
+                                        step], i64, name=expr.name + '.trips')
+
+        counter = _Counter(expr.name + '.count')
+        self.write(counter, mir.Const(i64, 0))
+
+        header_block = self.new_block('for', sealed=False)
+        b.branch(header_block)
+        b.position_at_end(header_block)
+
+        body_block = self.new_block('for.body')
+        b.cbranch(self.emit('icmp.eq', [self.read(counter), trip_count], mir.i1),
+                  exit_block, body_block)
+
+        b.position_at_end(body_block)
+        index = self.read(counter)
+        if loop.step != 1:
+            index = self.emit('mul', [index, step], i64)
+        if loop.start:
+            index = self.emit('add', [index, start], i64)
+        self.write(expr, self.emit('sitofp', [index], mir.double, name=expr.name))
+        self.visit(expr.body)
+
+        latch_block = self.new_block('for.latch')
+        b.branch(latch_block)
+        b.position_at_end(latch_block)
+        self.write(counter, self.emit('add', [self.read(counter), mir.Const(i64, 1)], i64,
+                                      name=expr.name + '.next'))
+        b.branch(header_block)
+        self.seal(header_block)
+
+        b.position_at_end(general_block)
+        saved, self.count_loops = self.count_loops, False
+        try:
+            self.lower_for(expr)
+        finally:
+            self.count_loops = saved
+        b.branch(exit_block)
+
+        self.seal(exit_block)
+        b.position_at_end(exit_block)
+
+    def visit_Prototype(self, stmt):
+        raise NotImplementedError
+
+    def visit_Function(self, stmt):
+        raise NotImplementedError
+
+    def visit_FormalParamDecl(self, decl):
+        raise NotImplementedError
+
+
+_FCMP = {
+    'oeq': ('fcmp_ordered', '=='),
+    'one': ('fcmp_ordered', '!='),
+    'olt': ('fcmp_ordered', '<'),
+    'ole': ('fcmp_ordered', '<='),
+    'ult': ('fcmp_unordered', '<'),
+}
+
+
+def emit(func, module):
+    """
+    Build the LLVM IR for `func` in `module`, defining the function that
+    `module` declares by that name, if any.
+
+    :type func: toycomp.mir.Function
+    :type module: llvmlite.ir.Module
+    :rtype: llvmlite.ir.Function
+    """
+    llfunc = module.globals.get(func.name)
+    if llfunc is None:
+        llfunc = ir.Function(module, func.fnty, func.name)
+    for arg, param in zip(llfunc.args, func.params):
+        arg.name = param.name
+
+    order = func.reverse_postorder()
+    blocks = {block: llfunc.append_basic_block(block.name) for block in order}
+    values = dict(zip(func.params, llfunc.args))
+    b = ir.IRBuilder()
+
+    def value(v):
+        if isinstance(v, mir.Const):
+            return ir.Constant(v.ty, v.value)
+        if isinstance(v, mir.Global):
+            return module.globals.get(v.name) or ir.Function(module, v.fnty, v.name)
+        return values[v]
+
+    phis = []
+
+    for block in order:
+        b.position_at_end(blocks[block])
+
+        for phi in block.phis:
+            values[phi] = b.phi(phi.ty, name=phi.name)
+            phis.append(phi)
+
+        for instr in block.instrs:
+            op = instr.op
+            args = [value(v) for v in instr.operands]
+
+            if op == 'br':
+                b.branch(blocks[instr.targets[0]])
+            elif op == 'cbr':
+                b.cbranch(args[0], blocks[instr.targets[0]], blocks[instr.targets[1]])
+            elif op == 'ret':
+                b.ret(args[0])
+            elif op == 'call':
+                values[instr] = b.call(args[0], args[1:], name=instr.name)
+            elif op == 'ceil':
+                ceil = module.declare_intrinsic('llvm.ceil', [instr.ty])
+                values[instr] = b.call(ceil, args, name=instr.name)
+            elif op == 'select':
+                values[instr] = b.select(*args, name=instr.name)
+            elif op in ('uitofp', 'sitofp', 'fptosi'):
+                values[instr] = getattr(b, op)(args[0], instr.ty, name=instr.name)
+            elif op == 'icmp.eq':
+                values[instr] = b.icmp_unsigned('==', *args, name=instr.name)
+            elif op.startswith('fcmp.'):
+                method, pred = _FCMP[op[5:]]
+                values[instr] = getattr(b, method)(pred, *args, name=instr.name)
+            else:
+                values[instr] = getattr(b, op)(*args, name=instr.name)
+
+    for phi in phis:
+        for v, block in phi.incoming:
+            values[phi].add_incoming(value(v), blocks[block])
+
+    return llfunc
+
+
+def generate(cg, stmt, *, count_loops=True, passes=None):
+    """
+    Generate the LLVM IR for the function `stmt` through the MIR: lower it,
+    optimize it with `passes` and emit it into the module of `cg`. A
+    function that the MIR doesn't support is generated by `cg` directly.
+
+    :type cg: toycomp.codegen.Codegen
+    :type stmt: toycomp.ast.Function
+    :param toycomp.compilepass.PassManager passes: the MIR passes to run,
+        `toycomp.miropt.default_passes` by default
+    :returns: the LLVM function, or None on error
+    """
+    existing = cg.module.globals.get(stmt.proto.name)
+    if existing is not None and existing.basic_blocks:
+        cg.emit_error('function {!r} already defined'.format(stmt.proto.name), node=stmt.proto)
+        return None
+
+    try:
+        func = MIRGen(count_loops=count_loops).lower(stmt)
+    except Unsupported:
+        return cg.visit(stmt)
+
+    (passes or miropt.default_passes()).visit(func)
+
+    if existing is None:
+        cg.visit(stmt.proto)
+
+    return emit(func, cg.module)
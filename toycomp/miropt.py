@@ -0,0 +1,360 @@
+"""
+Cheap optimization passes over `toycomp.mir` functions.
+
+They are `toycomp.compilepass.Pass`\\ es, so a `toycomp.compilepass.PassManager`
+orders them by their dependencies. Each takes a `toycomp.mir.Function`,
+changes it in place and returns True.
+
+The passes only do what is cheap to do in Python and saves building LLVM
+IR; LLVM still does the real optimization afterwards.
+"""
+import math
+
+from toycomp import compilepass, mir
+
+
+def remove_trivial_phis(func):
+    """
+    Replace each phi that only ever selects one value, apart from itself, by
+    that value.
+
+    :returns: whether phis were removed
+    """
+    changed = False
+
+    while True:
+        replacements = {}
+
+        def resolve(value):
+            while value in replacements:
+                value = replacements[value]
+            return value
+
+        for block in func.blocks:
+            for phi in block.phis:
+                # An operand replaced earlier in this round counts as what
+                # replaces it.
+                values = {resolve(v) for v in phi.operands}
+                values.discard(phi)
+                if len(values) == 1:
+                    replacements[phi] = values.pop()
+
+        if not replacements:
+            return changed
+
+        changed = True
+        func.replace_uses(replacements)
+        for block in func.blocks:
+            block.phis = [phi for phi in block.phis if phi not in replacements]
+
+
+class CopyPropagation(compilepass.Pass):
+    """
+    Replace copies by what they copy. Lowering to SSA form assigns values to
+    variables without copying them, so the copies left are the phis that
+    merge a variable which doesn't change, like one a loop doesn't assign.
+    """
+    def visit(self, func):
+        remove_trivial_phis(func)
+        return True
+
+
+def _fcmp(pred, a, b):
+    if math.isnan(a) or math.isnan(b):
+        # Only the unordered comparison holds.
+        return pred == 'ult'
+    return {'oeq': a == b, 'one': a != b, 'olt': a < b, 'ole': a <= b, 'ult': a < b}[pred]
+
+
+def _wrap(value):
+    return (value + 2 ** 63) % 2 ** 64 - 2 ** 63
+
+
+def _fold(instr):
+    """
+    Compute the value of `instr` from its constant operands, the way LLVM
+    would at run time, or return None.
+    """
+    op = instr.op
+    args = [v.value for v in instr.operands]
+
+    if op == 'fadd':
+        return args[0] + args[1]
+    if op == 'fsub':
+        return args[0] - args[1]
+    if op == 'fmul':
+        return args[0] * args[1]
+    if op == 'add':
+        return _wrap(args[0] + args[1])
+    if op == 'sub':
+        return _wrap(args[0] - args[1])
+    if op == 'mul':
+        return _wrap(args[0] * args[1])
+    if op == 'udiv' and args[1]:
+        return _wrap((args[0] % 2 ** 64) // (args[1] % 2 ** 64))
+    if op.startswith('fcmp.'):
+        return int(_fcmp(op[5:], args[0], args[1]))
+    if op == 'icmp.eq':
+        return int(args[0] == args[1])
+    if op in ('uitofp', 'sitofp'):
+        return float(args[0])
+    if op == 'ceil' and math.isfinite(args[0]):
+        return float(math.ceil(args[0]))
+    if op == 'fptosi' and math.isfinite(args[0]) and -2 ** 63 <= args[0] < 2 ** 63:
+        return int(args[0])
+    if op == 'select':
+        return args[1] if args[0] else args[2]
+
+    return None
+
+
+def _identity(instr):
+    """
+    Return the operand that integer `instr` leaves unchanged, like ``x`` of
+    ``add x, 0``, or None. Floating-point identities are left alone: -0.0
+    and NaN make most of them wrong.
+    """
+    if instr.op not in ('add', 'sub', 'mul', 'udiv'):
+        return None
+
+    lhs, rhs = instr.operands
+    unit = 0 if instr.op in ('add', 'sub') else 1
+    if isinstance(rhs, mir.Const) and rhs.value == unit:
+        return lhs
+    if instr.op in ('add', 'mul') and isinstance(lhs, mir.Const) and lhs.value == unit:
+        return rhs
+    return None
+
+
+class ConstantFolding(compilepass.Pass):
+    """
+    Compute the instructions whose operands are all constants, and drop
+    integer operations by their identity element.
+    """
+    dependencies = (CopyPropagation,)
+
+    def visit(self, func):
+        replacements = {}
+
+        for block in func.reverse_postorder():
+            kept = []
+            for instr in block.instrs:
+                instr.operands = [replacements.get(v, v) for v in instr.operands]
+
+                folded = None
+                if instr.op in mir.PURE_OPS and all(isinstance(v, mir.Const) for v in instr.operands):
+                    folded = _fold(instr)
+
+                if folded is not None:
+                    replacements[instr] = mir.Const(instr.ty, folded)
+                    continue
+
+                same = _identity(instr)
+                if same is not None:
+                    replacements[instr] = same
+                else:
+                    kept.append(instr)
+
+            block.instrs = kept
+
+        func.replace_uses(replacements)
+        return True
+
+
+class BranchFolding(compilepass.Pass):
+    """
+    Turn conditional branches on constants into jumps, delete the blocks
+    that can no longer be reached, and merge each block that only jumps to
+    a block that has no other predecessor with it.
+    """
+    dependencies = (ConstantFolding,)
+
+    def visit(self, func):
+        for block in func.blocks:
+            term = block.terminator
+            if term is None or term.op != 'cbr':
+                continue
+
+            cond = term.operands[0]
+            if isinstance(cond, mir.Const):
+                target = term.targets[0 if cond.value else 1]
+            elif term.targets[0] is term.targets[1]:
+                target = term.targets[0]
+            else:
+                continue
+
+            term.op, term.operands, term.targets = 'br', [], [target]
+
+        func.remove_unreachable()
+        remove_trivial_phis(func)
+        self.merge_blocks(func)
+        return True
+
+    def merge_blocks(self, func):
+        removed = set()
+
+        for block in func.blocks:
+            if block in removed:
+                continue
+
+            while True:
+                term = block.terminator
+                if term is None or term.op != 'br':
+                    break
+
+                succ = term.targets[0]
+                if succ is block or succ is func.entry or len(succ.preds) != 1:
+                    break
+
+                # The phis of `succ` have a single operand, from `block`.
+                func.replace_uses({phi: phi.operands[0] for phi in succ.phis})
+                block.instrs.pop()
+                for instr in succ.instrs:
+                    instr.block = block
+                block.instrs.extend(succ.instrs)
+
+                for next_block in succ.succs:
+                    next_block.preds = [block if p is succ else p for p in next_block.preds]
+                    for phi in next_block.phis:
+                        phi.incoming = [(v, block if b is succ else b) for v, b in phi.incoming]
+
+                removed.add(succ)
+
+        func.blocks = [block for block in func.blocks if block not in removed]
+
+
+def _dominators(order):
+    """
+    Compute the immediate dominator of each block, with the algorithm of
+    Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm".
+
+    :param list[toycomp.mir.Block] order: the blocks in reverse postorder
+    :returns: the immediate dominator of each block; the entry's is itself
+    :rtype: dict
+    """
+    index = {block: i for i, block in enumerate(order)}
+    idom = {order[0]: order[0]}
+
+    def intersect(a, b):
+        while a is not b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            preds = [p for p in block.preds if p in idom]
+            new = preds[0]
+            for pred in preds[1:]:
+                new = intersect(pred, new)
+            if idom.get(block) is not new:
+                idom[block] = new
+                changed = True
+
+    return idom
+
+
+def _key(value):
+    if isinstance(value, mir.Const):
+        # float.hex tells 0.0 from -0.0.
+        v = value.value
+        return str(value.ty), v.hex() if isinstance(v, float) else v
+    if isinstance(value, mir.Global):
+        return value.name
+    return id(value)
+
+
+class CSE(compilepass.Pass):
+    """
+    Replace each computation that was already done in a dominating block, or
+    earlier in the same block, by the earlier result. Calls to functions the
+    typechecker found pure count as computations.
+    """
+    dependencies = (BranchFolding,)
+
+    def visit(self, func):
+        order = func.reverse_postorder()
+        idom = _dominators(order)
+
+        children = {block: [] for block in order}
+        for block in order[1:]:
+            children[idom[block]].append(block)
+
+        replacements = {}
+        available = {}
+        # Walk the dominator tree, forgetting what a subtree computed when
+        # leaving it.
+        stack = [(order[0], None)]
+        while stack:
+            block, undo = stack.pop()
+            if undo is not None:
+                for key in undo:
+                    del available[key]
+                continue
+
+            added = []
+            kept = []
+            for instr in block.instrs:
+                instr.operands = [replacements.get(v, v) for v in instr.operands]
+                if instr.has_side_effects:
+                    kept.append(instr)
+                    continue
+
+                operands = [_key(v) for v in instr.operands]
+                if instr.op in mir.COMMUTATIVE_OPS:
+                    operands.sort(key=repr)
+                key = (instr.op, str(instr.ty), tuple(operands))
+
+                previous = available.get(key)
+                if previous is None:
+                    available[key] = instr
+                    added.append(key)
+                    kept.append(instr)
+                else:
+                    replacements[instr] = previous
+
+            block.instrs = kept
+            stack.append((block, added))
+            stack.extend((child, None) for child in children[block])
+
+        func.replace_uses(replacements)
+        return True
+
+
+class DCE(compilepass.Pass):
+    """
+    Delete the instructions and phis whose values aren't used by anything
+    with a side effect, including phis that only feed each other around a
+    loop. Calls stay, even pure ones, since they might not return.
+    """
+    dependencies = (CSE,)
+
+    def visit(self, func):
+        live = set()
+        work = [instr for block in func.blocks for instr in block.instrs
+                if instr.has_side_effects or instr.op == 'call']
+
+        while work:
+            value = work.pop()
+            if value in live:
+                continue
+            live.add(value)
+            work.extend(v for v in value.operands if isinstance(v, (mir.Instr, mir.Phi)))
+
+        for block in func.blocks:
+            block.phis = [phi for phi in block.phis if phi in live]
+            block.instrs = [instr for instr in block.instrs if instr in live]
+
+        return True
+
+
+def default_passes():
+    """
+    :returns: a pass manager that runs every pass in this module
+    :rtype: toycomp.compilepass.PassManager
+    """
+    return compilepass.PassManager([CopyPropagation(), ConstantFolding(), BranchFolding(), CSE(), DCE()])
@@ -1,4 +1,3 @@
-import collections
 from contextlib import contextmanager
 
 from . import ast, types, compilepass, user_op_rewriter
@@ -6,6 +5,20 @@ from .translation import *
 
 
 class NameResolver(ast.ASTVisitor, compilepass.Pass):
+    """
+    Links every `VariableExpr` to its declaration.
+
+    Local declarations (parameters and `let`/`for` variables) get a slot
+    number that is unique within their function, and references to them
+    record that slot, so that later passes can keep per-variable state in a
+    list rather than a dict. `Function.slot_count` holds the number of slots
+    a function uses.
+
+    Locals live in one flat table mapping each name to its innermost
+    declaration. Entering a scope doesn't copy anything; declarations log
+    the binding they shadow, and leaving the scope restores those bindings.
+    Looking up a name therefore costs the same at any nesting depth.
+    """
     dependencies = (user_op_rewriter.UserOpRewriter,)
 
     def __init__(self, diags):
@@ -16,8 +29,15 @@ class NameResolver(ast.ASTVisitor, compilepass.Pass):
         self.globals = {
             'double': ast.TypeDecl('double', types.double_ty),
             'int': ast.TypeDecl('int', types.int_ty),
+            'buffer': ast.TypeDecl('buffer', types.buffer_ty),
         }
-        self.scope = collections.ChainMap(self.globals)
+        self._locals = {}  # name -> (decl, scope depth)
+        self._undo_log = []  # (name, shadowed binding or None)
+        self._depth = 0
+        self._slot_count = 0
+        # Statistics: the declarations made and the references resolved.
+        self.declarations = 0
+        self.references = 0
 
     def visit_FormalParamDecl(self, decl):
         return self.declare(decl)
@@ -38,13 +58,27 @@ class NameResolver(ast.ASTVisitor, compilepass.Pass):
         """
         :type decl: ast.Decl
         """
-
-        if decl.name in self.scope.maps[0] and self.scope[decl.name] is not decl:
+        if not self._depth:
+            previous = self.globals.get(decl.name)
+        else:
+            previous, depth = self._locals.get(decl.name, (None, None))
+            if depth != self._depth:
+                previous = None
+
+        if previous is not None and previous is not decl:
             self.diags.error(decl,
                              tr('redeclaration of {!r} in same scope').format(decl.name))
             return False
 
-        self.scope[decl.name] = decl
+        if not self._depth:
+            self.globals[decl.name] = decl
+        elif previous is None:
+            self._undo_log.append((decl.name, self._locals.get(decl.name)))
+            self._locals[decl.name] = (decl, self._depth)
+            decl.slot = self._slot_count
+            self._slot_count += 1
+
+        self.declarations += 1
         return True
 
     def visit_Function(self, func):
@@ -55,21 +89,29 @@ class NameResolver(ast.ASTVisitor, compilepass.Pass):
 
         with self.new_scope():
             param_ok = all([self.visit(param) for param in func.proto.params])
-            # param_tys_ok = all([self.visit(param.typename)
-            #                     for param in func.proto.params
-            #                     if param.typename])
             body_ok = self.visit(func.body)
+            func.slot_count = self._slot_count
 
             return all([decl_ok, param_ok, body_ok])
 
     @contextmanager
     def new_scope(self):
-        old_scope = self.scope
+        if not self._depth:
+            # The outermost scope of a function or top-level expression.
+            self._slot_count = 0
+
+        undo_start = len(self._undo_log)
+        self._depth += 1
         try:
-            self.scope = self.scope.new_child()
             yield
         finally:
-            self.scope = old_scope
+            self._depth -= 1
+            while len(self._undo_log) > undo_start:
+                name, binding = self._undo_log.pop()
+                if binding is None:
+                    del self._locals[name]
+                else:
+                    self._locals[name] = binding
 
     def visit_IfExpr(self, expr):
         return all([
@@ -107,16 +149,29 @@ class NameResolver(ast.ASTVisitor, compilepass.Pass):
     def visit_NumberExpr(self, expr):
         return True
 
+    def visit_IndexExpr(self, expr):
+        return all([
+            self.visit(expr.target),
+            self.visit(expr.index)
+        ])
+
     def visit_VariableExpr(self, expr):
-        try:
-            decl = self.scope[expr.name]
-        except KeyError:
+        binding = self._locals.get(expr.name)
+        if binding is not None:
+            expr.decl = binding[0]
+            expr.slot = expr.decl.slot
+            self.references += 1
+            return True
+
+        decl = self.globals.get(expr.name)
+        if decl is None:
             expr.decl = ast.Undeclared()
             self.diags.error(expr,
                              tr('undeclared symbol {!r}').format(expr.name))
             return False
 
         expr.decl = decl
+        self.references += 1
         return True
 
     def visit_CallExpr(self, expr):
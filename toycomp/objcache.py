@@ -0,0 +1,172 @@
+"""
+An on-disk cache of the machine code the JIT compiles.
+
+Each object file is stored under a hash of everything that determines it:
+the module's IR before optimization, the optimization level, the target
+triple, CPU and features, and the LLVM version. A program that hasn't
+changed since it was last run loads its native code from the cache, skipping
+both optimization and code generation.
+
+The cache is bounded in size; when it grows too large, the entries that were
+used least recently are deleted. Several processes may share a cache
+directory.
+"""
+import hashlib
+import os
+import tempfile
+
+import llvmlite.binding as llvm
+
+# Bump this when a change to the compiler changes the code it generates for
+# the same IR, e.g. the JIT's target machine options.
+FORMAT = 1
+
+DEFAULT_MAX_SIZE = 64 * 2 ** 20
+
+_SUFFIX = '.o'
+
+
+def default_directory():
+    """
+    ``$TOYCOMP_CACHE_DIR``, or ``toycomp`` under the user's cache directory.
+    """
+    path = os.environ.get('TOYCOMP_CACHE_DIR')
+    if path:
+        return path
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'toycomp')
+
+
+class ObjectCache:
+    """
+    A directory of object files, one per compiled module.
+
+    :param str directory: where to keep the objects; see `default_directory`
+    :param int max_size: the most bytes of objects to keep
+    """
+    def __init__(self, directory=None, *, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # The size of the cache as of the last scan, plus what was stored
+        # since; None until the first store.
+        self._size = None
+
+    def __repr__(self):
+        return '<ObjectCache {!r}>'.format(self.directory)
+
+    @staticmethod
+    def key(ir, *, opt_level, triple, cpu, features):
+        """
+        Get the cache key of a module.
+
+        :param str ir: the module's IR before optimization
+        :rtype: str
+        """
+        h = hashlib.sha256()
+        for part in [FORMAT, llvm.llvm_version_info, opt_level, triple, cpu, features]:
+            h.update(repr(part).encode())
+            h.update(b'\0')
+        h.update(ir.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def load(self, key):
+        """
+        Get the object stored under `key`, marking it as recently used.
+
+        :rtype: bytes | None
+        """
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def store(self, key, data):
+        """
+        Store an object under `key`, then evict the least recently used
+        objects if the cache has outgrown `max_size`.
+
+        A cache that can't be written to is ignored: the program still runs,
+        it's just compiled again next time.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Write under a temporary name and rename, so that another
+            # process never reads a partial object.
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            return
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += len(data)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used objects until the cache fits in
+        `max_size`.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+
+    def _entries(self):
+        entries = []
+
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue  # evicted by another process
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+
+        return entries
+
+    def clear(self):
+        """
+        Delete every object in the cache.
+        """
+        max_size, self.max_size = self.max_size, 0
+        try:
+            if os.path.isdir(self.directory):
+                self.evict()
+        finally:
+            self.max_size = max_size
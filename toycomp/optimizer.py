@@ -0,0 +1,115 @@
+import re
+from collections import namedtuple
+
+import llvmlite.binding as llvm
+
+
+VectorizedLoop = namedtuple('VectorizedLoop', ['function', 'block', 'width'])
+
+_metadata_re = re.compile(r'^!(\d+) = (?:distinct )?!\{(.*)\}$', re.MULTILINE)
+_loop_md_re = re.compile(r'!llvm\.loop !(\d+)')
+_vector_ty_re = re.compile(r'<(\d+) x ')
+
+
+def parse_module(module):
+    """
+    Convert an `ir.Module` into a verified `llvmlite.binding.ModuleRef`.
+    """
+    llmod = llvm.parse_assembly(str(module))
+    llmod.verify()
+    return llmod
+
+
+def optimize(llmod, target_machine, *, opt_level=2, vectorize=True):
+    """
+    Run the standard LLVM pipeline for `opt_level` over `llmod` in place.
+
+    :param llvmlite.binding.ModuleRef llmod: the module to optimize
+    :param llvmlite.binding.TargetMachine target_machine: the machine to tune for
+    :param bool vectorize: enable the loop and SLP vectorizers
+    """
+    pto = llvm.create_pipeline_tuning_options(speed_level=opt_level)
+    pto.loop_vectorization = vectorize
+    pto.slp_vectorization = vectorize
+
+    pb = llvm.create_pass_builder(target_machine, pto)
+    pb.getModulePassManager().run(llmod, pb)
+
+    return llmod
+
+
+def internalize(llmod, exports):
+    """
+    Give every function and global variable that `llmod` defines internal
+    linkage, except `exports`, so that the optimizer knows about all their
+    uses. Only use this on a module that holds the whole program.
+
+    :param llvmlite.binding.ModuleRef llmod: the module to change in place
+    :param exports: the names that must stay visible to other code
+    """
+    exports = set(exports)
+
+    for value in [*llmod.functions, *llmod.global_variables]:
+        if value.is_declaration or value.name in exports or value.name.startswith('llvm.'):
+            continue
+        if value.linkage == llvm.Linkage.external:
+            value.linkage = llvm.Linkage.internal
+
+
+def optimize_whole_program(llmod, target_machine):
+    """
+    Run the interprocedural passes that pay off once `llmod` has been
+    internalized: constant propagation across calls, passing pointer
+    arguments by value, dropping unused arguments and deleting everything
+    that's no longer referenced.
+
+    :param llvmlite.binding.ModuleRef llmod: the module to optimize in place
+    :param llvmlite.binding.TargetMachine target_machine: the machine to tune for
+    """
+    pb = llvm.create_pass_builder(target_machine, llvm.create_pipeline_tuning_options())
+    mpm = llvm.create_new_module_pass_manager()
+    mpm.add_ipsccp_pass()
+    mpm.add_global_opt_pass()
+    mpm.add_argument_promotion_pass()
+    mpm.add_dead_arg_elimination_pass()
+    mpm.add_global_dead_code_eliminate_pass()
+    mpm.run(llmod, pb)
+
+    return llmod
+
+
+def vectorized_loops(llmod):
+    """
+    Find the loops in an optimized module that the loop vectorizer rewrote.
+
+    A loop counts as vectorized when its latch carries ``llvm.loop.isvectorized``
+    metadata and operates on vector values; this excludes the scalar remainder
+    loops, which are tagged too so that they aren't vectorized again.
+
+    :rtype: list[VectorizedLoop]
+    """
+    metadata = {int(m.group(1)): m.group(2)
+                for m in _metadata_re.finditer(str(llmod))}
+
+    def is_vectorized(md_id):
+        refs = re.findall(r'!(\d+)', metadata.get(md_id, ''))
+        return any('"llvm.loop.isvectorized"' in metadata.get(int(ref), '')
+                   for ref in refs)
+
+    result = []
+
+    for func in llmod.functions:
+        for block in func.blocks:
+            instrs = [str(i) for i in block.instructions]
+            if not instrs:
+                continue
+
+            loop_md = _loop_md_re.search(instrs[-1])
+            if not loop_md or not is_vectorized(int(loop_md.group(1))):
+                continue
+
+            widths = [int(w) for i in instrs for w in _vector_ty_re.findall(i)]
+            if widths:
+                result.append(VectorizedLoop(func.name, block.name, max(widths)))
+
+    return result
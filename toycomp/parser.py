@@ -3,7 +3,13 @@ from toycomp.sourceloc import SourceFile, SourceRange
 from .pratt import Token, Grammar, Tokenizer
 from . import ast
 
-grammar = Grammar()
+grammar = Grammar(operators={
+    '=': 2,
+    '<': 10,
+    '+': 20,
+    '-': 20,
+    '*': 40,
+})
 
 
 def _parse_proto(parser):
@@ -15,7 +21,7 @@ def _parse_proto(parser):
 
     if name == 'binary':
         lbp = int(parser.expect(NumberToken).value)
-        OperatorToken.op_lbp[suffix] = lbp
+        parser.operators[suffix] = lbp
 
     parser.expect(LParenToken)
 
@@ -50,11 +56,22 @@ def _parse_proto(parser):
 @grammar.token(r'\bdef\b')
 class DefToken(Token):
     def unary(self, parser):
-        proto = _parse_proto(parser)
-        body = parser.expression()
-        parser.take(OperatorToken(';'))
+        return _parse_def(parser)
+
+
+@grammar.token(r'\bmemo\b')
+class MemoToken(Token):
+    def unary(self, parser):
+        parser.expect(DefToken)
+        return _parse_def(parser, memo=True)
+
 
-        return ast.Function(proto, body)
+def _parse_def(parser, *, memo=False):
+    proto = _parse_proto(parser)
+    body = parser.expression()
+    parser.take(OperatorToken(';'))
+
+    return ast.Function(proto, body, memo=memo)
 
 
 @grammar.token(r'\bextern\b')
@@ -91,24 +108,35 @@ class IfToken(Token):
 @grammar.token(r'\bfor\b')
 class ForToken(Token):
     def unary(self, parser):
-        name = parser.expect(IdentToken).value
-        parser.expect(OperatorToken('='))
+        return _parse_for(parser)
 
-        start = parser.expression()
-        parser.expect(CommaToken)
 
-        end = parser.expression()
+@grammar.token(r'\bparallel\b')
+class ParallelToken(Token):
+    def unary(self, parser):
+        parser.expect(ForToken)
+        return _parse_for(parser, parallel=True)
 
-        if parser.take(CommaToken):
-            step = parser.expression()
-        else:
-            step = ast.NumberExpr(1)
 
-        parser.expect(IdentToken('in'))
+def _parse_for(parser, *, parallel=False):
+    name = parser.expect(IdentToken).value
+    parser.expect(OperatorToken('='))
 
-        body = parser.expression()
+    start = parser.expression()
+    parser.expect(CommaToken)
 
-        return ast.ForExpr(name, start, end, step, body)
+    end = parser.expression()
+
+    if parser.take(CommaToken):
+        step = parser.expression()
+    else:
+        step = ast.NumberExpr(1)
+
+    parser.expect(IdentToken('in'))
+
+    body = parser.expression()
+
+    return ast.ForExpr(name, start, end, step, body, parallel=parallel)
 
 
 @grammar.token(r'\blet\b')
@@ -166,37 +194,56 @@ class RParenToken(Token):
     pass
 
 
+@grammar.token(r'\[')
+class LBracketToken(Token):
+    lbp = 100
+
+    def binary(self, parser, left):
+        index = parser.expression()
+        parser.expect(RBracketToken)
+
+        return ast.IndexExpr(left, index)
+
+
+@grammar.token(r'\]')
+class RBracketToken(Token):
+    pass
+
+
 @grammar.token(r',')
 class CommaToken(Token):
     pass
 
 
-@grammar.token(r'[^\s()a-zA-Z0-9_]+')
+@grammar.token(r'[^\s()\[\]a-zA-Z0-9_]+')
 class OperatorToken(Token):
-    op_lbp = {
-        '=': 2,
-        '<': 10,
-        '+': 20,
-        '-': 20,
-        '*': 40,
-    }
-
-    @property
-    def lbp(self):
-        return self.op_lbp.get(self.value, 0)
+    def left_binding_power(self, parser):
+        return parser.operators.get(self.value, 0)
 
     def binary(self, parser, left):
-        return ast.BinaryExpr(self.value, left, parser.expression(self.lbp))
+        return ast.BinaryExpr(self.value, left,
+                              parser.expression(self.left_binding_power(parser)))
 
     def unary(self, parser):
         # Emit function call
         return ast.CallExpr(ast.VariableExpr('unary' + self.value), [parser.expression()])
 
 
-def parse(program, *, name=None):
+def parse(program, *, name=None, operators=None, compact=False):
+    """
+    :param dict operators: the binary operator precedences to start from,
+        which the parse updates with the operators that `program` defines;
+        defaults to a fresh copy of the built-in ones
+    :param bool compact: tokenize the whole program up front into a
+        `pratt.TokenArray` rather than creating token objects as needed
+    """
+    if operators is None:
+        operators = dict(grammar.operators)
+
     source_file = SourceFile(program, name=name or '<string>')
     t = Tokenizer(grammar)
-    return Parser(t.tokenize(program), file=source_file).parse()
+    tokens = t.tokenize_array(program) if compact else t.tokenize(program)
+    return Parser(tokens, file=source_file, operators=operators).parse()
 
 
 if __name__ == '__main__':
@@ -204,8 +251,9 @@ if __name__ == '__main__':
     print(list(t.tokenize('def foo 123.456 # abcdjd\n'
                           '.456 0.1 1212 .1')))
 
-    p = Parser(t.tokenize('123.456 * abc + 789 * efg'))
+    p = Parser(t.tokenize('123.456 * abc + 789 * efg'), operators=dict(grammar.operators))
     print(p.expression())
 
-    p = Parser(t.tokenize('def foo() 123.456 * abc + 789 * efg def bar() 0'))
+    p = Parser(t.tokenize('def foo() 123.456 * abc + 789 * efg def bar() 0'),
+               operators=dict(grammar.operators))
     print(list(p.parse()))
@@ -0,0 +1,222 @@
+"""
+Tell Linux ``perf`` where JIT-compiled functions are, so that it can
+symbolize samples in them.
+
+Two formats are supported:
+
+* A perf map, ``/tmp/perf-<pid>.map``, lists the address, size and name of
+  each function. ``perf report`` reads it for any process that has one.
+* A jitdump file, ``jit-<pid>.dump``, also holds a copy of each function's
+  machine code, so that ``perf annotate`` can disassemble it. Record with
+  ``perf record -k 1`` and run ``perf inject --jit`` on the result.
+
+The sizes of the functions are read from the symbol table of the object
+file that the execution engine compiled each module to, and their addresses
+are those the engine loaded them at.
+
+Set ``TOYCOMP_PERF_MAP`` to ``1`` to write a perf map from every JIT in the
+process, or to ``jitdump`` to write a jitdump file too.
+"""
+import atexit
+import ctypes
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+
+Symbol = namedtuple('Symbol', ['name', 'section', 'offset', 'size', 'is_global'])
+
+_STT_FUNC = 2
+_STB_LOCAL = 0
+_SHT_SYMTAB = 2
+
+_JITDUMP_MAGIC = 0x4A695444
+_JITDUMP_VERSION = 1
+_JIT_CODE_LOAD = 0
+_JIT_CODE_CLOSE = 3
+
+
+def elf_functions(data):
+    """
+    Get the function symbols that a 64-bit little-endian ELF relocatable
+    object defines. Other objects have none, as far as this is concerned.
+
+    :param bytes data: the object file
+    :rtype: list[Symbol]
+    """
+    if data[:4] != b'\x7fELF' or data[4] != 2 or data[5] != 1:
+        return []
+
+    shoff, = struct.unpack_from('<Q', data, 0x28)
+    shentsize, shnum = struct.unpack_from('<HH', data, 0x3a)
+
+    def section(index):
+        # sh_type, sh_offset, sh_size, sh_link, sh_entsize
+        fields = struct.unpack_from('<IIQQQQIIQQ', data, shoff + index * shentsize)
+        return fields[1], fields[4], fields[5], fields[6], fields[9]
+
+    result = []
+
+    for index in range(shnum):
+        sh_type, offset, size, link, entsize = section(index)
+        if sh_type != _SHT_SYMTAB:
+            continue
+
+        _, strtab, _, _, _ = section(link)
+
+        for pos in range(offset, offset + size, entsize):
+            name, info, _, shndx, value, sym_size = struct.unpack_from('<IBBHQQ', data, pos)
+            if info & 0xf != _STT_FUNC or not 0 < shndx < 0xff00 or not sym_size:
+                continue
+
+            end = data.index(b'\0', strtab + name)
+            result.append(Symbol(data[strtab + name:end].decode('utf-8', 'replace'),
+                                 shndx, value, sym_size, info >> 4 != _STB_LOCAL))
+
+    return result
+
+
+def elf_machine(data):
+    """
+    Get the ``e_machine`` of an ELF object, e.g. 62 for x86-64.
+    """
+    return struct.unpack_from('<H', data, 0x12)[0] if data[:4] == b'\x7fELF' else 0
+
+
+def locate(symbols, resolve):
+    """
+    Find the load addresses of `symbols`.
+
+    Global functions are looked up with `resolve`. Local ones, which the
+    engine doesn't export, are placed relative to a global function in the
+    same section.
+
+    :param list[Symbol] symbols: the functions of one object file
+    :param resolve: maps a global function's name to its address, or 0
+    :returns: ``(address, symbol)`` pairs for the functions that could be
+        located
+    """
+    bases = {}
+    for sym in symbols:
+        if sym.is_global and sym.section not in bases:
+            address = resolve(sym.name)
+            if address:
+                bases[sym.section] = address - sym.offset
+
+    return [(bases[sym.section] + sym.offset, sym) for sym in symbols if sym.section in bases]
+
+
+def _timestamp():
+    # perf uses the monotonic clock for jitdump records by default.
+    return time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+
+class PerfMap:
+    """
+    Writes the functions that a process compiles to its perf map and,
+    optionally, to a jitdump file.
+
+    :param bool jitdump: write a jitdump file too
+    :param str directory: where to write the files
+    """
+    def __init__(self, *, jitdump=False, directory='/tmp'):
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, 'perf-{}.map'.format(self.pid))
+        self.jitdump_path = os.path.join(directory, 'jit-{}.dump'.format(self.pid)) if jitdump else None
+        self._lock = threading.Lock()
+        self._map = None
+        self._dump = None
+        self._marker = None
+        self._code_index = 0
+
+    def __repr__(self):
+        return '<PerfMap {!r}>'.format(self.path)
+
+    def add_object(self, data, resolve):
+        """
+        Record the functions of an object file that has just been loaded.
+
+        :param bytes data: the object file
+        :param resolve: maps a global function's name to its address, or 0
+        """
+        functions = locate(elf_functions(data), resolve)
+        if not functions:
+            return
+
+        with self._lock:
+            if self._map is None:
+                self._map = open(self.path, 'a')
+
+            for address, sym in functions:
+                self._map.write('{:x} {:x} {}\n'.format(address, sym.size, sym.name))
+            self._map.flush()
+
+            if self.jitdump_path:
+                self._write_code_loads(elf_machine(data), functions)
+
+    def _write_code_loads(self, machine, functions):
+        if self._dump is None:
+            header = struct.pack('<IIIIIIQQ', _JITDUMP_MAGIC, _JITDUMP_VERSION, 40,
+                                 machine, 0, self.pid, _timestamp(), 0)
+            dump = open(self.jitdump_path, 'w+b')
+            dump.write(header)
+            dump.flush()
+            # perf finds the file through an executable mapping of it in
+            # the process.
+            self._marker = mmap.mmap(dump.fileno(), len(header), flags=mmap.MAP_PRIVATE,
+                                     prot=mmap.PROT_READ | mmap.PROT_EXEC)
+            self._dump = dump
+
+        tid = threading.get_native_id()
+
+        for address, sym in functions:
+            name = sym.name.encode('utf-8') + b'\0'
+            code = ctypes.string_at(address, sym.size)
+            size = 16 + 40 + len(name) + len(code)
+
+            self._dump.write(struct.pack('<IIQIIQQQQ', _JIT_CODE_LOAD, size, _timestamp(),
+                                         self.pid, tid, address, address, sym.size,
+                                         self._code_index))
+            self._dump.write(name)
+            self._dump.write(code)
+            self._code_index += 1
+
+        self._dump.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+            if self._dump is not None:
+                self._dump.write(struct.pack('<IIQ', _JIT_CODE_CLOSE, 16, _timestamp()))
+                self._dump.close()
+                self._marker.close()
+                self._dump = self._marker = None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default():
+    """
+    Get the process's `PerfMap` if ``TOYCOMP_PERF_MAP`` asks for one.
+
+    :rtype: PerfMap | None
+    """
+    global _default
+
+    setting = os.environ.get('TOYCOMP_PERF_MAP', '')
+    if setting in ('', '0'):
+        return None
+
+    with _default_lock:
+        if _default is None or _default.pid != os.getpid():
+            _default = PerfMap(jitdump=setting == 'jitdump')
+            atexit.register(_default.close)
+
+    return _default
@@ -0,0 +1,167 @@
+"""
+Profile-guided optimization.
+
+A ``--profile-generate`` build gives every function entry and every edge
+out of an `if` test or a `for` loop test its own 64-bit counter. The module
+registers its counters with ``__toycomp_profile_register`` from
+``stdlib/lib.c``, which appends them to ``$TOYCOMP_PROFILE_FILE`` (default:
+``default.kalprof``) when the program exits. Each line of the file holds a
+site name and a count; counts for the same site are summed, so the file can
+collect several training runs.
+
+A ``--profile-use`` build reads those counts back and turns them into branch
+weights, function entry counts and hot/cold function attributes.
+"""
+import collections
+
+from llvmlite import ir
+
+from toycomp import irutil
+
+DEFAULT_PROFILE_FILE = 'default.kalprof'
+
+_i32 = irutil.i32
+_i64 = irutil.i64
+_i8_ptr = irutil.i8_ptr
+
+_max_weight = 2 ** 32 - 1
+
+
+def site_name(function, kind, index):
+    """
+    Name a profiling site, e.g. ``mandelconverger:if0.then``.
+    """
+    return '{}:{}{}'.format(function, kind, index)
+
+
+def entry_site_name(function):
+    return '{}:entry'.format(function)
+
+
+class ProfileGenerator:
+    """
+    Code generator hooks that add counters to the generated code.
+    """
+    def __init__(self):
+        self.counters = collections.OrderedDict()
+
+    def _increment(self, cg, site):
+        counter = self.counters.get(site)
+        if counter is None:
+            counter = ir.GlobalVariable(cg.module, _i64, '__prof.' + site)
+            counter.linkage = 'internal'
+            counter.initializer = ir.Constant(_i64, 0)
+            self.counters[site] = counter
+
+        # Atomic, since the code may run on the threads of a parallel for.
+        cg.builder.atomic_rmw('add', counter, ir.Constant(_i64, 1), 'monotonic')
+
+    def function_entry(self, cg, func):
+        self._increment(cg, entry_site_name(func.name))
+
+    def edge(self, cg, site):
+        self._increment(cg, site)
+
+    def branch(self, cg, instr, true_site, false_site):
+        pass
+
+    def finish(self, module):
+        if not self.counters:
+            return
+
+        names = irutil.string_table(module, '__prof.names', list(self.counters))
+        counters = irutil.pointer_table(module, '__prof.counters', list(self.counters.values()))
+
+        register = ir.Function(module,
+                               ir.FunctionType(ir.VoidType(), [_i8_ptr.as_pointer(),
+                                                               _i64.as_pointer().as_pointer(),
+                                                               _i64]),
+                               '__toycomp_profile_register')
+
+        irutil.add_registration(module, '__prof.init', register,
+                                [irutil.first_element(names),
+                                 irutil.first_element(counters),
+                                 ir.Constant(_i64, len(self.counters))])
+
+
+class ProfileData:
+    def __init__(self, counts=None):
+        self.counts = collections.Counter(counts or {})
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param str path: a profile written by a ``--profile-generate`` build
+        :rtype: ProfileData
+        """
+        counts = collections.Counter()
+
+        with open(path) as f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+
+                site, _, count = line.rpartition(' ')
+                try:
+                    counts[site] += int(count)
+                except ValueError:
+                    raise ValueError('{}:{}: malformed profile line'.format(path, lineno)) from None
+
+        return cls(counts)
+
+    @property
+    def max_function_count(self):
+        return max((n for site, n in self.counts.items() if site.endswith(':entry')), default=0)
+
+
+class ProfileUser:
+    """
+    Code generator hooks that annotate the generated code with profile data.
+
+    :param ProfileData data: the collected counts
+    :param float hot_fraction: functions entered at least this fraction of
+        the most frequently entered function's count are marked hot
+    """
+    def __init__(self, data, *, hot_fraction=0.1):
+        self.data = data
+        self.hot_fraction = hot_fraction
+
+    def function_entry(self, cg, func):
+        site = entry_site_name(func.name)
+        if site not in self.data.counts:
+            return
+
+        count = self.data.counts[site]
+        func.set_metadata('prof', cg.module.add_metadata(['function_entry_count',
+                                                           ir.Constant(_i64, count)]))
+
+        if count == 0:
+            func.attributes.add('cold')
+        elif count >= self.hot_fraction * self.data.max_function_count:
+            func.attributes.add('inlinehint')
+
+    def edge(self, cg, site):
+        pass
+
+    def branch(self, cg, instr, true_site, false_site):
+        counts = self.data.counts
+        if true_site not in counts and false_site not in counts:
+            return
+
+        weights = [counts[true_site], counts[false_site]]
+
+        # Scale down to fit in 32 bits, keeping the ratio.
+        scale = max(weights) / _max_weight
+        if scale > 1:
+            weights = [int(w / scale) for w in weights]
+
+        # LLVM treats a zero weight as "never", so keep some weight on both
+        # sides to stay on the safe side of a stale profile.
+        weights = [min(w + 1, _max_weight) for w in weights]
+
+        instr.set_metadata('prof', cg.module.add_metadata(
+                ['branch_weights'] + [ir.Constant(_i32, w) for w in weights]))
+
+    def finish(self, module):
+        pass
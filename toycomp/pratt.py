@@ -1,12 +1,19 @@
+import array
+import bisect
 import re
 
 from toycomp.sourceloc import SourceRange
 
 
 class Grammar:
-    def __init__(self):
+    def __init__(self, *, operators=None):
+        """
+        :param dict operators: the left binding powers of the built-in
+            binary operators, by operator
+        """
         self.tokens = {}
         self.tokenspec = []
+        self.operators = dict(operators or {})
 
     def token(self, regex):
         def acceptor(klass):
@@ -83,6 +90,9 @@ class Token:
     def __repr__(self):
         return '{}({!r})'.format(type(self).__name__, self.value)
 
+    def left_binding_power(self, parser):
+        return self.lbp
+
     def unary(self, parser):
         parser.error('no null denotation for token {!r}'.format(self.value))
 
@@ -97,6 +107,102 @@ class EndToken(Token):
     pass
 
 
+class IncompleteInputError(SyntaxError):
+    """
+    Raised when the input ends in the middle of an expression, so that an
+    interactive caller can read more input and try again.
+    """
+
+
+class TokenArray:
+    """
+    A compact alternative to a list of `Token` objects.
+
+    Tokens are stored as parallel arrays of kind IDs and of start and end
+    offsets into the source text: 9 bytes per token. Token objects,
+    including their values, are only created when a parser reaches them.
+    The last token is always an `EndToken`.
+
+    :param str text: the source text
+    :param list classes: the token classes, indexed by kind ID
+    """
+    def __init__(self, text, classes):
+        self.text = text
+        self.classes = classes
+        self.kinds = array.array('B')
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+        self.line_starts = array.array('I', [0])
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.kinds)
+
+        start = self.starts[index]
+        klass = self.classes[self.kinds[index]]
+
+        if klass is EndToken:
+            # As in `Tokenizer.tokenize`, the end token sits at the start of
+            # the last token, but on the last line.
+            t = EndToken(None)
+            lineno = len(self.line_starts)
+            offset = start - self.line_starts[bisect.bisect_right(self.line_starts, start) - 1]
+        else:
+            t = klass(self.text[start:self.ends[index]])
+            lineno = bisect.bisect_right(self.line_starts, start)
+            offset = start - self.line_starts[lineno - 1]
+
+        t.lineno = lineno
+        t.offset = offset
+        t.pos = start
+        return t
+
+
+class TokenArrayCursor:
+    """
+    Walks a `TokenArray` with the same interface as `BidirectionalIterator`.
+    """
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._i = 0
+        self._current = tokens[0]
+
+    def current(self):
+        if self._current is None:
+            raise StopIteration
+
+        return self._current
+
+    def next(self):
+        if self._i + 1 >= len(self._tokens):
+            self._i = len(self._tokens)
+            self._current = None
+            raise StopIteration
+
+        self._i += 1
+        self._current = self._tokens[self._i]
+        return self._current
+
+    def prev(self):
+        if self._i == 0:
+            raise StopIteration
+
+        self._i -= 1
+        self._current = self._tokens[self._i]
+        return self._current
+
+    def peek(self):
+        try:
+            self.next()
+        except StopIteration:
+            return None
+
+        return self.current()
+
+
 class Tokenizer:
     def __init__(self, grammar):
         spec = grammar.tokenspec + [
@@ -108,6 +214,44 @@ class Tokenizer:
         self._grammar = grammar
         self._regex = '|'.join('(?P<%s>%s)' % pair for pair in self._spec)
 
+        self._classes = [grammar.tokens[name] for name, _ in grammar.tokenspec] + [EndToken]
+        self._kind_ids = {name: kind for kind, (name, _) in enumerate(grammar.tokenspec)
+                          if not grammar.tokens[name].ignore}
+
+    def tokenize_array(self, text):
+        """
+        Tokenize `text` into a `TokenArray`, which uses far less memory than
+        the token objects that `tokenize` produces.
+
+        :rtype: TokenArray
+        """
+        tokens = TokenArray(text, self._classes)
+        kinds = tokens.kinds
+        starts = tokens.starts
+        ends = tokens.ends
+        kind_ids = self._kind_ids
+        pos = 0
+
+        for mo in re.finditer(self._regex, text, re.MULTILINE):
+            kindname = mo.lastgroup
+            kind = kind_ids.get(kindname)
+
+            if kind is not None:
+                pos = mo.start()
+                kinds.append(kind)
+                starts.append(pos)
+                ends.append(mo.end())
+            elif kindname == 'MISMATCH':
+                raise RuntimeError('Unexpected token %r' % mo.group(kindname))
+
+        tokens.line_starts.extend(mo.end() for mo in re.finditer('\n', text))
+
+        kinds.append(len(self._classes) - 1)
+        starts.append(pos)
+        ends.append(pos)
+
+        return tokens
+
     def tokenize(self, text):
         line_num = 1
         line_start = 0
@@ -132,10 +276,10 @@ class Tokenizer:
                     t.pos = pos
                     yield t
 
-            value_lines = sum(1 for c in value if c == '\n')
+            value_lines = value.count('\n')
             if value_lines != 0:
                 line_num += value_lines
-                line_start += max(i for (i, c) in enumerate(value) if c == '\n') + 1
+                line_start = mo.start() + value.rindex('\n') + 1
 
         et = EndToken(None)
         et.lineno = line_num
@@ -145,9 +289,22 @@ class Tokenizer:
 
 
 class Parser:
-    def __init__(self, tokens, file=None):
+    def __init__(self, tokens, file=None, *, operators):
+        """
+        :param tokens: an iterable of `Token` objects, or a `TokenArray`
+        :param dict operators: the left binding powers of binary operators,
+            by operator, usually a copy of the grammar's built-in ones. The
+            parser adds the operators that the input defines, so several
+            parses can share a table on purpose, but nothing else is shared
+            between parsers.
+        """
         self.file = file
-        self.token_stream = BidirectionalIterator(tokens)
+        self.operators = operators
+
+        if isinstance(tokens, TokenArray):
+            self.token_stream = TokenArrayCursor(tokens)
+        else:
+            self.token_stream = BidirectionalIterator(tokens)
 
     @property
     def pos(self):
@@ -169,12 +326,15 @@ class Parser:
     def expression(self, rbp=0):
         start_pos = self.pos
         t = self.token_stream.current()
+        if isinstance(t, EndToken):
+            self.error('unexpected end of input')
+
         self.token_stream.next()
         left = t.unary(self)
         end_pos = self.pos
         left.source_range = self._make_source_range(start_pos, end_pos)
 
-        while rbp < self.token_stream.current().lbp:
+        while rbp < self.token_stream.current().left_binding_power(self):
             # start_pos = self.pos
             t = self.token_stream.current()
             self.token_stream.next()
@@ -213,7 +373,10 @@ class Parser:
             yield self.expression()
 
     def error(self, msg):
-        se = SyntaxError(msg)
+        if isinstance(self.token_stream.current(), EndToken):
+            se = IncompleteInputError(msg)
+        else:
+            se = SyntaxError(msg)
         se.lineno = self.token_stream.current().lineno
         se.offset = self.token_stream.current().offset
         raise se
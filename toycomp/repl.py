@@ -0,0 +1,203 @@
+"""
+An interactive read-eval-print loop on top of the JIT.
+
+Definitions and `extern` declarations stay visible to later inputs: the
+name resolver and type checker keep their state across the session, and
+each input is compiled into a fresh module that is added to a long-lived
+JIT. A top-level expression is compiled into an anonymous function that
+is called right away and then thrown away, so the work per input doesn't
+grow with the session.
+"""
+import argparse
+import itertools
+import sys
+
+from toycomp import ast, frontend, jit, objcache, parser, types
+from toycomp.diagnostics import DiagnosticsEngine, DiagnosticPrinter, ErrorLimitReached
+from toycomp.pratt import IncompleteInputError
+
+
+class Session:
+    """
+    The state of a REPL session.
+
+    :param int opt_level: the optimization level for each input's module
+    :param str cpu: the target CPU name or ``native``
+    :param str features: the target feature string or ``native``
+    :param diagnostics: the stream to write diagnostics to; defaults to stderr
+    :param toycomp.objcache.ObjectCache cache: where to keep compiled code
+        for later sessions, if anywhere
+    """
+    def __init__(self, *, opt_level=0, cpu=None, features=None, diagnostics=None, cache=None):
+        self._diags = DiagnosticsEngine(DiagnosticPrinter(diagnostics or sys.stderr))
+        self._checker = frontend.Checker(self._diags)
+        self._jit = jit.JIT(cpu=cpu, features=features, opt_level=opt_level, cache=cache)
+        self._operators = dict(parser.grammar.operators)
+        self._anon_names = ('__anon_expr.{}'.format(i) for i in itertools.count())
+
+        jit.add_builtins()
+
+    def evaluate(self, source, *, name='<stdin>'):
+        """
+        Compile and run one input, which may hold several definitions and
+        expressions.
+
+        :returns: the values of the top-level expressions in `source`, or
+            None if some part of it didn't compile
+        :raises IncompleteInputError: if `source` ends in the middle of an
+            expression
+        """
+        # The parser adds the operators that `source` defines to the table
+        # as it goes; note the table before each node.
+        nodes, saved_operators = [], []
+        saved = dict(self._operators)
+        try:
+            for node in parser.parse(source, name=name, operators=self._operators):
+                nodes.append(node)
+                saved_operators.append(saved)
+                saved = dict(self._operators)
+        except SyntaxError:
+            self._operators.clear()
+            self._operators.update(saved_operators[0] if saved_operators else saved)
+            raise
+
+        self._diags.reset()
+        results = []
+
+        for node, operators in zip(nodes, saved_operators):
+            saved_globals = dict(self._checker.resolver.globals)
+
+            try:
+                if isinstance(node, (ast.Function, ast.Prototype)):
+                    ok = self._define(node)
+                else:
+                    ok = self._run(node, results)
+            except ErrorLimitReached:
+                ok = False
+
+            if not ok:
+                # Forget the names and operators the failed definition and
+                # the rest of the input declared, so that it can be corrected
+                # and entered again. Earlier definitions in the same input
+                # have already been added to the JIT.
+                self._checker.resolver.globals.clear()
+                self._checker.resolver.globals.update(saved_globals)
+                self._operators.clear()
+                self._operators.update(operators)
+                self._diags.consumer.finish()
+                return None
+
+        return results
+
+    def _define(self, node):
+        if not self._checker.visit(node):
+            return False
+
+        if isinstance(node, ast.Function):
+            module = self._compile(node)
+            if not module:
+                return False
+
+            self._jit.add_module(module)
+
+        return True
+
+    def _run(self, expr, results):
+        # The rewriter can replace the root of the expression, which the pass
+        # manager wouldn't pass on.
+        expr = self._checker.rewriter.visit(expr)
+        if not self._checker.visit(expr):
+            return False
+
+        proto = ast.Prototype(next(self._anon_names), [])
+        proto.decl_ty = types.function_type(expr.ty, [])
+
+        module = self._compile(ast.Function(proto, expr))
+        if not module:
+            return False
+
+        llmod = self._jit.add_module(module)
+        try:
+            results.append(self._jit.function_of_type(proto.name, proto.decl_ty)())
+        finally:
+            self._jit.remove_module(llmod)
+
+        return True
+
+    def _compile(self, func):
+        cg = self._jit.new_codegen(func.proto.name)
+
+        if not cg.visit(func):
+            return None
+
+        return cg.finish()
+
+
+def _read_input(prompt, stream):
+    if stream.isatty():
+        try:
+            return input(prompt) + '\n'
+        except EOFError:
+            return ''
+
+    return stream.readline()
+
+
+def main(args=None):
+    ap = argparse.ArgumentParser(prog='python -m toycomp.repl')
+    ap.add_argument('--mcpu', metavar='CPU',
+                    help='target CPU name, or "native" for the host CPU')
+    ap.add_argument('--mattr', metavar='FEATURES',
+                    help='comma-separated target features, e.g. "+avx2,-fma", or "native"')
+    ap.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=0,
+                    help='optimization level')
+    ap.add_argument('--load', metavar='LIB', action='append', default=[],
+                    help='make the functions in a shared library available to `extern`')
+    ap.add_argument('--no-cache', dest='cache', action='store_false',
+                    help='compile every input even if the object cache has its code')
+
+    args = ap.parse_args(args)
+
+    for path in args.load:
+        jit.load_library(path)
+
+    session = Session(opt_level=args.opt_level, cpu=args.mcpu, features=args.mattr,
+                      cache=objcache.ObjectCache() if args.cache else None)
+    source = ''
+
+    while True:
+        line = _read_input('... ' if source else 'ready> ', sys.stdin)
+        eof = not line
+
+        source += line
+        if not source.strip():
+            if eof:
+                break
+            source = ''
+            continue
+
+        try:
+            results = session.evaluate(source)
+        except IncompleteInputError as exc:
+            # A blank line or the end of the input gives up on it.
+            if line.strip():
+                continue
+            print('<stdin>:{}:{}: syntax error: {}'.format(exc.lineno, exc.offset, exc.msg),
+                  file=sys.stderr)
+            results = None
+        except SyntaxError as exc:
+            print('<stdin>:{}:{}: syntax error: {}'.format(exc.lineno, exc.offset, exc.msg),
+                  file=sys.stderr)
+            results = None
+
+        source = ''
+
+        for result in results or []:
+            print(result)
+
+        if eof:
+            break
+
+
+if __name__ == '__main__':
+    main()
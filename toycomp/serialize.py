@@ -0,0 +1,391 @@
+"""
+Compact binary serialization of name-resolved, typechecked ASTs.
+
+The format keeps everything that the frontend computes: `VariableExpr.decl`
+links, `ty`/`decl_ty` annotations and source ranges. A file consists of
+a header followed by five tables:
+
+* strings -- every name, operator, file name and source text, interned
+* numbers -- the values of `NumberExpr` nodes
+* types   -- `PrimitiveType`s by name and `FunctionType`s by index
+* files   -- the `SourceFile`s that source ranges refer to
+* nodes   -- one record per node; children precede their parents
+
+The tables are flat arrays of little-endian 32-bit integers (64-bit floats
+for numbers), so loading is mostly a matter of `array.frombytes`. Everything
+after the header is zlib-compressed.
+"""
+import array
+import struct
+import sys
+import zlib
+
+from toycomp import ast, types
+from toycomp.sourceloc import SourceFile, SourceLocation, SourceRange
+
+MAGIC = b'TOYAST\x00'
+VERSION = 5
+
+_header = struct.Struct('<7sH')
+_length = struct.Struct('<I')
+
+# Field kinds
+_STRING = 0
+_NUMBER = 1
+_TYPE = 2
+_NODE = 3
+_OPT_NODE = 4
+_NODES = 5
+_DECL = 6
+_OPT_INT = 7
+_BOOL = 8
+
+_node_fields = [
+    (ast.NumberExpr, [('value', _NUMBER)]),
+    (ast.VariableExpr, [('name', _STRING), ('decl', _DECL), ('slot', _OPT_INT)]),
+    (ast.BinaryExpr, [('op', _STRING), ('lhs', _NODE), ('rhs', _NODE)]),
+    (ast.CallExpr, [('func', _NODE), ('args', _NODES)]),
+    (ast.IfExpr, [('test', _NODE), ('true', _NODE), ('false', _NODE)]),
+    (ast.ForExpr, [('name', _STRING), ('start', _NODE), ('end', _NODE),
+                   ('step', _NODE), ('body', _NODE), ('decl_ty', _TYPE),
+                   ('slot', _OPT_INT), ('parallel', _BOOL)]),
+    (ast.LetExpr, [('name', _STRING), ('init', _NODE), ('body', _NODE),
+                   ('decl_ty', _TYPE), ('slot', _OPT_INT)]),
+    (ast.Prototype, [('name', _STRING), ('params', _NODES),
+                     ('result_typename', _OPT_NODE), ('decl_ty', _TYPE), ('pure', _BOOL)]),
+    (ast.FormalParamDecl, [('name', _STRING), ('typename', _OPT_NODE),
+                           ('decl_ty', _TYPE), ('slot', _OPT_INT)]),
+    (ast.Function, [('proto', _NODE), ('body', _NODE), ('slot_count', _OPT_INT),
+                    ('memo', _BOOL)]),
+    (ast.TypeDecl, [('name', _STRING)]),
+    (ast.Undeclared, []),
+    (ast.IndexExpr, [('target', _NODE), ('index', _NODE)]),
+]
+
+_kind_for_class = {klass: kind for kind, (klass, _) in enumerate(_node_fields)}
+
+_TYPE_PRIMITIVE = 0
+_TYPE_FUNCTION = 1
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _int_array(values=()):
+    return array.array('i', values)
+
+
+def _to_bytes(arr):
+    if sys.byteorder == 'big':
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(typecode, data):
+    arr = array.array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+class _Writer:
+    def __init__(self):
+        self.strings = {}
+        self.numbers = array.array('d')
+        self.types = {}
+        self.type_data = _int_array()
+        self.files = {}
+        self.file_data = _int_array()
+        self.node_index = {}
+        self.node_data = _int_array()
+        self.decl_fixups = []
+
+    def string(self, s):
+        try:
+            return self.strings[s]
+        except KeyError:
+            index = self.strings[s] = len(self.strings)
+            return index
+
+    def type(self, ty):
+        if ty is None:
+            return -1
+
+        try:
+            return self.types[id(ty)][0]
+        except KeyError:
+            pass
+
+        if isinstance(ty, types.FunctionType):
+            params = [self.type(p) for p in ty.params]
+            record = [_TYPE_FUNCTION, self.type(ty.result), len(params)] + params
+        elif isinstance(ty, types.PrimitiveType):
+            record = [_TYPE_PRIMITIVE, self.string(ty.name)]
+        else:
+            raise TypeError('cannot serialize type {!r}'.format(ty))
+
+        index = len(self.types)
+        self.types[id(ty)] = index, ty
+        self.type_data.extend(record)
+        return index
+
+    def file(self, source_file):
+        try:
+            return self.files[id(source_file)][0]
+        except KeyError:
+            pass
+
+        index = len(self.files)
+        self.files[id(source_file)] = index, source_file
+        self.file_data.extend([self.string(source_file.name or ''),
+                               self.string(''.join(source_file.lines))])
+        return index
+
+    def node(self, node):
+        try:
+            return self.node_index[id(node)]
+        except KeyError:
+            pass
+
+        try:
+            kind = _kind_for_class[type(node)]
+        except KeyError:
+            raise TypeError('cannot serialize node {!r}'.format(type(node).__name__)) from None
+
+        # Children first, so that they get lower indices than their parents.
+        record = [kind, self.type(getattr(node, 'ty', None))]
+
+        source_range = getattr(node, 'source_range', None)
+        if source_range:
+            (file, line1, col1), (_, line2, col2) = source_range
+            record.extend([self.file(file), line1, col1, line2, col2])
+        else:
+            record.append(-1)
+
+        decls = []
+        for name, field_kind in _node_fields[kind][1]:
+            value = getattr(node, name)
+            if field_kind == _STRING:
+                record.append(self.string(value))
+            elif field_kind == _NUMBER:
+                record.append(len(self.numbers))
+                self.numbers.append(value)
+            elif field_kind == _TYPE:
+                record.append(self.type(value))
+            elif field_kind == _NODE:
+                record.append(self.node(value))
+            elif field_kind == _OPT_NODE:
+                record.append(self.node(value) if value is not None else -1)
+            elif field_kind == _NODES:
+                record.append(len(value))
+                record.extend([self.node(v) for v in value])
+            elif field_kind == _DECL:
+                decls.append((len(record), value))
+                record.append(-1)
+            elif field_kind == _OPT_INT:
+                record.append(value if value is not None else -1)
+            elif field_kind == _BOOL:
+                record.append(int(value))
+
+        index = self.node_index[id(node)] = len(self.node_index)
+        offset = len(self.node_data)
+        self.node_data.extend(record)
+
+        for pos, decl in decls:
+            if decl is not None:
+                self.decl_fixups.append((offset + pos, decl))
+
+        return index
+
+    def finish(self, roots):
+        root_data = _int_array([self.node(r) for r in roots])
+
+        # Declarations outside of `roots` (e.g. the built-in type names) are
+        # appended after the tree nodes.
+        while self.decl_fixups:
+            fixups, self.decl_fixups = self.decl_fixups, []
+            for pos, decl in fixups:
+                self.node_data[pos] = self.node(decl)
+
+        string_data = [s.encode('utf-8') for s in self.strings]
+        string_lengths = _int_array([len(s) for s in string_data])
+
+        sections = [
+            _to_bytes(string_lengths),
+            b''.join(string_data),
+            _to_bytes(self.numbers),
+            _to_bytes(self.type_data),
+            _to_bytes(self.file_data),
+            _to_bytes(self.node_data),
+            _to_bytes(root_data),
+        ]
+
+        parts = []
+        for section in sections:
+            parts.append(_length.pack(len(section)))
+            parts.append(section)
+
+        return _header.pack(MAGIC, VERSION) + zlib.compress(b''.join(parts))
+
+
+def dumps(exprs):
+    """
+    Serialize a sequence of checked top-level expressions.
+
+    :rtype: bytes
+    """
+    exprs = list(exprs)
+    return _Writer().finish(exprs)
+
+
+def dump(exprs, fp):
+    """
+    Serialize a sequence of checked top-level expressions to a binary file.
+    """
+    fp.write(dumps(exprs))
+
+
+def _read_sections(data):
+    if len(data) < _header.size:
+        raise FormatError('truncated header')
+
+    magic, version = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise FormatError('not a toycomp AST file')
+    if version != VERSION:
+        raise FormatError('unsupported AST file version {}'.format(version))
+
+    try:
+        data = zlib.decompress(memoryview(data)[_header.size:])
+    except zlib.error as exc:
+        raise FormatError('corrupt AST file: {}'.format(exc)) from None
+
+    offset = 0
+    sections = []
+    while offset < len(data):
+        (length,) = _length.unpack_from(data, offset)
+        offset += _length.size
+        sections.append(data[offset:offset + length])
+        offset += length
+
+    if len(sections) != 7 or offset != len(data):
+        raise FormatError('malformed AST file')
+
+    return sections
+
+
+def _load_types(data, strings):
+    result = []
+    i = 0
+    while i < len(data):
+        kind = data[i]
+        if kind == _TYPE_PRIMITIVE:
+            name = strings[data[i + 1]]
+            try:
+                result.append(types.context.primitive(name))
+            except KeyError:
+                raise FormatError('unknown primitive type {!r}'.format(name)) from None
+            i += 2
+        elif kind == _TYPE_FUNCTION:
+            count = data[i + 2]
+            result.append(types.function_type(result[data[i + 1]],
+                                              [result[t] for t in data[i + 3:i + 3 + count]]))
+            i += 3 + count
+        else:
+            raise FormatError('unknown type kind {}'.format(kind))
+
+    return result
+
+
+def loads(data):
+    """
+    Deserialize top-level expressions produced by `dumps`.
+
+    :rtype: list[toycomp.ast.AST]
+    """
+    (string_lengths, string_blob, number_data, type_data,
+     file_data, node_data, root_data) = _read_sections(bytes(data))
+
+    strings = []
+    pos = 0
+    for length in _from_bytes('i', string_lengths):
+        strings.append(string_blob[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    numbers = _from_bytes('d', number_data).tolist()
+    tys = _load_types(_from_bytes('i', type_data).tolist(), strings)
+    tys.append(None)  # index -1
+
+    file_ints = _from_bytes('i', file_data).tolist()
+    files = [SourceFile(strings[file_ints[i + 1]], name=strings[file_ints[i]])
+             for i in range(0, len(file_ints), 2)]
+
+    nodes = []
+    decl_fixups = []
+    data = _from_bytes('i', node_data).tolist()
+    i = 0
+    end = len(data)
+
+    while i < end:
+        kind = data[i]
+        klass, fields = _node_fields[kind]
+        node = klass.__new__(klass)
+        attrs = node.__dict__
+
+        ty = data[i + 1]
+        if ty != -1:
+            attrs['ty'] = tys[ty]
+
+        file = data[i + 2]
+        if file != -1:
+            f = files[file]
+            attrs['source_range'] = SourceRange(SourceLocation(f, data[i + 3], data[i + 4]),
+                                                SourceLocation(f, data[i + 5], data[i + 6]))
+            i += 7
+        else:
+            i += 3
+
+        for name, field_kind in fields:
+            value = data[i]
+            i += 1
+            if field_kind == _STRING:
+                attrs[name] = strings[value]
+            elif field_kind == _NODE:
+                attrs[name] = nodes[value]
+            elif field_kind == _TYPE:
+                attrs[name] = tys[value]
+            elif field_kind == _OPT_NODE:
+                attrs[name] = nodes[value] if value != -1 else None
+            elif field_kind == _NODES:
+                attrs[name] = [nodes[n] for n in data[i:i + value]]
+                i += value
+            elif field_kind == _NUMBER:
+                attrs[name] = numbers[value]
+            elif field_kind == _DECL:
+                if value != -1:
+                    decl_fixups.append((attrs, value))
+            elif field_kind == _OPT_INT:
+                if value != -1:
+                    attrs[name] = value
+            elif field_kind == _BOOL:
+                attrs[name] = bool(value)
+
+        if kind == _kind_for_class[ast.Prototype]:
+            attrs['args'] = [p.name for p in attrs['params']]
+
+        nodes.append(node)
+
+    for attrs, decl in decl_fixups:
+        attrs['decl'] = nodes[decl]
+
+    return [nodes[r] for r in _from_bytes('i', root_data)]
+
+
+def load(fp):
+    """
+    Deserialize top-level expressions from a binary file produced by `dump`.
+    """
+    return loads(fp.read())
@@ -0,0 +1,182 @@
+"""
+Resource statistics for a compilation, to find out which phase or function
+makes a build slow or large.
+
+`CompileStats` records, for each phase, the time it took and the peak
+memory it used; the number of AST nodes of each class; what the name
+resolver resolved; the size of each function's IR before and after
+optimization; and the size of the output. The report is either text for
+people or JSON for tools, see `CompileStats.to_json`.
+
+Python's peak memory is measured with `tracemalloc`, which must be started
+before compiling and slows the compiler down. LLVM allocates outside
+Python's heap, so each phase also records the process's peak resident set
+size so far.
+"""
+import collections
+import contextlib
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+from toycomp import ast
+
+# The version of the JSON format; bump it on incompatible changes.
+FORMAT = 1
+
+
+class _NodeCounter(ast.ASTRewriter):
+    def __init__(self, counts):
+        self.counts = counts
+
+    def visit(self, node):
+        self.counts[type(node).__name__] += 1
+        return super().visit(node)
+
+
+def _max_rss():
+    # ru_maxrss is in KiB on Linux but in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def ir_size(func):
+    """
+    Count the basic blocks and instructions of a function.
+
+    :type func: llvmlite.ir.Function | llvmlite.binding.ValueRef
+    :returns: a dict with ``blocks`` and ``instructions``
+    """
+    blocks = instructions = 0
+    for block in func.blocks:
+        blocks += 1
+        instructions += sum(1 for _ in block.instructions)
+
+    return {'blocks': blocks, 'instructions': instructions}
+
+
+class CompileStats:
+    """
+    Collects statistics while the driver compiles.
+    """
+    def __init__(self):
+        self.phases = []
+        self.ast_nodes = collections.Counter()
+        self.name_resolution = collections.Counter()
+        self.functions = collections.defaultdict(dict)
+        self.outputs = []
+
+    @contextlib.contextmanager
+    def phase(self, name, *, unit=None):
+        """
+        Measure the time and memory that the body of the ``with`` statement
+        uses for phase `name` of compiling `unit`.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                'phase': name,
+                'unit': unit,
+                'seconds': time.perf_counter() - start,
+                'python_peak_bytes': None,
+                'max_rss_bytes': _max_rss(),
+            }
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                record['python_peak_bytes'] = peak - base
+
+            self.phases.append(record)
+
+    def count_nodes(self, nodes):
+        """
+        Count the AST nodes under the top-level `nodes` by class.
+        """
+        counter = _NodeCounter(self.ast_nodes)
+        for node in nodes:
+            counter.visit(node)
+
+    def count_names(self, resolver):
+        """
+        Add up what `resolver` declared and resolved.
+
+        :type resolver: toycomp.nameres.NameResolver
+        """
+        self.name_resolution['declarations'] += resolver.declarations
+        self.name_resolution['references'] += resolver.references
+
+    def measure_functions(self, module, stage):
+        """
+        Record the size of each function defined in `module` at `stage`,
+        ``before`` or ``after`` optimization.
+
+        :type module: llvmlite.ir.Module | llvmlite.binding.ModuleRef
+        """
+        for func in module.functions:
+            if not func.is_declaration:
+                self.functions[func.name][stage] = ir_size(func)
+
+    def measure_output(self, path, fmt, object_bytes):
+        """
+        Record an output file of format `fmt`, and the size of the object
+        code it holds or compiles to.
+        """
+        self.outputs.append({'path': path, 'format': fmt, 'object_bytes': object_bytes})
+
+    def to_json(self):
+        """
+        :returns: the statistics as JSON-serializable data
+        :rtype: dict
+        """
+        return {
+            'version': FORMAT,
+            'phases': self.phases,
+            'ast_nodes': dict(sorted(self.ast_nodes.items())),
+            'name_resolution': dict(self.name_resolution),
+            'functions': {name: dict(stages) for name, stages in sorted(self.functions.items())},
+            'outputs': self.outputs,
+        }
+
+    def write(self, stream, *, fmt='text'):
+        """
+        Write the report to `stream` as ``text`` or ``json``.
+        """
+        if fmt == 'json':
+            json.dump(self.to_json(), stream, indent=2)
+            stream.write('\n')
+            return
+
+        stream.write('{:<14} {:<24} {:>10} {:>16} {:>14}\n'.format(
+            'phase', 'unit', 'time (ms)', 'py peak (KiB)', 'max RSS (MiB)'))
+        for p in self.phases:
+            peak = p['python_peak_bytes']
+            stream.write('{:<14} {:<24} {:>10.1f} {:>16} {:>14.1f}\n'.format(
+                p['phase'], p['unit'] or '-', p['seconds'] * 1000,
+                '-' if peak is None else '{:.1f}'.format(peak / 2 ** 10),
+                p['max_rss_bytes'] / 2 ** 20))
+
+        stream.write('\nAST nodes: {}\n'.format(sum(self.ast_nodes.values())))
+        for name, count in self.ast_nodes.most_common():
+            stream.write('  {:<22} {:>8}\n'.format(name, count))
+
+        stream.write('\nname resolution: {} declarations, {} references\n'.format(
+            self.name_resolution['declarations'], self.name_resolution['references']))
+
+        stream.write('\n{:<32} {:>14} {:>14}\n'.format('function', 'blocks', 'instructions'))
+        for name, stages in sorted(self.functions.items()):
+            stream.write('  {:<30} {:>14} {:>14}\n'.format(
+                name,
+                ' -> '.join(str(s['blocks']) for s in stages.values()),
+                ' -> '.join(str(s['instructions']) for s in stages.values())))
+
+        for output in self.outputs:
+            stream.write('\noutput {path} ({format}): {object_bytes} bytes of object code\n'
+                         .format(**output))
@@ -0,0 +1,76 @@
+import llvmlite.binding as llvm
+
+_initialized = False
+
+
+def initialize():
+    global _initialized
+
+    if not _initialized:
+        llvm.initialize_all_targets()
+        llvm.initialize_all_asmprinters()
+        _initialized = True
+
+
+def host_cpu(cpu):
+    """
+    Resolve a ``--mcpu`` value, expanding ``native`` to the host CPU name.
+    """
+    if cpu == 'native':
+        return llvm.get_host_cpu_name()
+
+    return cpu or ''
+
+
+def host_features(features):
+    """
+    Resolve a ``--mattr`` value, expanding ``native`` to the host feature string.
+
+    ``native`` may be combined with explicit overrides, e.g. ``native,-avx512f``.
+    """
+    if not features:
+        return ''
+
+    result = []
+    for feature in features.split(','):
+        if feature == 'native':
+            result.append(llvm.get_host_cpu_features().flatten())
+        elif feature:
+            result.append(feature)
+
+    return ','.join(result)
+
+
+def create_target_machine(triple=None, *, cpu=None, features=None, opt_level=2, jit=False):
+    """
+    :param str triple: the target triple; defaults to the process triple
+    :param str cpu: the target CPU name or ``native``
+    :param str features: the target feature string or ``native``
+    :param int opt_level: the code generation optimization level
+    :param bool jit: create a machine for in-process JIT compilation rather
+        than for emitting position-independent object files
+    :rtype: llvmlite.binding.TargetMachine
+    """
+    initialize()
+
+    target = llvm.Target.from_triple(triple or llvm.get_process_triple())
+
+    if jit:
+        reloc, codemodel = 'default', 'jitdefault'
+    else:
+        reloc, codemodel = 'pic', 'default'
+
+    return target.create_target_machine(cpu=host_cpu(cpu),
+                                        features=host_features(features),
+                                        opt=opt_level,
+                                        reloc=reloc,
+                                        codemodel=codemodel,
+                                        jit=jit)
+
+
+def configure_module(module, target_machine):
+    """
+    Set the triple and data layout of an `ir.Module` from a target machine.
+    """
+    module.triple = target_machine.triple
+    module.data_layout = str(target_machine.target_data)
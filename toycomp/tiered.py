@@ -0,0 +1,492 @@
+"""
+Tiered execution: start in an interpreter, JIT-compile what gets hot.
+
+Each function of a checked program is first turned into a tree of Python
+closures, one per AST node, that run against a frame list indexed by the
+name resolver's slots. This costs little more than a walk over the AST, so
+a program starts running right away.
+
+Every function counts its calls and the back-edges taken by its loops.
+When either count reaches its threshold, the function and all the
+functions it can reach that are still interpreted are handed to a
+background thread. It generates LLVM IR for them with `Codegen`, adds the
+module to the JIT and then swaps the native code in. Calls always go
+through the callee's `FunctionEntry`, so the next call from interpreted
+code runs natively; native code calls native code directly.
+
+There is no on-stack replacement: an activation that is already running
+in the interpreter finishes there, but the calls it makes pick up native
+code as it becomes available.
+
+The interpreter recurses in Python for every call; deeply recursive
+programs may need a higher `sys.setrecursionlimit` (the command line entry
+point raises it).
+"""
+import argparse
+import collections
+import concurrent.futures
+import ctypes
+import math
+import operator
+import sys
+import threading
+
+import llvmlite.binding as llvm
+
+from toycomp import ast, jit, objcache
+from toycomp.codegen import MEMO_CAPACITY
+
+DEFAULT_CALL_THRESHOLD = 1000
+DEFAULT_BACKEDGE_THRESHOLD = 10000
+
+MODES = ('tiered', 'interpret', 'jit')
+
+# FunctionEntry states
+INTERPRETED = 'interpreted'
+QUEUED = 'queued'
+NATIVE = 'native'
+EXTERN = 'extern'
+UNDEFINED = 'undefined'  # an extern that no loaded library defines
+
+
+class ExecutionError(Exception):
+    pass
+
+
+_buffer_ptr = ctypes.POINTER(jit.Buffer)
+
+
+def _element(buffer, index):
+    """
+    Check an index into a buffer, which is a `jit.Buffer` when it was
+    passed in by Python and a pointer to one when it came from native code.
+    """
+    if isinstance(buffer, _buffer_ptr):
+        buffer = buffer.contents
+
+    # int() can't convert NaN or an infinity.
+    if not math.isfinite(index):
+        raise ExecutionError('buffer index {} out of bounds for length {}'.format(index, buffer.length))
+
+    i = int(index)
+    if not 0 <= i < buffer.length:
+        raise ExecutionError('buffer index {} out of bounds for length {}'.format(i, buffer.length))
+
+    return buffer.data, i
+
+
+class FunctionEntry:
+    """
+    A function's current implementation and its execution counters.
+
+    :param str name: the function's name
+    :param toycomp.types.FunctionType ty: the function's type
+    :param toycomp.ast.Function node: the definition, or None for an
+        `extern` declaration
+    """
+    def __init__(self, name, ty, node=None):
+        self.name = name
+        self.ty = ty
+        self.node = node
+        self.calls = 0
+        self.backedges = 0
+        self.state = INTERPRETED if node else EXTERN
+        self.callees = set()
+        self.impl = self._undefined
+
+    def _undefined(self, *args):
+        raise ExecutionError('call to undefined function {!r}'.format(self.name))
+
+    def __repr__(self):
+        return '<FunctionEntry {!r} {}>'.format(self.name, self.state)
+
+
+class _Interpreter(ast.ASTVisitor):
+    """
+    Turns a checked function into a Python callable.
+
+    Every expression becomes a closure that takes the function's frame,
+    the list of its locals indexed by slot, and returns the value of the
+    expression.
+    """
+    def __init__(self, engine, entry):
+        self._engine = engine
+        self._entry = entry
+
+    def function(self):
+        node = self._entry.node
+        body = self.visit(node.body)
+        padding = [None] * (node.slot_count - len(node.proto.params))
+        entry = self._entry
+        promote = self._engine.promote
+        threshold = self._engine.call_threshold
+
+        def run(*args):
+            entry.calls += 1
+            if entry.calls == threshold:
+                promote(entry)
+
+            return body([*args, *padding])
+
+        if node.memo:
+            return self._memoize(run)
+
+        return run
+
+    @staticmethod
+    def _memoize(run):
+        # Like the compiled code's cache, of a fixed size; this one evicts
+        # the oldest entry.
+        cache = collections.OrderedDict()
+
+        def memo_run(*args):
+            result = cache.get(args)
+            if result is None:
+                result = cache[args] = run(*args)
+                if len(cache) > MEMO_CAPACITY:
+                    cache.popitem(last=False)
+
+            return result
+
+        return memo_run
+
+    def visit_NumberExpr(self, expr):
+        value = expr.value
+        return lambda frame: value
+
+    def visit_VariableExpr(self, expr):
+        if expr.slot is None:
+            raise ExecutionError('{!r} is not a local variable'.format(expr.name))
+
+        return operator.itemgetter(expr.slot)
+
+    def visit_BinaryExpr(self, expr):
+        rhs = self.visit(expr.rhs)
+
+        if expr.op == '=' and isinstance(expr.lhs, ast.IndexExpr):
+            target = self.visit(expr.lhs.target)
+            index = self.visit(expr.lhs.index)
+
+            def store(frame):
+                data, i = _element(target(frame), index(frame))
+                value = data[i] = rhs(frame)
+                return value
+
+            return store
+
+        if expr.op == '=':
+            slot = expr.lhs.slot
+
+            def assign(frame):
+                value = frame[slot] = rhs(frame)
+                return value
+
+            return assign
+
+        lhs = self.visit(expr.lhs)
+
+        if expr.op == '+':
+            return lambda frame: lhs(frame) + rhs(frame)
+        elif expr.op == '-':
+            return lambda frame: lhs(frame) - rhs(frame)
+        elif expr.op == '*':
+            return lambda frame: lhs(frame) * rhs(frame)
+        elif expr.op == '<':
+            # Unordered, like the code generator's comparison: NaN < x is true.
+            return lambda frame: 0.0 if lhs(frame) >= rhs(frame) else 1.0
+
+        raise ExecutionError('invalid binary operator {!r}'.format(expr.op))
+
+    def visit_IndexExpr(self, expr):
+        target = self.visit(expr.target)
+        index = self.visit(expr.index)
+
+        def load(frame):
+            data, i = _element(target(frame), index(frame))
+            return data[i]
+
+        return load
+
+    def visit_IfExpr(self, expr):
+        test = self.visit(expr.test)
+        true = self.visit(expr.true)
+        false = self.visit(expr.false)
+
+        def if_(frame):
+            value = test(frame)
+            # Ordered, like the code generator's comparison: NaN is false.
+            if value < 0.0 or value > 0.0:
+                return true(frame)
+            return false(frame)
+
+        return if_
+
+    def visit_ForExpr(self, expr):
+        slot = expr.slot
+        start = self.visit(expr.start)
+        end = self.visit(expr.end)
+        step = self.visit(expr.step)
+        body = self.visit(expr.body)
+        entry = self._entry
+        promote = self._engine.promote
+        threshold = self._engine.backedge_threshold
+
+        def for_(frame):
+            frame[slot] = start(frame)
+
+            while not end(frame) == 0.0:
+                body(frame)
+                frame[slot] = frame[slot] + step(frame)
+
+                entry.backedges += 1
+                if entry.backedges == threshold:
+                    promote(entry)
+
+            return 0.0
+
+        return for_
+
+    def visit_LetExpr(self, expr):
+        slot = expr.slot
+        init = self.visit(expr.init)
+        body = self.visit(expr.body)
+
+        def let(frame):
+            frame[slot] = init(frame)
+            return body(frame)
+
+        return let
+
+    def visit_CallExpr(self, expr):
+        if not isinstance(expr.func, ast.VariableExpr) or \
+                not isinstance(expr.func.decl, ast.Prototype):
+            raise ExecutionError('only named functions can be called')
+
+        callee = self._engine.entry(expr.func.decl.name)
+        self._entry.callees.add(callee)
+        args = [self.visit(arg) for arg in expr.args]
+
+        if not args:
+            return lambda frame: callee.impl()
+        elif len(args) == 1:
+            [arg0] = args
+            return lambda frame: callee.impl(arg0(frame))
+        elif len(args) == 2:
+            arg0, arg1 = args
+            return lambda frame: callee.impl(arg0(frame), arg1(frame))
+
+        return lambda frame: callee.impl(*[arg(frame) for arg in args])
+
+    def visit_Prototype(self, stmt):
+        # Not used; see `function`.
+        raise NotImplementedError
+
+    def visit_Function(self, stmt):
+        raise NotImplementedError
+
+    def visit_FormalParamDecl(self, decl):
+        raise NotImplementedError
+
+
+class TieredEngine:
+    """
+    Runs checked programs, interpreting functions until they get hot.
+
+    :param str mode: ``tiered``; ``interpret`` to never compile; or ``jit``
+        to compile every function before running anything
+    :param int call_threshold: the number of calls after which a function
+        is compiled
+    :param int backedge_threshold: the number of loop iterations after
+        which the function running the loop is compiled
+    :param int opt_level: the optimization level for compiled code
+    :param toycomp.objcache.ObjectCache cache: where to keep compiled code
+        for later runs, if anywhere
+    """
+    def __init__(self, *, mode='tiered', call_threshold=DEFAULT_CALL_THRESHOLD,
+                 backedge_threshold=DEFAULT_BACKEDGE_THRESHOLD, opt_level=2,
+                 cpu=None, features=None, cache=None):
+        if mode not in MODES:
+            raise ValueError('unknown mode {!r}'.format(mode))
+
+        self.mode = mode
+        self.call_threshold = call_threshold if mode == 'tiered' else None
+        self.backedge_threshold = backedge_threshold if mode == 'tiered' else None
+        self._entries = {}
+        self._jit_options = dict(cpu=cpu, features=features, opt_level=opt_level, cache=cache)
+        self._jit = None  # created on first use, so that interpreting costs nothing extra
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+        jit.add_builtins()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def entry(self, name):
+        """
+        :rtype: FunctionEntry
+        """
+        return self._entries[name]
+
+    @property
+    def entries(self):
+        return list(self._entries.values())
+
+    def load(self, nodes):
+        """
+        Make the functions defined and declared by checked top-level `nodes`
+        available to `call`.
+        """
+        functions = []
+
+        for node in nodes:
+            if isinstance(node, ast.Function):
+                entry = FunctionEntry(node.proto.name, node.proto.decl_ty, node)
+                self._entries[entry.name] = entry
+                functions.append(entry)
+            elif isinstance(node, ast.Prototype):
+                if node.name not in self._entries:
+                    self._entries[node.name] = self._extern(node)
+            else:
+                raise ExecutionError('top-level expressions are not supported; '
+                                     'call a function instead')
+
+            # Later definitions can only call functions that are already
+            # loaded, so compile each one now.
+            if isinstance(node, ast.Function):
+                entry.impl = _Interpreter(self, entry).function()
+
+        if self.mode == 'jit' and functions:
+            self._compile(functions)
+
+    def _extern(self, proto):
+        entry = FunctionEntry(proto.name, proto.decl_ty)
+
+        address = llvm.address_of_symbol(proto.name)
+        if address:
+            entry.impl = jit.ctypes_function(address, proto.decl_ty)
+        else:
+            entry.state = UNDEFINED
+
+        return entry
+
+    def call(self, name, *args):
+        """
+        Call the function `name`, in whichever tier it currently runs.
+        """
+        return self.entry(name).impl(*args)
+
+    def promote(self, entry):
+        """
+        Queue `entry` and every interpreted function that it can reach for
+        compilation in the background.
+        """
+        with self._lock:
+            if entry.state is not INTERPRETED:
+                return
+
+            batch = []
+            seen = {entry}
+            stack = [entry]
+
+            while stack:
+                e = stack.pop()
+                if e.state is UNDEFINED:
+                    # The JIT couldn't resolve it either.
+                    return
+
+                if e.state is INTERPRETED:
+                    batch.append(e)
+                    stack.extend(c for c in e.callees if c not in seen)
+                    seen.update(e.callees)
+
+            for e in batch:
+                e.state = QUEUED
+
+            self._pending.append(self._executor.submit(self._compile, batch))
+
+    def _compile(self, batch):
+        try:
+            if self._jit is None:
+                self._jit = jit.JIT(**self._jit_options)
+
+            cg = self._jit.new_codegen(batch[0].name)
+
+            for entry in batch:
+                if not cg.visit(entry.node):
+                    raise ExecutionError('cannot compile {!r}'.format(entry.name))
+
+            self._jit.add_module(cg.finish())
+            natives = [self._jit.function_of_type(e.name, e.ty) for e in batch]
+        except Exception:
+            for entry in batch:
+                entry.state = INTERPRETED
+            raise
+
+        for entry, native in zip(batch, natives):
+            entry.impl = native
+            entry.state = NATIVE
+
+    def wait(self):
+        """
+        Wait for the functions queued so far to be compiled.
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+
+def main(args=None):
+    from toycomp.driver import Driver
+
+    ap = argparse.ArgumentParser(prog='python -m toycomp.tiered')
+    ap.add_argument('source', help='.kal source file')
+    ap.add_argument('--entry', default='mainf', metavar='NAME',
+                    help='the function to run (default: mainf)')
+    ap.add_argument('--mode', choices=MODES, default='tiered',
+                    help='interpret and compile hot functions (default), only interpret, '
+                         'or compile everything up front')
+    ap.add_argument('--call-threshold', metavar='N', type=int, default=DEFAULT_CALL_THRESHOLD,
+                    help='compile a function after N calls')
+    ap.add_argument('--backedge-threshold', metavar='N', type=int,
+                    default=DEFAULT_BACKEDGE_THRESHOLD,
+                    help='compile a function after its loops run N iterations')
+    ap.add_argument('-O', dest='opt_level', type=int, choices=range(4), default=2,
+                    help='optimization level for compiled functions')
+    ap.add_argument('--no-cache', dest='cache', action='store_false',
+                    help='compile functions even if the object cache has their code')
+    ap.add_argument('--stats', action='store_true',
+                    help='report the final tier and counters of each function')
+
+    args = ap.parse_args(args)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    with open(args.source) as f:
+        nodes = Driver(None).check(f.read(), name=args.source)
+
+    with TieredEngine(mode=args.mode,
+                      call_threshold=args.call_threshold,
+                      backedge_threshold=args.backedge_threshold,
+                      opt_level=args.opt_level,
+                      cache=objcache.ObjectCache() if args.cache else None) as engine:
+        engine.load(nodes)
+        result = engine.call(args.entry)
+
+        if args.stats:
+            for entry in engine.entries:
+                print('{:<24} {:<12} {:>12} calls {:>12} back-edges'
+                      .format(entry.name, entry.state, entry.calls, entry.backedges),
+                      file=sys.stderr)
+
+    return int(result)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,54 @@ from . import ast, compilepass, nameres, types
 from .translation import *
 
 
+class _OuterAssignments(ast.ASTRewriter):
+    """
+    Finds the assignments in an expression to variables declared outside it.
+    """
+    def __init__(self):
+        self.inner = set()
+        self.found = []
+
+    def visit_LetExpr(self, expr):
+        self.inner.add(expr)
+        return super().visit_LetExpr(expr)
+
+    def visit_ForExpr(self, expr):
+        self.inner.add(expr)
+        return super().visit_ForExpr(expr)
+
+    def visit_BinaryExpr(self, expr):
+        if expr.op == '=' and isinstance(expr.lhs, ast.VariableExpr) and \
+                expr.lhs.decl not in self.inner:
+            self.found.append(expr)
+        return super().visit_BinaryExpr(expr)
+
+
+class _Impurities(ast.ASTRewriter):
+    """
+    Finds what keeps a function from being pure: reading or writing buffers,
+    which are shared memory, and calling functions that aren't known to be
+    pure. Assigning to its own local variables is fine.
+    """
+    def __init__(self, proto):
+        self.proto = proto
+        self.found = []
+
+    def visit_IndexExpr(self, expr):
+        self.found.append((expr, tr('it accesses a buffer')))
+        return super().visit_IndexExpr(expr)
+
+    def visit_CallExpr(self, expr):
+        callee = expr.func.decl if isinstance(expr.func, ast.VariableExpr) else None
+
+        if not isinstance(callee, ast.Prototype):
+            self.found.append((expr, tr('it calls a function value')))
+        elif callee is not self.proto and not callee.pure:
+            self.found.append((expr, tr('it calls {!r}, which is not pure').format(callee.name)))
+
+        return super().visit_CallExpr(expr)
+
+
 class Typechecker(ast.ASTVisitor, compilepass.Pass):
     dependencies = (nameres.NameResolver,)
 
@@ -43,8 +91,8 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
         else:
             result_typename = proto.result_typename.decl.ty
 
-        proto.decl_ty = types.FunctionType(result_typename,
-                                           [param.decl_ty for param in proto.params])
+        proto.decl_ty = types.function_type(result_typename,
+                                            [param.decl_ty for param in proto.params])
 
         return ok
 
@@ -52,14 +100,41 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
         proto_ok = self.visit_Prototype(func.proto)
         body_ok = self.visit(func.body)
 
-        if func.body.ty != func.proto.decl_ty.result:
+        if func.body.ty is not func.proto.decl_ty.result:
             self.emit_error(tr('function declared to return {decl} actually returns {actual}')
                             .format(decl=func.proto.decl_ty.result,
                                     actual=func.body.ty),
                             node=func)
             return None
 
-        return body_ok and proto_ok
+        impurities = _Impurities(func.proto)
+        impurities.visit(func.body)
+        func.proto.pure = not impurities.found
+
+        memo_ok = not func.memo or self.check_memo(func, impurities.found)
+
+        return body_ok and proto_ok and memo_ok
+
+    def check_memo(self, func, impurities):
+        """
+        A memoized function's result is looked up by its argument values, so
+        it must be pure and take and return only doubles.
+        """
+        ok = True
+        ty = func.proto.decl_ty
+
+        if ty.result is not types.double_ty or any(p is not types.double_ty for p in ty.params):
+            self.emit_error(tr('memo function {!r} must take and return only double values')
+                            .format(func.proto.name),
+                            node=func)
+            ok = False
+
+        for node, reason in impurities:
+            self.emit_error(tr('memo function {!r} is not pure: {}').format(func.proto.name, reason),
+                            node=node)
+            ok = False
+
+        return ok
 
     def visit_ForExpr(self, expr):
         start_ok = self.visit(expr.start)
@@ -69,14 +144,33 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
         end_ok = self.visit(expr.end)
         step_ok = self.visit(expr.step)
         body_ok = self.visit(expr.body)
+        parallel_ok = not expr.parallel or self.check_parallel(expr)
 
         return all([
             start_ok,
             end_ok,
             step_ok,
-            body_ok
+            body_ok,
+            parallel_ok
         ])
 
+    def check_parallel(self, expr):
+        """
+        The iterations of a parallel loop run concurrently, so they must not
+        assign to variables that are declared outside the loop body, including
+        the loop variable.
+        """
+        outer = _OuterAssignments()
+        for part in [expr.end, expr.step, expr.body]:
+            outer.visit(part)
+
+        for assign in outer.found:
+            self.emit_error(tr('parallel loop cannot assign to {!r}, which is declared outside '
+                               'its body').format(assign.lhs.name),
+                            node=assign)
+
+        return not outer.found
+
     def visit_VariableExpr(self, expr):
         if not expr.decl or not expr.decl.decl_ty:
             return False
@@ -89,9 +183,12 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
         right_ok = self.visit(expr.rhs)
         ok = left_ok and right_ok
 
-        if expr.lhs.ty != expr.rhs.ty:
+        if expr.lhs.ty is not expr.rhs.ty:
             self.emit_error(tr('LHS and RHS of infix operator expression must have same type'), node=expr)
             ok = False
+        elif expr.op != '=' and expr.lhs.ty is types.buffer_ty:
+            self.emit_error(tr('operator {!r} cannot be applied to buffers').format(expr.op), node=expr)
+            ok = False
 
         expr.ty = expr.lhs.ty
 
@@ -107,14 +204,14 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
 
     def visit_IfExpr(self, expr):
         test_ok = self.visit(expr.test)
-        if expr.test.ty != types.double_ty:
+        if expr.test.ty is not types.double_ty:
             self.emit_error(tr('test expression of `if` must have type double'), node=expr.test)
             test_ok = False
 
         true_ok = self.visit(expr.true)
         false_ok = self.visit(expr.false)
 
-        if expr.true.ty != expr.false.ty:
+        if expr.true.ty is not expr.false.ty:
             self.emit_error(tr('true and false branches of `if` must have same result type'), node=expr)
             return False
 
@@ -140,7 +237,7 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
             actuals_ok = False
 
         for param_ty, arg in zip(expr.func.ty.params, expr.args):
-            if param_ty != arg.ty:
+            if param_ty is not arg.ty:
                 self.emit_error(
                         tr('parameter type does not match argument type: expected {exp}, got {act}.')
                         .format(exp=param_ty, act=arg.ty),
@@ -151,6 +248,22 @@ class Typechecker(ast.ASTVisitor, compilepass.Pass):
 
         return func_ok and args_ok and actuals_ok
 
+    def visit_IndexExpr(self, expr):
+        target_ok = self.visit(expr.target)
+        index_ok = self.visit(expr.index)
+        expr.ty = types.double_ty
+
+        if target_ok and expr.target.ty is not types.buffer_ty:
+            self.emit_error(tr('only buffers can be indexed, not {}').format(expr.target.ty),
+                            node=expr.target)
+            target_ok = False
+
+        if index_ok and expr.index.ty is not types.double_ty:
+            self.emit_error(tr('index must have type double'), node=expr.index)
+            index_ok = False
+
+        return target_ok and index_ok
+
     def visit_NumberExpr(self, expr):
         expr.ty = types.double_ty
         return True
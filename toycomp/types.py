@@ -1,3 +1,9 @@
+"""
+Types are interned: a `TypeContext` creates each distinct type once, so two
+types are equal exactly when they are the same object, and comparing or
+hashing them is O(1). Create function types with `function_type` (or
+`TypeContext.function`) rather than by calling `FunctionType` directly.
+"""
 from llvmlite import ir
 from toycomp import autorepr
 
@@ -19,19 +25,81 @@ class PrimitiveType:
 class FunctionType:
     def __init__(self, result, params):
         self.result = result
-        self.params = params
+        self.params = tuple(params)
+        self._llvm_ty = None
 
     def __str__(self):
         return '({}) -> {}'.format(', '.join(map(str, self.params)), self.result)
 
     def __repr__(self):
-        return 'FunctionType({!r}, {!r})'.format(self.result, self.params)
+        return 'FunctionType({!r}, {!r})'.format(self.result, list(self.params))
 
     @property
     def llvm_ty(self):
-        return ir.FunctionType(self.result.llvm_ty,
-                               [t.llvm_ty for t in self.params])
+        if self._llvm_ty is None:
+            self._llvm_ty = ir.FunctionType(self.result.llvm_ty,
+                                            [t.llvm_ty for t in self.params])
 
+        return self._llvm_ty
 
-double_ty = PrimitiveType('double', ir.DoubleType())
-int_ty = PrimitiveType('int', ir.IntType(32))
+
+class TypeContext:
+    """
+    Hash-conses types, so that structurally equal types are identical.
+
+    Types from different contexts must not be mixed.
+    """
+    def __init__(self):
+        self._primitives = {}
+        self._functions = {}
+
+    def primitive(self, name, llvm_ty=None):
+        """
+        Get the primitive type called `name`, creating it with `llvm_ty` if
+        it doesn't exist yet.
+
+        :raises KeyError: if there is no such type and `llvm_ty` is None
+        """
+        ty = self._primitives.get(name)
+        if ty is None:
+            if llvm_ty is None:
+                raise KeyError(name)
+
+            ty = self._primitives.setdefault(name, PrimitiveType(name, llvm_ty))
+
+        return ty
+
+    def function(self, result, params):
+        """
+        Get the type of functions taking `params` and returning `result`.
+
+        :type result: PrimitiveType | FunctionType
+        :type params: list[PrimitiveType | FunctionType]
+        :rtype: FunctionType
+        """
+        # The component types are interned, so they can be keyed by identity.
+        key = (result,) + tuple(params)
+
+        ty = self._functions.get(key)
+        if ty is None:
+            ty = self._functions.setdefault(key, FunctionType(result, params))
+
+        return ty
+
+
+context = TypeContext()
+
+double_ty = context.primitive('double', ir.DoubleType())
+int_ty = context.primitive('int', ir.IntType(32))
+
+# A pointer to a descriptor of an array of doubles, laid out like
+# `struct toycomp_buffer` in stdlib/buffer.c: {double *data; int64_t length}.
+buffer_ty = context.primitive('buffer', ir.LiteralStructType([ir.DoubleType().as_pointer(),
+                                                              ir.IntType(64)]).as_pointer())
+
+
+def function_type(result, params):
+    """
+    Get the interned function type from the default context.
+    """
+    return context.function(result, params)